@@ -3,6 +3,7 @@ import glob
 import mimetypes
 
 from django.apps import AppConfig
+from django.db.models.signals import post_save
 
 from mako.lookup import TemplateLookup
 from framework.routing import process_rules
@@ -169,3 +170,16 @@ class BaseAddonAppConfig(AppConfig):
         # Set up Flask routes
         for route_group in self.routes:
             process_rules(app, **route_group)
+
+        # Drop the node's cached WaterButler config whenever its settings are saved
+        try:
+            node_settings = self.node_settings
+        except LookupError:
+            node_settings = None
+        if node_settings is not None:
+            from addons.base.models import invalidate_node_waterbutler_config
+            post_save.connect(
+                invalidate_node_waterbutler_config,
+                sender=node_settings,
+                dispatch_uid='{}.invalidate_node_waterbutler_config'.format(self.label),
+            )
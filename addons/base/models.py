@@ -1,11 +1,15 @@
 import abc
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 import markupsafe
 import requests
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.functional import cached_property
 from framework.auth import Auth
 from framework.auth.decorators import must_be_logged_in
 from framework.exceptions import HTTPError, PermissionsError
@@ -18,6 +22,7 @@ from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 from osf.utils.fields import NonNaiveDateTimeField
 from website import settings
 from addons.base import logger, serializer
+from addons.base.utils import invalidate_waterbutler_config
 from website.oauth.signals import oauth_complete
 
 lookup = TemplateLookup(
@@ -564,6 +569,10 @@ class BaseStorageAddon(object):
             name = name + ': {folder}'.format(folder=folder_name)
         return name
 
+    @cached_property
+    def _waterbutler_base_url(self):
+        return self.owner.osfstorage_region.waterbutler_url
+
     def _get_fileobj_child_metadata(self, filenode, user, cookie=None, version=None):
         from api.base.utils import waterbutler_api_url_for
 
@@ -582,11 +591,11 @@ class BaseStorageAddon(object):
             user=user,
             view_only=True,
             _internal=True,
-            base_url=self.owner.osfstorage_region.waterbutler_url,
+            base_url=self._waterbutler_base_url,
             **kwargs
         )
 
-        res = requests.get(metadata_url)
+        res = get_waterbutler_session().get(metadata_url)
 
         if res.status_code != 200:
             raise HTTPError(res.status_code, data={'error': res.json()})
@@ -599,27 +608,68 @@ class BaseStorageAddon(object):
             return [child['attributes'] for child in data]
         return []
 
-    def _get_file_tree(self, filenode=None, user=None, cookie=None, version=None):
+    def _get_file_tree(self, filenode=None, user=None, cookie=None, version=None, listings=None, on_listed=None):
         """
-        Recursively get file metadata
+        Get file metadata for the whole tree, listing up to ARCHIVE_CRAWL_CONCURRENCY folders at once
+
+        :param dict listings: children of folders that were already listed, e.g. by an earlier attempt,
+            keyed by path. These folders are not requested again.
+        :param on_listed: called with the path and children of each folder as it is listed
         """
-        filenode = filenode or {
+        root = filenode or {
             'path': '/',
             'kind': 'folder',
             'name': self.root_node.name,
         }
-        if filenode.get('kind') == 'file':
-            return filenode
-
-        kwargs = {
-            'version': version,
-            'cookie': cookie,
-        }
-        filenode['children'] = [
-            self._get_file_tree(child, user, cookie=cookie)
-            for child in self._get_fileobj_child_metadata(filenode, user, **kwargs)
-        ]
-        return filenode
+        if root.get('kind') == 'file':
+            return root
+
+        listings = listings or {}
+        if not cookie and user:
+            cookie = user.get_or_create_cookie().decode()
+        # Resolve anything that needs the database before the listing threads start
+        self._waterbutler_base_url
+
+        folders = [root]
+        in_progress = {}
+
+        def add_children(folder, children):
+            folder['children'] = [dict(child) for child in children]
+            folders.extend(child for child in folder['children'] if child.get('kind') != 'file')
+
+        with ThreadPoolExecutor(max_workers=settings.ARCHIVE_CRAWL_CONCURRENCY) as executor:
+            while folders or in_progress:
+                while folders and len(in_progress) < settings.ARCHIVE_CRAWL_CONCURRENCY:
+                    folder = folders.pop()
+                    if folder['path'] in listings:
+                        add_children(folder, listings[folder['path']])
+                        continue
+                    # Only the root listing is versioned
+                    kwargs = {'cookie': cookie, 'version': version if folder is root else None}
+                    in_progress[executor.submit(self._get_fileobj_child_metadata, folder, user, **kwargs)] = folder
+                if not in_progress:
+                    continue
+                done, _ = wait(in_progress, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folder = in_progress.pop(future)
+                    children = future.result()
+                    if on_listed:
+                        on_listed(folder['path'], children)
+                    add_children(folder, children)
+        return root
+
+
+_waterbutler_session = None
+
+def get_waterbutler_session():
+    """Return the HTTP session, pooled across file tree listings, for WaterButler metadata requests"""
+    global _waterbutler_session
+    if _waterbutler_session is None:
+        _waterbutler_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.ARCHIVE_CRAWL_CONCURRENCY)
+        _waterbutler_session.mount('http://', adapter)
+        _waterbutler_session.mount('https://', adapter)
+    return _waterbutler_session
 
 
 class BaseOAuthNodeSettings(BaseNodeSettings):
@@ -949,3 +999,15 @@ class BaseCitationsNodeSettings(BaseOAuthNodeSettings):
 
     def on_delete(self):
         self.deauthorize(add_log=False)
+
+
+# Connected for each addon's node settings in BaseAddonAppConfig.ready
+def invalidate_node_waterbutler_config(sender, instance, **kwargs):
+    if instance.owner_id:
+        invalidate_waterbutler_config(instance.owner._id)
+
+
+@receiver(post_save, sender=ExternalAccount)
+def invalidate_all_waterbutler_config(sender, instance, **kwargs):
+    # Accounts don't know which nodes they are connected to, and refreshed tokens are rare
+    invalidate_waterbutler_config()
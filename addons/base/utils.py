@@ -1,7 +1,12 @@
 import markupsafe
+import uuid
 from os.path import basename
 from website.settings import MFR_SERVER_URL
 
+from api.caching.utils import (
+    waterbutler_config_cache, waterbutler_config_generation_cache,
+    WATERBUTLER_CONFIG_KEY, WATERBUTLER_CONFIG_GENERATION_KEY,
+)
 from website import settings
 
 
@@ -10,6 +15,59 @@ def get_mfr_url(target, provider_name):
         return target.osfstorage_region.mfr_url
     return MFR_SERVER_URL
 
+def get_waterbutler_config_generation(node_id):
+    """Return the current generation of a node's cached WaterButler configs.
+
+    Configs are cached in process memory, so they are invalidated by changing the node's
+    generation, or the generation of every node, in a cache shared by all processes.
+    """
+    keys = [
+        WATERBUTLER_CONFIG_GENERATION_KEY.format(node_id=node_id),
+        WATERBUTLER_CONFIG_GENERATION_KEY.format(node_id='*'),
+    ]
+    generations = waterbutler_config_generation_cache.get_many(keys)
+    if len(generations) < len(keys):
+        # A generation that was never set, or was culled, starts a new one
+        for key in keys:
+            if key not in generations:
+                waterbutler_config_generation_cache.add(key, uuid.uuid4().hex, None)
+        generations = waterbutler_config_generation_cache.get_many(keys)
+    return ':'.join(generations.get(key, '') for key in keys)
+
+def get_waterbutler_config(node, provider_name):
+    """Return the serialized WaterButler credentials and settings of a node's addon, or None if
+    the node does not have the addon.
+
+    The result is cached per (node, provider) for WATERBUTLER_CONFIG_CACHE_TIMEOUT seconds, under
+    the node's current generation; see `invalidate_waterbutler_config`.
+    """
+    generation = get_waterbutler_config_generation(node._id)
+    key = WATERBUTLER_CONFIG_KEY.format(node_id=node._id, provider=provider_name, generation=generation)
+    config = waterbutler_config_cache.get(key)
+    if config is not None:
+        return config
+
+    node_settings = node.get_addon(provider_name)
+    if not node_settings:
+        return None
+    credentials = node_settings.serialize_waterbutler_credentials()
+    if isinstance(credentials.get('token'), bytes):
+        credentials['token'] = credentials.get('token').decode()
+    config = {
+        'credentials': credentials,
+        'settings': node_settings.serialize_waterbutler_settings(),
+        # osfstorage versions live in their own region, and are serialized against the root folder
+        'root_id': node_settings.root_node._id if provider_name == 'osfstorage' else None,
+    }
+    if settings.WATERBUTLER_CONFIG_CACHE_TIMEOUT:
+        waterbutler_config_cache.set(key, config, settings.WATERBUTLER_CONFIG_CACHE_TIMEOUT)
+    return config
+
+def invalidate_waterbutler_config(node_id=None):
+    """Drop the cached WaterButler configs of a node, or of every node, in every process"""
+    key = WATERBUTLER_CONFIG_GENERATION_KEY.format(node_id=node_id or '*')
+    waterbutler_config_generation_cache.set(key, uuid.uuid4().hex, None)
+
 def serialize_addon_config(config, user):
     lookup = config.template_lookup
 
@@ -23,6 +23,7 @@ from api.base.settings.defaults import SLOAN_ID_COOKIE_NAME
 from addons.base.models import BaseStorageAddon
 from addons.osfstorage.models import OsfStorageFile
 from addons.osfstorage.models import OsfStorageFileNode
+from addons.osfstorage.listeners import mark_file_versions_seen_task
 from addons.osfstorage.utils import update_analytics
 
 from framework import sentry
@@ -33,16 +34,17 @@ from framework.auth.decorators import collect_auth, must_be_logged_in, must_be_s
 from framework.exceptions import HTTPError
 from framework.sentry import log_exception
 from framework.routing import json_renderer, proxy_url
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
 from framework.transactions.handlers import no_auto_transaction
 from website import mails
 from website import settings
 from addons.base import signals as file_signals
-from addons.base.utils import format_last_known_metadata, get_mfr_url
+from addons.base.utils import format_last_known_metadata, get_mfr_url, get_waterbutler_config
 from osf import features
 from osf.models import (BaseFileNode, TrashedFileNode, BaseFileVersionsThrough,
                         OSFUser, AbstractNode, Preprint,
                         NodeLog, DraftRegistration,
-                        Guid, FileVersionUserMetadata, FileVersion)
+                        Guid)
 from osf.metrics import PreprintView, PreprintDownload
 from osf.utils import permissions
 from website.profile.utils import get_profile_image_url
@@ -250,6 +252,28 @@ def get_metric_class_for_action(action, from_mfr):
     return metric_class
 
 
+def get_osfstorage_file_version(file_id, version=None):
+    """Load an osfstorage file together with one of its versions, defaulting to the most recent,
+    in a single query. Returns (None, None) if `file_id` is not a file (e.g. a folder).
+
+    :raises: HTTPError(400) if the file exists but does not have the requested version
+    """
+    versions = BaseFileVersionsThrough.objects.filter(
+        basefilenode___id=file_id,
+        basefilenode__type=OsfStorageFile._typedmodels_type,
+    ).select_related('basefilenode', 'fileversion__region')
+    if version:
+        versions = versions.filter(fileversion__identifier=version)
+    else:
+        versions = versions.order_by('-fileversion__created', '-fileversion__id')
+    through = versions.first()
+    if through:
+        return through.basefilenode, through.fileversion
+    if OsfStorageFile.objects.filter(_id=file_id).exists():
+        raise HTTPError(http_status.HTTP_400_BAD_REQUEST)
+    return None, None
+
+
 @collect_auth
 def get_auth(auth, **kwargs):
     cas_resp = None
@@ -296,10 +320,10 @@ def get_auth(auth, **kwargs):
         raise HTTPError(http_status.HTTP_404_NOT_FOUND)
 
     check_access(node, auth, action, cas_resp)
-    provider_settings = None
+    waterbutler_config = None
     if hasattr(node, 'get_addon'):
-        provider_settings = node.get_addon(provider_name)
-        if not provider_settings:
+        waterbutler_config = get_waterbutler_config(node, provider_name)
+        if not waterbutler_config:
             raise HTTPError(http_status.HTTP_400_BAD_REQUEST)
 
     path = data.get('path')
@@ -308,22 +332,16 @@ def get_auth(auth, **kwargs):
     fileversion = None
     if provider_name == 'osfstorage':
         if path:
-            file_id = path.strip('/')
             # check to see if this is a file or a folder
-            filenode = OsfStorageFileNode.load(path.strip('/'))
-            if filenode and filenode.is_file:
-                # default to most recent version if none is provided in the response
-                version = int(data['version']) if data.get('version') else filenode.versions.count()
-                try:
-                    fileversion = FileVersion.objects.filter(
-                        basefilenode___id=file_id,
-                        identifier=version
-                    ).select_related('region').get()
-                except FileVersion.DoesNotExist:
-                    raise HTTPError(http_status.HTTP_400_BAD_REQUEST)
+            filenode, fileversion = get_osfstorage_file_version(
+                path.strip('/'),
+                int(data['version']) if data.get('version') else None,
+            )
+            if filenode:
+                version = int(fileversion.identifier)
                 if auth.user:
                     # mark fileversion as seen
-                    FileVersionUserMetadata.objects.get_or_create(user=auth.user, file_version=fileversion)
+                    enqueue_postcommit_task(mark_file_versions_seen_task, (auth.user.id, [fileversion.id]), {}, celery=True)
                 if not node.is_contributor_or_group_member(auth.user):
                     from_mfr = download_is_from_mfr(request, payload=data)
                     # version index is 0 based
@@ -352,17 +370,21 @@ def get_auth(auth, **kwargs):
                                     )
                                 except es_exceptions.ConnectionError:
                                     log_exception()
-        if fileversion and provider_settings:
+        if fileversion and waterbutler_config:
             region = fileversion.region
             credentials = region.waterbutler_credentials
             waterbutler_settings = fileversion.serialize_waterbutler_settings(
-                node_id=provider_settings.owner._id,
-                root_id=provider_settings.root_node._id,
+                node_id=node._id,
+                root_id=waterbutler_config['root_id'],
             )
     # If they haven't been set by version region, use the NodeSettings or Preprint directly
     if not (credentials and waterbutler_settings):
-        credentials = node.serialize_waterbutler_credentials(provider_name)
-        waterbutler_settings = node.serialize_waterbutler_settings(provider_name)
+        if waterbutler_config:
+            credentials = waterbutler_config['credentials']
+            waterbutler_settings = waterbutler_config['settings']
+        else:
+            credentials = node.serialize_waterbutler_credentials(provider_name)
+            waterbutler_settings = node.serialize_waterbutler_settings(provider_name)
 
     if isinstance(credentials.get('token'), bytes):
         credentials['token'] = credentials.get('token').decode()
@@ -34,6 +34,12 @@ def checkin_files_task(node_id, user_id):
             node.files.filter(checkout=user).update(checkout=None)
 
 
+@app.task(max_retries=5, default_retry_delay=60)
+def mark_file_versions_seen_task(user_id, file_version_ids):
+    FileVersionUserMetadata = apps.get_model('osf.FileVersionUserMetadata')
+    FileVersionUserMetadata.mark_seen(user_id, file_version_ids)
+
+
 @node_deleted.connect
 def delete_files(node):
     enqueue_postcommit_task(delete_files_task, (node._id, ), {}, celery=True)
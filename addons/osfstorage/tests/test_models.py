@@ -8,6 +8,7 @@ import pytz
 from django.utils import timezone
 from nose.tools import *  # noqa
 
+from api.caching.tasks import reconcile_storage_usage
 from framework.auth import Auth
 from addons.osfstorage.models import OsfStorageFile, OsfStorageFileNode, OsfStorageFolder
 from osf.models import BaseFileNode
@@ -290,6 +291,30 @@ class TestOsfstorageFileNode(StorageTestCase):
 
         assert_is(OsfStorageFileNode.load(child._id), None)
 
+    def test_storage_usage_updated_by_delta(self):
+        child = self.node_settings.get_root().append_file('Test')
+        child.add_version(factories.FileVersionFactory(size=123))
+        assert_equal(models.NodeStorageUsage.objects.get(node=self.project).total, 123)
+
+        child.add_version(factories.FileVersionFactory(size=7))
+        assert_equal(models.NodeStorageUsage.objects.get(node=self.project).total, 130)
+
+        child.delete()
+        assert_equal(models.NodeStorageUsage.objects.get(node=self.project).total, 0)
+
+        models.TrashedFileNode.load(child._id).restore()
+        assert_equal(models.NodeStorageUsage.objects.get(node=self.project).total, 130)
+
+    def test_reconcile_storage_usage(self):
+        child = self.node_settings.get_root().append_file('Test')
+        child.add_version(factories.FileVersionFactory(size=123))
+        models.NodeStorageUsage.objects.filter(node=self.project).update(total=1)
+
+        reconcile_storage_usage()
+
+        assert_equal(models.NodeStorageUsage.objects.get(node=self.project).total, 123)
+        assert_equal(self.project.storage_usage, 123)
+
     @mock.patch('addons.osfstorage.listeners.enqueue_postcommit_task')
     def test_file_deleted_when_node_deleted(self, mock_enqueue):
         child = self.node_settings.get_root().append_file('Test')
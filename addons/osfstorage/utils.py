@@ -8,7 +8,7 @@ import functools
 
 from osf.exceptions import ValidationValueError
 from framework.exceptions import HTTPError
-from framework.analytics import update_counter
+from framework.analytics import update_counters
 
 from addons.osfstorage import settings
 
@@ -36,8 +36,7 @@ def update_analytics(node, file, version_idx, action='download'):
     }
     resource = node.guids.first()
 
-    update_counter(resource, file, version=None, action=action, node_info=node_info)
-    update_counter(resource, file, version_idx, action, node_info=node_info)
+    update_counters(resource, file, [None, version_idx], action, node_info=node_info)
 
 
 def serialize_revision(node, record, version, index, anon=False):
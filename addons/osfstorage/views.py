@@ -123,9 +123,7 @@ def osfstorage_get_revisions(file_node, payload, target, **kwargs):
 
 @decorators.waterbutler_opt_hook
 def osfstorage_copy_hook(source, destination, name=None, **kwargs):
-    ret = source.copy_under(destination, name=name).serialize(), http_status.HTTP_201_CREATED
-    update_storage_usage(destination.target)
-    return ret
+    return source.copy_under(destination, name=name).serialize(), http_status.HTTP_201_CREATED
 
 @decorators.waterbutler_opt_hook
 def osfstorage_move_hook(source, destination, name=None, **kwargs):
@@ -339,12 +337,7 @@ def osfstorage_create_child(file_node, payload, **kwargs):
         except KeyError:
             raise HTTPError(http_status.HTTP_400_BAD_REQUEST)
 
-        current_version = file_node.get_version()
         new_version = file_node.create_version(user, location, metadata)
-
-        if not current_version or not current_version.is_duplicate(new_version):
-            update_storage_usage(file_node.target)
-
         version_id = new_version._id
         archive_exists = new_version.archive is not None
     else:
@@ -382,7 +375,6 @@ def osfstorage_delete(file_node, payload, target, **kwargs):
             'message_long': 'Cannot delete file as it is the primary file of preprint.'
         })
 
-    update_storage_usage(file_node.target)
     return {'status': 'success'}
 
 
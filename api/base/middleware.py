@@ -28,6 +28,7 @@ from waffle.middleware import WaffleMiddleware
 from waffle.models import Flag
 
 from website.settings import DOMAIN
+from osf.db.router import allow_replica_reads, REPLICA_SAFE_ATTR
 from osf.models import (
     Preprint,
     PreprintProvider,
@@ -101,6 +102,15 @@ class DjangoGlobalMiddleware(MiddlewareMixin):
         return response
 
 
+class DatabaseRoutingMiddleware(MiddlewareMixin):
+    """
+    Let GET requests to replica-safe views read from a database replica; see osf.db.router.
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, REPLICA_SAFE_ATTR, False):
+            allow_replica_reads(request)
+
+
 class CorsMiddleware(corsheaders.middleware.CorsMiddleware):
     """
     Augment CORS origin white list with the Institution model's domains.
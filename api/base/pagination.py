@@ -1,8 +1,16 @@
+import base64
+import hashlib
+import json
+
 from django.utils import six
-from collections import OrderedDict
+from collections import defaultdict, OrderedDict
 from django.urls import reverse
-from django.core.paginator import InvalidPage, Paginator as DjangoPaginator
-from django.db.models import QuerySet
+from django.conf import settings as django_settings
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, InvalidPage, Page, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import QuerySet, Q
+from django.utils.functional import cached_property
 
 from rest_framework import pagination
 from rest_framework.exceptions import NotFound
@@ -10,14 +18,252 @@ from rest_framework.response import Response
 from rest_framework.utils.urls import (
     replace_query_param, remove_query_param,
 )
+from api.base.exceptions import InvalidQueryStringError
 from api.base.serializers import is_anonymized
 from api.base.settings import MAX_PAGE_SIZE
-from api.base.utils import absolute_reverse
+from api.base.utils import absolute_reverse, is_falsy
+from api.caching.utils import pagination_count_cache, PAGINATION_COUNT_KEY
 
-from osf.models import AbstractNode, Comment, Preprint, Guid, DraftRegistration
+from osf.models import AbstractNode, BaseFileNode, Comment, Preprint, Guid, DraftRegistration, OSFUser
+from osf.models.base import GuidMixin
 from website.search.elastic_search import DOC_TYPE_TO_MODEL
 
 
+class EstimatedPage(Page):
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super(EstimatedPage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountingPaginator(DjangoPaginator):
+    """
+    Paginator that avoids recounting large querysets.
+
+    Exact counts are cached per query for PAGINATION_COUNT_CACHE_TIMEOUT seconds. For models in
+    `estimate_count_models`, the Postgres planner's row estimate is used instead of COUNT(*)
+    when it is at least PAGINATION_COUNT_ESTIMATE_THRESHOLD; `count_is_estimate` is then True,
+    and pages are sliced without relying on the total. A page that runs out of results, or
+    comes back empty because the estimate was too high, replaces the estimate with the real total.
+    """
+    estimate_count_models = (AbstractNode, OSFUser, BaseFileNode)
+
+    count_is_estimate = False
+    cache_key = None
+
+    def get_query_hash(self):
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        return hashlib.sha256('{}|{}|{}'.format(self.object_list.db, sql, params).encode('utf-8')).hexdigest()
+
+    def get_estimated_count(self):
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = self.object_list.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, six.string_types):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super(CountingPaginator, self).count
+
+        query_hash = self.get_query_hash()
+        if query_hash is None:
+            return 0
+        self.cache_key = PAGINATION_COUNT_KEY.format(query_hash=query_hash)
+        cached = pagination_count_cache.get(self.cache_key)
+        if cached is not None:
+            count, self.count_is_estimate = cached
+            return count
+
+        count = None
+        if issubclass(self.object_list.model, self.estimate_count_models):
+            estimate = self.get_estimated_count()
+            if estimate is not None and estimate >= django_settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+                count, self.count_is_estimate = estimate, True
+        if count is None:
+            count = self.object_list.count()
+        pagination_count_cache.set(self.cache_key, (count, self.count_is_estimate), django_settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def use_exact_count(self, count=None):
+        if count is None:
+            count = self.object_list.count()
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+        self.count_is_estimate = False
+        if self.cache_key:
+            pagination_count_cache.set(self.cache_key, (count, False), django_settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+
+    def validate_number(self, number):
+        try:
+            return super(CountingPaginator, self).validate_number(number)
+        except EmptyPage:
+            if not self.count_is_estimate:
+                raise
+            # The estimate may be too low; only an exact count can rule the page out
+            self.use_exact_count()
+            return super(CountingPaginator, self).validate_number(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimate:
+            return super(CountingPaginator, self).page(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            # The estimate was too high and this page is past the end; count to 404 or to
+            # page the real results
+            self.use_exact_count()
+            return self.page(number)
+        has_next = len(object_list) > self.per_page
+        if not has_next:
+            # The last page gives the exact total, so `last` and `total` point at the real end
+            self.use_exact_count(bottom + len(object_list))
+        return EstimatedPage(object_list[:self.per_page], number, self, has_next=has_next)
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset by the values of its ordering fields instead of by offset, so that
+    fetching a page costs the same however deep into the results it is.
+
+    Cursors are opaque strings holding the ordering values of the item a page starts after
+    (or, when paging backwards, before). The queryset's primary key is added to its ordering
+    to make it total. Ordering fields must be non-nullable fields of the model itself.
+    """
+
+    def __init__(self, queryset, per_page, count_total=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_total = count_total
+        self.ordering = self.get_ordering(queryset)
+
+    @staticmethod
+    def get_ordering(queryset):
+        """Returns a list of (field, descending) for the queryset's ordering, ending with the pk"""
+        opts = queryset.model._meta
+        ordering = []
+        for order in (queryset.query.order_by or opts.ordering):
+            if not isinstance(order, six.string_types) or order == '?':
+                raise InvalidQueryStringError(
+                    detail='Cursor pagination is not supported for this ordering.',
+                    parameter='page[cursor]',
+                )
+            descending = order.startswith('-')
+            name = order.lstrip('-')
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                field = None
+            if field is None or not field.concrete or field.null:
+                raise InvalidQueryStringError(
+                    detail='Cursor pagination is not supported when sorting by {}.'.format(name),
+                    parameter='page[cursor]',
+                )
+            ordering.append((field, descending))
+        if not any(field.primary_key for field, descending in ordering):
+            ordering.append((opts.pk, ordering[-1][1] if ordering else False))
+        return ordering
+
+    @property
+    def count(self):
+        if not self.count_total:
+            return None
+        if not hasattr(self, '_count'):
+            self._count = self.queryset.count()
+        return self._count
+
+    def encode_cursor(self, obj, reverse=False):
+        values = []
+        for field, descending in self.ordering:
+            value = getattr(obj, field.attname)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4)).decode('utf-8'))
+            values, reverse = payload['v'], bool(payload['r'])
+            if len(values) != len(self.ordering):
+                raise InvalidCursor
+            return [field.to_python(value) for (field, descending), value in zip(self.ordering, values)], reverse
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise InvalidCursor
+
+    def page(self, cursor):
+        """Returns the page after (or before) `cursor`; the first page if `cursor` is empty"""
+        values, reverse = self.decode_cursor(cursor) if cursor else (None, False)
+
+        order_by = []
+        for field, descending in self.ordering:
+            order_by.append(('-' if descending != reverse else '') + field.attname)
+        queryset = self.queryset.order_by(*order_by)
+
+        if values is not None:
+            after = Q()
+            for index, (field, descending) in enumerate(self.ordering):
+                condition = Q(**{
+                    '{}__{}'.format(field.attname, 'lt' if descending != reverse else 'gt'): values[index],
+                })
+                for (previous_field, _), previous_value in zip(self.ordering[:index], values[:index]):
+                    condition &= Q(**{previous_field.attname: previous_value})
+                after |= condition
+            queryset = queryset.filter(after)
+
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+            return KeysetPage(object_list, self, cursor, has_next=True, has_previous=has_more)
+        return KeysetPage(object_list, self, cursor, has_next=has_more, has_previous=bool(cursor))
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, paginator, cursor, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor = cursor
+        self._has_next = has_next and bool(object_list)
+        self._has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    def previous_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[0], reverse=True)
+
+
 class JSONAPIPagination(pagination.PageNumberPagination):
     """
     Custom paginator that formats responses in a JSON-API compatible format.
@@ -26,8 +272,22 @@ class JSONAPIPagination(pagination.PageNumberPagination):
 
     """
 
+    django_paginator_class = CountingPaginator
     page_size_query_param = 'page[size]'
     max_page_size = MAX_PAGE_SIZE
+    # Passing page[cursor] (empty for the first page) switches to keyset pagination
+    cursor_query_param = 'page[cursor]'
+    # page[total]=false skips counting the results in keyset pagination
+    total_query_param = 'page[total]'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def cursor_query(self, url, cursor):
+        """
+        Builds uri and adds cursor param.
+        """
+        url = remove_query_param(self.request.build_absolute_uri(url), '_')
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
 
     def page_number_query(self, url, page_number):
         """
@@ -42,34 +302,45 @@ class JSONAPIPagination(pagination.PageNumberPagination):
         return paginated_url
 
     def get_self_real_link(self, url):
+        if isinstance(self.page, KeysetPage):
+            return self.cursor_query(url, self.page.cursor)
         page_number = self.page.number
         return self.page_number_query(url, page_number)
 
     def get_first_real_link(self, url):
         if not self.page.has_previous():
             return None
+        if isinstance(self.page, KeysetPage):
+            return self.cursor_query(url, '')
         return self.page_number_query(url, 1)
 
     def get_last_real_link(self, url):
         if not self.page.has_next():
             return None
+        if isinstance(self.page, KeysetPage):
+            # Keyset pages only know their neighbours
+            return None
         page_number = self.page.paginator.num_pages
         return self.page_number_query(url, page_number)
 
     def get_previous_real_link(self, url):
         if not self.page.has_previous():
             return None
+        if isinstance(self.page, KeysetPage):
+            return self.cursor_query(url, self.page.previous_cursor())
         page_number = self.page.previous_page_number()
         return self.page_number_query(url, page_number)
 
     def get_next_real_link(self, url):
         if not self.page.has_next():
             return None
+        if isinstance(self.page, KeysetPage):
+            return self.cursor_query(url, self.page.next_cursor())
         page_number = self.page.next_page_number()
         return self.page_number_query(url, page_number)
 
     def get_response_dict_deprecated(self, data, url):
-        return OrderedDict([
+        response_dict = OrderedDict([
             ('data', data),
             (
                 'links', OrderedDict([
@@ -86,9 +357,12 @@ class JSONAPIPagination(pagination.PageNumberPagination):
                 ]),
             ),
         ])
+        if getattr(self.page.paginator, 'count_is_estimate', False):
+            response_dict['links']['meta']['total_is_estimate'] = True
+        return response_dict
 
     def get_response_dict(self, data, url):
-        return OrderedDict([
+        response_dict = OrderedDict([
             ('data', data),
             (
                 'meta', OrderedDict([
@@ -106,6 +380,9 @@ class JSONAPIPagination(pagination.PageNumberPagination):
                 ]),
             ),
         ])
+        if getattr(self.page.paginator, 'count_is_estimate', False):
+            response_dict['meta']['total_is_estimate'] = True
+        return response_dict
 
     def get_paginated_response(self, data):
         """
@@ -147,7 +424,7 @@ class JSONAPIPagination(pagination.PageNumberPagination):
             if isinstance(queryset, QuerySet) and not queryset.ordered:
                 queryset = queryset.order_by(queryset.model._meta.pk.name)
 
-            paginator = DjangoPaginator(queryset, self.page_size)
+            paginator = self.django_paginator_class(queryset, self.page_size)
             page_number = 1
             try:
                 self.page = paginator.page(page_number)
@@ -164,9 +441,32 @@ class JSONAPIPagination(pagination.PageNumberPagination):
             self.request = request
             return list(self.page)
 
+        elif self.cursor_query_param in request.query_params and isinstance(queryset, QuerySet):
+            return self.paginate_queryset_by_cursor(queryset, request)
+
         else:
             return super(JSONAPIPagination, self).paginate_queryset(queryset, request, view=None)
 
+    def paginate_queryset_by_cursor(self, queryset, request):
+        """
+        Keyset pagination of queryset, used when the client passes page[cursor].
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = KeysetPaginator(
+            queryset, page_size,
+            count_total=not is_falsy(request.query_params.get(self.total_query_param, True)),
+        )
+        try:
+            self.page = paginator.page(request.query_params[self.cursor_query_param])
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+
+        self.request = request
+        return list(self.page)
+
 
 class MaxSizePagination(JSONAPIPagination):
     page_size = 1000
@@ -252,6 +552,24 @@ class SearchPaginator(DjangoPaginator):
         model = DOC_TYPE_TO_MODEL[obj_type]
         return model.load(obj_id)
 
+    def load_results(self, results, get_model):
+        """Load the objects of search results, resolving the GUIDs of each GUID model in one go."""
+        by_model = defaultdict(list)
+        for result in results:
+            by_model[get_model(result)].append(result.get('_id'))
+        loaded = {
+            model: model.load_many(ids) if issubclass(model, GuidMixin) else {}
+            for model, ids in by_model.items()
+        }
+        items = []
+        for result in results:
+            model, obj_id = get_model(result), result.get('_id')
+            if issubclass(model, GuidMixin):
+                items.append(loaded[model].get(obj_id.lower()) if obj_id else None)
+            else:
+                items.append(model.load(obj_id))
+        return items
+
     def _get_count(self):
         self._count = self.object_list['aggs']['total']
         return self._count
@@ -260,10 +578,7 @@ class SearchPaginator(DjangoPaginator):
     def page(self, number):
         number = self.validate_number(number)
         results = self.object_list['results']
-        items = [
-            self.search_type_to_model(result.get('_id'), result.get('_type'))
-            for result in results
-        ]
+        items = self.load_results(results, lambda result: DOC_TYPE_TO_MODEL[result.get('_type')])
         return self._get_page(items, number, self)
 
 
@@ -276,10 +591,7 @@ class SearchModelPaginator(SearchPaginator):
     def page(self, number):
         number = self.validate_number(number)
         results = self.object_list['results']
-        items = [
-            self.model.load(result.get('_id'))
-            for result in results
-        ]
+        items = self.load_results(results, lambda result: self.model)
         return self._get_page(items, number, self)
 
 
@@ -31,6 +31,13 @@ class EmbeddedRequest(Request):
         """
         return 'GET'
 
+    @property
+    def prefetched(self):
+        """
+        Returns objects loaded in bulk for embeds of the original request, keyed by model and _id
+        """
+        return getattr(self._request, '_embed_prefetch', {})
+
     @property
     def user(self):
         """
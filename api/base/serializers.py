@@ -28,6 +28,11 @@ from api.base.versioning import KEBAB_CASE_VERSION, get_kebab_snake_case_field
 
 from osf.models.validators import SwitchValidator
 
+# Serialization plans compiled by JSONAPISerializer.get_serialization_plan, shared across requests
+_serialization_plans = {}
+SERIALIZATION_PLAN_CACHE_SIZE = 2048
+
+
 def get_meta_type(serializer_class, request):
     meta = getattr(serializer_class, 'Meta', None)
     if meta is None:
@@ -514,6 +519,41 @@ class AnonymizedRegexField(AuthorizedCharField):
 
         return value
 
+def get_related_type_and_id_kwarg(namespace, view_class):
+    """Return the JSON-API type of the resources served by a view in `namespace` and the url
+    kwarg that holds their id.
+    """
+    # TODO: change kwargs to preprint_provider_id and registration_id
+    if namespace == 'preprint_providers':
+        return namespace, 'provider_id'
+    elif namespace == 'registrations':
+        return namespace, 'node_id'
+    elif namespace == 'schemas' and view_class.view_name == 'registration-schema-detail':
+        return 'registration-schemas', 'schema_id'
+    elif namespace == 'users' and view_class.view_name == 'user_settings':
+        return 'user-settings', 'user_id'
+    elif namespace == 'institutions' and view_class.view_name == 'institution-summary-metrics':
+        return 'institution-summary-metrics', 'institution_id'
+    return namespace, namespace[:-1] + '_id'
+
+
+# (view class, related type, id kwarg) of the views that RelationshipFields link to,
+# keyed by view name and kwarg names
+_related_view_info = {}
+
+
+def get_related_view_info(view_name, kwargs, url):
+    """Return the view class, JSON-API type and id kwarg for a related view. `url` is only
+    resolved the first time a view is seen, so Django's url resolver stays out of serialization.
+    """
+    key = (view_name, frozenset(kwargs.keys()))
+    if key not in _related_view_info:
+        resolved_url = resolve(urlparse(url).path)
+        view_class = resolved_url.func.view_class
+        _related_view_info[key] = (view_class,) + get_related_type_and_id_kwarg(resolved_url.namespace, view_class)
+    return _related_view_info[key]
+
+
 class RelationshipField(ser.HyperlinkedIdentityField):
     """
     RelationshipField that permits the return of both self and related links, along with optional
@@ -666,6 +706,19 @@ class RelationshipField(ser.HyperlinkedIdentityField):
                 )
         return field_counts_requested
 
+    def get_related_count(self, count, value):
+        """
+        Returns a count for `value`, using the counts the serializer computed for the whole page if it has them
+        """
+        serializer = self.parent
+        if getattr(serializer, 'field', None):
+            serializer = serializer.parent
+        if isinstance(count, str):
+            prefetched_counts = getattr(serializer, '_prefetched_related_counts', {}).get(count)
+            if prefetched_counts is not None and value.pk in prefetched_counts:
+                return prefetched_counts[value.pk]
+        return functional.rapply(count, _url_val, obj=value, serializer=self.parent, request=self.context['request'])
+
     def get_meta_information(self, meta_data, value):
         """
         For retrieving meta values, otherwise returns {}
@@ -680,11 +733,11 @@ class RelationshipField(ser.HyperlinkedIdentityField):
                 field_counts_requested = self.process_related_counts_parameters(show_related_counts, value)
 
                 if utils.is_truthy(show_related_counts):
-                    meta[key] = functional.rapply(meta_data[key], _url_val, obj=value, serializer=self.parent, request=self.context['request'])
+                    meta[key] = self.get_related_count(meta_data[key], value)
                 elif utils.is_falsy(show_related_counts):
                     continue
                 elif self.field_name in field_counts_requested:
-                    meta[key] = functional.rapply(meta_data[key], _url_val, obj=value, serializer=self.parent, request=self.context['request'])
+                    meta[key] = self.get_related_count(meta_data[key], value)
                 else:
                     continue
             elif key == 'projects_in_common':
@@ -741,6 +794,8 @@ class RelationshipField(ser.HyperlinkedIdentityField):
     # Overrides HyperlinkedIdentityField
     def get_url(self, obj, view_name, request, format):
         urls = {}
+        # The view and kwargs the related link was reversed with, read back by to_representation
+        self._related_lookup = None
         for view_name, view in self.views.items():
             if view is None:
                 urls[view_name] = {}
@@ -754,6 +809,8 @@ class RelationshipField(ser.HyperlinkedIdentityField):
                     if request.parser_context['kwargs'].get('version', False):
                         kwargs.update({'version': request.parser_context['kwargs']['version']})
                     url = self.reverse(view, kwargs=kwargs, request=request, format=format)
+                    if view_name == 'related':
+                        self._related_lookup = (view, kwargs)
                     if self.filter:
                         formatted_filters = self.format_filter(obj)
                         if formatted_filters:
@@ -867,33 +924,23 @@ class RelationshipField(ser.HyperlinkedIdentityField):
                 return {'data': None}
 
         related_url = url['related']
-        related_path = urlparse(related_url).path if related_url else None
         related_meta = self.get_meta_information(self.related_meta, value)
         self_url = url['self']
         self_meta = self.get_meta_information(self.self_meta, value)
         relationship = format_relationship_links(related_url, self_url, related_meta, self_meta)
         if related_url:
-            resolved_url = resolve(related_path)
-            related_class = resolved_url.func.view_class
+            related_lookup = getattr(self, '_related_lookup', None)
+            if related_lookup and isinstance(related_lookup[0], str):
+                related_view, related_kwargs = related_lookup
+                related_class, related_type, id_kwarg = get_related_view_info(related_view, related_kwargs, related_url)
+            else:
+                resolved_url = resolve(urlparse(related_url).path)
+                related_class = resolved_url.func.view_class
+                related_type, id_kwarg = get_related_type_and_id_kwarg(resolved_url.namespace, related_class)
+                related_kwargs = resolved_url.kwargs
             if issubclass(related_class, RetrieveModelMixin):
                 try:
-                    related_type = resolved_url.namespace
-                    # TODO: change kwargs to preprint_provider_id and registration_id
-                    if related_type == 'preprint_providers':
-                        related_id = resolved_url.kwargs['provider_id']
-                    elif related_type == 'registrations':
-                        related_id = resolved_url.kwargs['node_id']
-                    elif related_type == 'schemas' and related_class.view_name == 'registration-schema-detail':
-                        related_id = resolved_url.kwargs['schema_id']
-                        related_type = 'registration-schemas'
-                    elif related_type == 'users' and related_class.view_name == 'user_settings':
-                        related_id = resolved_url.kwargs['user_id']
-                        related_type = 'user-settings'
-                    elif related_type == 'institutions' and related_class.view_name == 'institution-summary-metrics':
-                        related_id = resolved_url.kwargs['institution_id']
-                        related_type = 'institution-summary-metrics'
-                    else:
-                        related_id = resolved_url.kwargs[related_type[:-1] + '_id']
+                    related_id = str(related_kwargs[id_kwarg])
                 except KeyError:
                     return relationship
                 relationship['data'] = {'id': related_id, 'type': related_type}
@@ -1207,6 +1254,14 @@ class JSONAPIListSerializer(ser.ListSerializer):
                 self.child.to_esi_representation(item, envelope=None) for item in data
             ]
         else:
+            data = list(data)
+            embeds = self.context.get('embed', {})
+            # Let each embed fetch what it needs for the whole page before serializing items
+            for embed in embeds.values():
+                if hasattr(embed, 'prime'):
+                    embed.prime(data)
+            if hasattr(self.child, 'prefetch_related_counts'):
+                self.child.prefetch_related_counts(data)
             ret = [
                 self.child.to_representation(item, envelope=envelope) for item in data
             ]
@@ -1324,6 +1379,10 @@ class JSONAPISerializer(BaseAPISerializer):
         'nodes:node-registrations',
     }
 
+    # Maps `related_meta` count methods to methods that count for a list of objects at once,
+    # returning {pk: count}. Used by list views when related counts are requested.
+    bulk_related_counts = {}
+
     # overrides Serializer
     @classmethod
     def many_init(cls, *args, **kwargs):
@@ -1373,34 +1432,45 @@ class JSONAPISerializer(BaseAPISerializer):
             field = field.field
         return getattr(field, 'child_relation', field)
 
-    # overrides Serializer
-    def to_representation(self, obj, envelope='data'):
-        """Serialize to final representation.
+    def get_serialization_plan(self, request, embeds, is_anonymous):
+        """Return the fields to serialize, and how, for the given request.
 
-        :param obj: Object to be serialized.
-        :param envelope: Key for resource object.
+        Working out which fields to serialize (sparse fieldsets, anonymization, write-only fields,
+        embed validation, unwrapping nested fields) is the same for every object serialized with
+        the same serializer and query, so it is done once per serializer instance. The resulting
+        per-field decisions are also shared between instances of the same serializer class via
+        `_serialization_plans`, so later requests only have to bind them to their own fields.
+
+        :return: tuple of (type_, invalid_embeds, [(field, nested_field, source_field, kind), ...])
         """
-        ret = {}
-        request = self.context.get('request')
+        plan_key = (request.version if request else None, frozenset(embeds), is_anonymous)
+        plans = self.__dict__.setdefault('_bound_serialization_plans', {})
+        if plan_key in plans:
+            return plans[plan_key]
+
+        self.parse_sparse_fields(allow_unsafe=True, context=self.context)
         type_ = get_meta_type(self, request)
         assert type_ is not None, 'Must define Meta.type_ or Meta.get_type()'
-        self.parse_sparse_fields(allow_unsafe=True, context=self.context)
-
-        data = {
-            'id': '',
-            'type': type_,
-            'attributes': {},
-            'relationships': {},
-            'embeds': {},
-            'links': {},
-        }
 
-        embeds = self.context.get('embed', {})
-        context_envelope = self.context.get('envelope', envelope)
-        if context_envelope == 'None':
-            context_envelope = None
-        enable_esi = self.context.get('enable_esi', False)
-        is_anonymous = is_anonymized(self.context['request'])
+        class_key = (type(self), type_, tuple((name, type(field)) for name, field in self.fields.items())) + plan_key
+        compiled = _serialization_plans.get(class_key)
+        if compiled is None:
+            compiled = self._compile_serialization_plan(embeds, is_anonymous)
+            if not compiled[0]:
+                if len(_serialization_plans) >= SERIALIZATION_PLAN_CACHE_SIZE:
+                    _serialization_plans.clear()
+                _serialization_plans[class_key] = compiled
+        invalid_embeds, field_plan = compiled
+
+        bound = []
+        for field_name, uses_child_relation, kind in field_plan:
+            field = self.fields[field_name]
+            source_field = field.child_relation if uses_child_relation else field
+            bound.append((field, self.get_unwrapped_field(field), source_field, kind))
+        plans[plan_key] = (type_, invalid_embeds, bound)
+        return plans[plan_key]
+
+    def _compile_serialization_plan(self, embeds, is_anonymous):
         to_be_removed = set()
         if is_anonymous and hasattr(self, 'non_anonymized_fields'):
             # Drop any fields that are not specified in the `non_anonymized_fields` variable.
@@ -1415,6 +1485,36 @@ class JSONAPISerializer(BaseAPISerializer):
 
         invalid_embeds = self.invalid_embeds(fields, embeds)
         invalid_embeds = invalid_embeds - to_be_removed
+
+        field_plan = []
+        for field in fields:
+            nested_field = self.get_unwrapped_field(field)
+            if getattr(field, 'json_api_link', False) or getattr(nested_field, 'json_api_link', False):
+                kind = 'relationship'
+            elif field.field_name in ('id', 'links'):
+                kind = field.field_name
+            else:
+                kind = 'attribute'
+            field_plan.append((field.field_name, hasattr(field, 'child_relation'), kind))
+        return frozenset(invalid_embeds), tuple(field_plan)
+
+    # overrides Serializer
+    def to_representation(self, obj, envelope='data'):
+        """Serialize to final representation.
+
+        :param obj: Object to be serialized.
+        :param envelope: Key for resource object.
+        """
+        ret = {}
+        request = self.context.get('request')
+        embeds = self.context.get('embed', {})
+        context_envelope = self.context.get('envelope', envelope)
+        if context_envelope == 'None':
+            context_envelope = None
+        enable_esi = self.context.get('enable_esi', False)
+        is_anonymous = is_anonymized(self.context['request'])
+
+        type_, invalid_embeds, field_plan = self.get_serialization_plan(request, embeds, is_anonymous)
         if invalid_embeds:
             raise api_exceptions.InvalidQueryStringError(
                 parameter='embed',
@@ -1423,13 +1523,18 @@ class JSONAPISerializer(BaseAPISerializer):
                 ),
             )
 
-        for field in fields:
-            nested_field = self.get_unwrapped_field(field)
+        data = {
+            'id': '',
+            'type': type_,
+            'attributes': {},
+            'relationships': {},
+            'embeds': {},
+            'links': {},
+        }
+
+        for field, nested_field, source_field, kind in field_plan:
             try:
-                if hasattr(field, 'child_relation'):
-                    attribute = field.child_relation.get_attribute(obj)
-                else:
-                    attribute = field.get_attribute(obj)
+                attribute = source_field.get_attribute(obj)
             except SkipField:
                 continue
             if attribute is None:
@@ -1443,19 +1548,13 @@ class JSONAPISerializer(BaseAPISerializer):
                     data['attributes'][field.field_name] = None
             else:
                 try:
-                    if hasattr(field, 'child_relation'):
-                        if hasattr(attribute, 'all'):
-                            representation = field.child_relation.to_representation(attribute.all())
-                        else:
-                            representation = field.child_relation.to_representation(attribute)
+                    if hasattr(attribute, 'all'):
+                        representation = source_field.to_representation(attribute.all())
                     else:
-                        if hasattr(attribute, 'all'):
-                            representation = field.to_representation(attribute.all())
-                        else:
-                            representation = field.to_representation(attribute)
+                        representation = source_field.to_representation(attribute)
                 except SkipField:
                     continue
-                if getattr(field, 'json_api_link', False) or getattr(nested_field, 'json_api_link', False):
+                if kind == 'relationship':
                     # If embed=field_name is appended to the query string or 'always_embed' flag is True, directly embed the
                     # results in addition to adding a relationship link
                     if embeds and (field.field_name in embeds or getattr(field, 'always_embed', None)):
@@ -1484,9 +1583,9 @@ class JSONAPISerializer(BaseAPISerializer):
                             data['relationships'][field.field_name] = representation
                     except SkipField:
                         continue
-                elif field.field_name == 'id':
+                elif kind == 'id':
                     data['id'] = representation
-                elif field.field_name == 'links':
+                elif kind == 'links':
                     data['links'] = representation
                 else:
                     data['attributes'][field.field_name] = representation
@@ -1510,6 +1609,35 @@ class JSONAPISerializer(BaseAPISerializer):
             meta_obj.update(additional_meta)
         return ret
 
+    def prefetch_related_counts(self, objs):
+        """Compute the requested related counts for a page of objects with one query per
+        relationship, for count methods that have an entry in `bulk_related_counts`. Other
+        counts are still computed per object by RelationshipField.get_meta_information.
+        """
+        self._prefetched_related_counts = {}
+        request = self.context.get('request')
+        if not self.bulk_related_counts or not objs or request is None:
+            return
+        if request.parser_context.get('kwargs', {}).get('is_embedded'):
+            return
+        show_related_counts = request.query_params.get('related_counts', False)
+        if utils.is_falsy(show_related_counts):
+            return
+        requested_fields = None if utils.is_truthy(show_related_counts) else set(show_related_counts.split(','))
+
+        for field_name, field in self.fields.items():
+            field = self.get_unwrapped_field(field)
+            if not isinstance(field, RelationshipField):
+                continue
+            if requested_fields is not None and field_name not in requested_fields:
+                continue
+            for meta in (field.related_meta, field.self_meta):
+                count = (meta or {}).get('count')
+                if not isinstance(count, str) or count not in self.bulk_related_counts:
+                    continue
+                if count not in self._prefetched_related_counts:
+                    self._prefetched_related_counts[count] = getattr(self, self.bulk_related_counts[count])(objs)
+
     def get_absolute_url(self, obj):
         raise NotImplementedError()
 
@@ -35,6 +35,12 @@ DATABASES = {
 }
 
 DATABASE_ROUTERS = ['osf.db.router.PostgreSQLFailoverRouter', ]
+# Databases besides the master that are in recovery serve the reads of replica-safe views. Configure them without
+# ATOMIC_REQUESTS, or every request opens a transaction on each of them.
+# Seconds between health checks of the replicas, and how far behind the master a replica may be and still be read from
+DATABASE_REPLICA_CHECK_INTERVAL = 10
+DATABASE_REPLICA_MAX_LAG = 5
+DATABASE_REPLICA_CONNECT_TIMEOUT = 2
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
     'django.contrib.auth.hashers.BCryptPasswordHasher',
@@ -133,6 +139,27 @@ BULK_SETTINGS = {
 
 MAX_PAGE_SIZE = 100
 
+# List totals above this many rows (by the Postgres planner's estimate) are reported as estimates
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 50000
+# Seconds that list totals are cached for, per query
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+
+# Seconds that a GUID's resolution to its referent is cached for, in the shared cache and in each process.
+# Process-local entries can't be invalidated by other processes, so their timeout bounds how long a
+# repointed or deleted GUID may still resolve to its previous referent elsewhere.
+GUID_RESOLUTION_CACHE_TIMEOUT = 60 * 60
+GUID_RESOLUTION_LOCAL_CACHE_TIMEOUT = 10
+GUID_RESOLUTION_LOCAL_CACHE_SIZE = 10000
+
+# Length of the GUIDs kept reserved in the GUID pool; other lengths are always generated on demand
+GUID_POOL_LENGTH = 5
+# Number of reserved GUIDs the pool is topped up to, and how many are reserved per query while refilling
+GUID_POOL_SIZE = 20000
+GUID_POOL_REFILL_BATCH_SIZE = 1000
+
+# Number of node ids compared at once when reconciling effective node permissions with the permission tables
+EFFECTIVE_PERMISSION_RECONCILE_BATCH_SIZE = 5000
+
 REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
     'DEFAULT_RENDERER_CLASSES': (
@@ -215,6 +242,7 @@ ORIGINS_WHITELIST = ()
 
 MIDDLEWARE = (
     'api.base.middleware.DjangoGlobalMiddleware',
+    'api.base.middleware.DatabaseRoutingMiddleware',
     'api.base.middleware.CeleryTaskMiddleware',
     'api.base.middleware.PostcommitTaskMiddleware',
     # A profiling middleware. ONLY FOR DEV USE
@@ -319,6 +347,13 @@ ELASTICSEARCH_METRICS_DATE_FORMAT = '%Y'
 
 WAFFLE_CACHE_NAME = 'waffle_cache'
 STORAGE_USAGE_CACHE_NAME = 'storage_usage'
+PAGINATION_COUNT_CACHE_NAME = 'pagination_counts'
+CAS_PROFILE_CACHE_NAME = 'cas_profiles'
+WATERBUTLER_CONFIG_CACHE_NAME = 'waterbutler_config'
+WATERBUTLER_CONFIG_GENERATION_CACHE_NAME = 'waterbutler_config_generations'
+SEARCH_UPDATE_CACHE_NAME = 'search_updates'
+GUID_RESOLUTION_CACHE_NAME = 'guid_resolutions'
+CITATION_CACHE_NAME = 'citations'
 
 
 CACHES = {
@@ -332,6 +367,49 @@ CACHES = {
     WAFFLE_CACHE_NAME: {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     },
+    PAGINATION_COUNT_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    CAS_PROFILE_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'osf_cas_profile_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Holds decrypted addon credentials, so it must stay in process memory
+    WATERBUTLER_CONFIG_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared generations of the cached configs above, so every process sees invalidations
+    WATERBUTLER_CONFIG_GENERATION_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'osf_waterbutler_config_generation_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    SEARCH_UPDATE_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'osf_search_update_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    GUID_RESOLUTION_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'osf_guid_resolution_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000,
+        },
+    },
+    CITATION_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'osf_citation_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
 SLOAN_ID_COOKIE_NAME = 'sloan_id'
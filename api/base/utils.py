@@ -7,7 +7,8 @@ from hashids import Hashids
 
 from django.utils.http import urlquote
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import QuerySet, F
+from django.db.models import QuerySet, F, Count
+from django.urls import get_script_prefix, get_urlconf
 from rest_framework.exceptions import NotFound
 from rest_framework.reverse import reverse
 
@@ -73,9 +74,38 @@ def get_user_auth(request):
     return auth
 
 
+# Urls reversed by `cached_reverse`, keyed by everything django's `reverse` reads to build them
+_reversed_urls = {}
+
+REVERSED_URLS_MAX_SIZE = 50000
+
+
+def cached_reverse(view_name, kwargs=None):
+    """Like django's `reverse`, but only runs the url resolver once per view and kwargs, so the
+    urls of objects linked from several fields or several objects of a page are only reversed once.
+    Values `reverse` rejects are never cached, so they raise `NoReverseMatch` every time.
+    """
+    kwargs = kwargs or {}
+    try:
+        key = (get_urlconf(), get_script_prefix(), view_name, tuple(sorted(kwargs.items())))
+        url = _reversed_urls.get(key)
+    except TypeError:
+        # Unhashable kwargs
+        return reverse(view_name, kwargs=kwargs)
+    if url is None:
+        url = reverse(view_name, kwargs=kwargs)
+        if len(_reversed_urls) >= REVERSED_URLS_MAX_SIZE:
+            _reversed_urls.clear()
+        _reversed_urls[key] = url
+    return url
+
+
 def absolute_reverse(view_name, query_kwargs=None, args=None, kwargs=None):
     """Like django's `reverse`, except returns an absolute URL. Also add query parameters."""
-    relative_url = reverse(view_name, kwargs=kwargs)
+    if not isinstance(view_name, basestring):
+        relative_url = reverse(view_name, kwargs=kwargs)
+    else:
+        relative_url = cached_reverse(view_name, kwargs=kwargs)
 
     url = website_util.api_v2_url(relative_url, params=query_kwargs, base_prefix='')
     return url
@@ -246,3 +276,21 @@ class MockQueryset(list):
     def add_dict_as_item(self, dict):
         item = type('item', (object,), dict)
         self.append(item)
+
+
+def grouped_counts(queryset, group_field, objs, distinct_field='pk'):
+    """Count the rows of `queryset` for each of `objs` with one grouped query.
+
+    :param queryset: rows to count
+    :param str group_field: field of `queryset` that points at the objects being counted for
+    :param list objs: model instances to count for
+    :return dict: {obj.pk: count}, with 0 for objects without rows
+    """
+    pks = [obj.pk for obj in objs]
+    counts = dict(
+        queryset.filter(**{'{}__in'.format(group_field): pks})
+        .order_by()
+        .values_list(group_field)
+        .annotate(count=Count(distinct_field, distinct=True)),
+    )
+    return {pk: counts.get(pk, 0) for pk in pks}
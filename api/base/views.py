@@ -1,4 +1,5 @@
 from builtins import str
+import functools
 
 from collections import defaultdict
 from distutils.version import StrictVersion
@@ -40,6 +41,7 @@ from api.nodes.permissions import ReadOnlyIfRegistration
 from api.nodes.permissions import ExcludeWithdrawals
 from api.users.serializers import UserSerializer
 from framework.auth.oauth_scopes import CoreScopes
+from osf.db.router import replica_safe
 from osf.models import Contributor, MaintenanceState, BaseFileNode
 from osf.utils.permissions import API_CONTRIBUTOR_PERMISSIONS, READ, WRITE, ADMIN
 from waffle.models import Flag, Switch, Sample
@@ -47,6 +49,23 @@ from waffle import sample_is_active
 
 
 class JSONAPIBaseView(generics.GenericAPIView):
+    # Whether GET requests may read from a database replica, for views that only read and tolerate slightly stale data
+    replica_safe = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(JSONAPIBaseView, cls).as_view(**initkwargs)
+        if not cls.replica_safe:
+            return view
+
+        # Reads inside a transaction stay on the master, so only wrap unsafe requests in one
+        @functools.wraps(view)
+        def replica_safe_view(request, *args, **kwargs):
+            if request.method in drf_permissions.SAFE_METHODS:
+                return view(request, *args, **kwargs)
+            with transaction.atomic():
+                return view(request, *args, **kwargs)
+        return replica_safe(transaction.non_atomic_requests(replica_safe_view))
 
     def __init__(self, **kwargs):
         assert getattr(self, 'view_name', None), 'Must specify view_name on view.'
@@ -58,6 +77,9 @@ class JSONAPIBaseView(generics.GenericAPIView):
         """Create a partial function to fetch the values of an embedded field. A basic
         example is to include a Node's children in a single response.
 
+        The returned function also has a `prime` attribute, which list serializers call with
+        every item of a page before serializing it so that embedded objects are fetched in bulk.
+
         :param str field_name: Name of field of the view's serializer_class to load
         results for
         :return function object -> dict:
@@ -65,9 +87,49 @@ class JSONAPIBaseView(generics.GenericAPIView):
         if getattr(field, 'field', None):
             field = field.field
 
+        # Views resolved by `prime`, keyed by the item they were resolved for
+        resolved = {}
+
+        def prime(items):
+            """Resolve the embedded views for a whole page of items up front and load every
+            object they would fetch with one query per target view, rather than one per item.
+            Only detail views that define `get_embedded_queryset` take part; objects that are not
+            found here fall back to the view's regular lookup.
+            """
+            if not hasattr(self.request._request, '_embed_prefetch'):
+                self.request._request._embed_prefetch = {}
+            prefetched = self.request._request._embed_prefetch
+
+            lookups = defaultdict(set)
+            for item in items:
+                try:
+                    v, view_args, view_kwargs = field.resolve(item, field_name, self.request)
+                except Exception:
+                    # Errors are reported per item when the embed is serialized
+                    continue
+                resolved[(type(item), getattr(item, 'pk', None))] = (v, view_args, view_kwargs)
+                if not v or issubclass(v.cls, ListModelMixin) or not hasattr(v.cls, 'get_embedded_queryset'):
+                    continue
+                lookup_id = view_kwargs.get(v.cls.embedded_lookup_url_kwarg)
+                # An embed pointing back at the item itself is served from `request.parents`
+                if lookup_id and lookup_id != getattr(item, '_id', None):
+                    lookups[v.cls].add(lookup_id)
+
+            for view_class, lookup_ids in lookups.items():
+                cache = prefetched.setdefault(view_class.embedded_model, {})
+                missing = lookup_ids - set(cache.keys())
+                if missing:
+                    for obj in view_class.get_embedded_queryset(missing):
+                        cache[obj._id] = obj
+
         def partial(item):
-            # resolve must be implemented on the field
-            v, view_args, view_kwargs = field.resolve(item, field_name, self.request)
+            resolved_key = (type(item), getattr(item, 'pk', None))
+            if resolved_key[1] is not None and resolved_key in resolved:
+                v, view_args, view_kwargs = resolved.pop(resolved_key)
+                view_kwargs = dict(view_kwargs)
+            else:
+                # resolve must be implemented on the field
+                v, view_args, view_kwargs = field.resolve(item, field_name, self.request)
             if not v:
                 return None
 
@@ -137,6 +199,7 @@ class JSONAPIBaseView(generics.GenericAPIView):
 
             return ret
 
+        partial.prime = prime
         return partial
 
     def get_serializer_context(self):
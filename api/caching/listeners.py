@@ -1,5 +1,4 @@
-from api.caching.tasks import ban_url
-from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from api.caching.tasks import queue_ban
 
 # unused for now
 # from django.dispatch import receiver
@@ -7,4 +6,4 @@ from framework.postcommit_tasks.handlers import enqueue_postcommit_task
 # @receiver(post_save)
 def ban_object_from_cache(sender, instance, **kwargs):
     if hasattr(instance, 'absolute_api_v2_url'):
-        enqueue_postcommit_task(ban_url, (instance, ), {}, celery=False, once_per_request=True)
+        queue_ban(instance)
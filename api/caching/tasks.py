@@ -1,12 +1,19 @@
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from future.moves.urllib.parse import urlparse
-from django.db import connection
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Sum
+from django.utils import timezone
 
 import requests
 import logging
+import threading
+import time
 
 from django.apps import apps
 from api.caching.utils import storage_usage_cache
 from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from osf.utils.requests import DummyRequest, get_current_request
 
 from api.caching import settings as cache_settings
 from framework.celery_tasks import app
@@ -20,122 +27,253 @@ def get_varnish_servers():
     return settings.VARNISH_SERVERS
 
 
-def get_bannable_urls(instance):
+def get_bannable_paths(instance):
+    """Returns the paths of the API responses that have to be banned when `instance` changes,
+    and the hostname those responses are served for.
+    """
     from osf.models import Comment
-    bannable_urls = []
-    parsed_absolute_url = {}
 
     if not hasattr(instance, 'absolute_api_v2_url'):
         logger.warning('Tried to ban {}:{} but it didn\'t have a absolute_api_v2_url method'.format(instance.__class__, instance))
         return [], ''
 
+    parsed_absolute_url = urlparse(instance.absolute_api_v2_url)
+    bannable_paths = [parsed_absolute_url.path]
+    if isinstance(instance, Comment):
+        try:
+            bannable_paths.append(urlparse(instance.target.referent.absolute_api_v2_url).path)
+        except AttributeError:
+            # some referents don't have an absolute_api_v2_url
+            # I'm looking at you NodeWikiPage
+            # Note: NodeWikiPage has been deprecated. Is this an issue with WikiPage/WikiVersion?
+            pass
+
+        try:
+            bannable_paths.append(urlparse(instance.root_target.referent.absolute_api_v2_url).path)
+        except AttributeError:
+            # some root_targets don't have an absolute_api_v2_url
+            pass
+
+    return bannable_paths, parsed_absolute_url.hostname
+
+
+def get_bannable_urls(instance):
+    bannable_urls = []
+    bannable_paths, hostname = get_bannable_paths(instance)
     for host in get_varnish_servers():
-        # add instance url
         varnish_parsed_url = urlparse(host)
-        parsed_absolute_url = urlparse(instance.absolute_api_v2_url)
-        url_string = '{scheme}://{netloc}{path}.*'.format(
-            scheme=varnish_parsed_url.scheme,
-            netloc=varnish_parsed_url.netloc,
-            path=parsed_absolute_url.path,
-        )
-        bannable_urls.append(url_string)
-        if isinstance(instance, Comment):
-            try:
-                parsed_target_url = urlparse(instance.target.referent.absolute_api_v2_url)
-            except AttributeError:
-                # some referents don't have an absolute_api_v2_url
-                # I'm looking at you NodeWikiPage
-                # Note: NodeWikiPage has been deprecated. Is this an issue with WikiPage/WikiVersion?
-                pass
-            else:
-                url_string = '{scheme}://{netloc}{path}.*'.format(
-                    scheme=varnish_parsed_url.scheme,
-                    netloc=varnish_parsed_url.netloc,
-                    path=parsed_target_url.path,
-                )
-                bannable_urls.append(url_string)
-
-            try:
-                parsed_root_target_url = urlparse(instance.root_target.referent.absolute_api_v2_url)
-            except AttributeError:
-                # some root_targets don't have an absolute_api_v2_url
-                pass
-            else:
-                url_string = '{scheme}://{netloc}{path}.*'.format(
-                    scheme=varnish_parsed_url.scheme,
-                    netloc=varnish_parsed_url.netloc,
-                    path=parsed_root_target_url.path,
-                )
-                bannable_urls.append(url_string)
-
-    return bannable_urls, parsed_absolute_url.hostname
+        for path in bannable_paths:
+            bannable_urls.append('{scheme}://{netloc}{path}.*'.format(
+                scheme=varnish_parsed_url.scheme,
+                netloc=varnish_parsed_url.netloc,
+                path=path,
+            ))
+    return bannable_urls, hostname
+
+
+def get_ban_expressions(paths, max_length=None):
+    """Merges paths into as few `(path|path|...).*` regexes as fit in `max_length` characters each"""
+    max_length = max_length or settings.VARNISH_BAN_MAX_EXPRESSION_LENGTH
+    expressions = []
+    group = []
+    group_length = 0
+    for path in sorted(set(paths)):
+        if group and group_length + len(path) + 1 > max_length:
+            expressions.append(group)
+            group, group_length = [], 0
+        group.append(path)
+        group_length += len(path) + 1
+    if group:
+        expressions.append(group)
+    return [
+        '{}.*'.format(group[0]) if len(group) == 1 else '({}).*'.format('|'.join(group))
+        for group in expressions
+    ]
+
+
+# Counters for the bans sent by this process, see `get_ban_stats`
+ban_stats = Counter()
+_ban_stats_lock = threading.Lock()
+
+_ban_session = None
+
+# Attribute of the current request holding the bans queued by `queue_ban`
+PENDING_BANS_ATTR = '_pending_varnish_bans'
+
+
+def get_ban_stats():
+    with _ban_stats_lock:
+        return dict(ban_stats)
+
+
+def get_ban_session():
+    global _ban_session
+    if _ban_session is None:
+        _ban_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.VARNISH_BAN_CONCURRENCY)
+        _ban_session.mount('http://', adapter)
+        _ban_session.mount('https://', adapter)
+    return _ban_session
+
+
+def send_ban(server, expression, hostname):
+    request = requests.Request('BAN', server, headers={'Host': hostname}).prepare()
+    # Varnish bans on req.url as a regex, so the expression is sent as the path without quoting
+    parsed_server = urlparse(server)
+    request.url = '{}://{}{}'.format(parsed_server.scheme, parsed_server.netloc, expression)
+    start = time.time()
+    try:
+        response = get_ban_session().send(request, timeout=settings.VARNISH_BAN_TIMEOUT)
+    except Exception as ex:
+        ok, message = False, str(ex)
+    else:
+        ok, message = response.ok, response.text
+    elapsed = time.time() - start
+
+    with _ban_stats_lock:
+        ban_stats['bans_sent'] += 1
+        ban_stats['ban_failures'] += 0 if ok else 1
+        ban_stats['ban_latency_ms_total'] += int(elapsed * 1000)
+        ban_stats['ban_latency_ms_max'] = max(ban_stats['ban_latency_ms_max'], int(elapsed * 1000))
+    if ok:
+        logger.info('Banning {} on {} succeeded'.format(expression, server))
+    else:
+        logger.error('Banning {} on {} failed: {}'.format(expression, server, message))
+    return ok
+
+
+def ban_paths(paths, hostname):
+    """Bans `paths` on every Varnish server, sending the merged ban expressions concurrently"""
+    if not settings.ENABLE_VARNISH or not paths:
+        return
+    jobs = [
+        (server, expression)
+        for server in get_varnish_servers()
+        for expression in get_ban_expressions(paths)
+    ]
+    if not jobs:
+        return
+    with ThreadPoolExecutor(max_workers=min(len(jobs), settings.VARNISH_BAN_CONCURRENCY)) as executor:
+        list(executor.map(lambda job: send_ban(job[0], job[1], hostname), jobs))
+
+
+def flush_bans(pending):
+    """Sends the bans in `pending`, at most one merged ban per expression and server"""
+    while pending:
+        hostname, paths = pending.popitem()
+        ban_paths(paths, hostname)
+
+
+def queue_ban(instance):
+    """Queues the responses for `instance` to be banned once the request's transaction has committed.
+    All bans queued during a request are merged and sent together. Outside of a request they are
+    sent right away.
+
+    The queued bans are kept on the request rather than in thread locals: postcommit tasks run in
+    their own greenlets, and they are dropped along with the request if it fails.
+    """
+    if not settings.ENABLE_VARNISH:
+        return
+    paths, hostname = get_bannable_paths(instance)
+    request = get_current_request()
+    if isinstance(request, DummyRequest):
+        ban_paths(paths, hostname)
+        return
+    pending = getattr(request, PENDING_BANS_ATTR, None)
+    if pending is None:
+        pending = defaultdict(set)
+        setattr(request, PENDING_BANS_ATTR, pending)
+    # Only an empty set needs a flush queued; a non-empty one is already waiting for one
+    needs_flush = not pending
+    pending[hostname].update(paths)
+    if needs_flush:
+        enqueue_postcommit_task(flush_bans, (pending, ), {}, celery=False, once_per_request=False)
 
 
 @app.task(max_retries=5, default_retry_delay=60)
 def ban_url(instance):
-    # TODO: Refactor; Pull url generation into postcommit_task handling so we only ban urls once per request
-    timeout = 0.3  # 300ms timeout for bans
     if settings.ENABLE_VARNISH:
-        bannable_urls, hostname = get_bannable_urls(instance)
-
-        for url_to_ban in set(bannable_urls):
-            try:
-                response = requests.request(
-                    'BAN', url_to_ban, timeout=timeout, headers=dict(
-                        Host=hostname,
-                    ),
-                )
-            except Exception as ex:
-                logger.error('Banning {} failed: {}'.format(
-                    url_to_ban,
-                    ex.message,
-                ))
-            else:
-                if not response.ok:
-                    logger.error('Banning {} failed: {}'.format(
-                        url_to_ban,
-                        response.text,
-                    ))
-                else:
-                    logger.info('Banning {} succeeded'.format(
-                        url_to_ban,
-                    ))
+        paths, hostname = get_bannable_paths(instance)
+        ban_paths(paths, hostname)
+
+
+def compute_storage_usage(target_id):
+    """Sums the sizes of every version of the live osfstorage files of the node with pk `target_id`"""
+    AbstractNode = apps.get_model('osf.AbstractNode')
+    BaseFileVersionsThrough = apps.get_model('osf.BaseFileVersionsThrough')
+    TrashedFileNode = apps.get_model('osf.TrashedFileNode')
+
+    return BaseFileVersionsThrough.objects.filter(
+        basefilenode__provider='osfstorage',
+        basefilenode__target_content_type=ContentType.objects.get_for_model(AbstractNode),
+        basefilenode__target_object_id=target_id,
+    ).exclude(
+        basefilenode__type__in=TrashedFileNode._typedmodels_subtypes,
+    ).aggregate(total=Sum('fileversion__size'))['total'] or 0
 
 
 @app.task(max_retries=5, default_retry_delay=10)
-def update_storage_usage_cache(target_id, target_guid, per_page=500000):
+def update_storage_usage_cache(target_id, target_guid):
+    """Recomputes the storage usage of a node from scratch, persisting and caching the result"""
     if not settings.ENABLE_STORAGE_USAGE_CACHE:
         return
-    sql = """
-        SELECT count(size), sum(size) from
-        (SELECT size FROM osf_basefileversionsthrough AS obfnv
-        LEFT JOIN osf_basefilenode file ON obfnv.basefilenode_id = file.id
-        LEFT JOIN osf_fileversion version ON obfnv.fileversion_id = version.id
-        LEFT JOIN django_content_type type on file.target_content_type_id = type.id
-        WHERE file.provider = 'osfstorage'
-        AND type.model = 'abstractnode'
-        AND file.deleted_on IS NULL
-        AND file.target_object_id=%s
-        ORDER BY version.id
-        LIMIT %s OFFSET %s) file_page
-    """
-    count = per_page
-    offset = 0
-    storage_usage_total = 0
-    with connection.cursor() as cursor:
-        while count:
-            cursor.execute(sql, [target_id, per_page, offset])
-            result = cursor.fetchall()
-            storage_usage_total += int(result[0][1]) if result[0][1] else 0
-            count = int(result[0][0]) if result[0][0] else 0
-            offset += count
+    NodeStorageUsage = apps.get_model('osf.NodeStorageUsage')
+
+    storage_usage_total = compute_storage_usage(target_id)
+    NodeStorageUsage.objects.update_or_create(node_id=target_id, defaults={'total': storage_usage_total})
 
     key = cache_settings.STORAGE_USAGE_KEY.format(target_id=target_guid)
     storage_usage_cache.set(key, storage_usage_total, cache_settings.FIVE_MIN_TIMEOUT)
 
 
-def update_storage_usage(target):
+def refresh_storage_usage_cache(target_id, target_guid):
+    NodeStorageUsage = apps.get_model('osf.NodeStorageUsage')
+
+    storage_usage_total = NodeStorageUsage.objects.filter(node_id=target_id).values_list('total', flat=True).first()
+    if storage_usage_total is None:
+        return update_storage_usage_cache(target_id, target_guid)
+
+    key = cache_settings.STORAGE_USAGE_KEY.format(target_id=target_guid)
+    storage_usage_cache.set(key, storage_usage_total, cache_settings.FIVE_MIN_TIMEOUT)
+
+
+def tracks_storage_usage(target):
     Preprint = apps.get_model('osf.preprint')
 
-    if settings.ENABLE_STORAGE_USAGE_CACHE and not isinstance(target, Preprint) and not target.is_quickfiles:
+    return settings.ENABLE_STORAGE_USAGE_CACHE and not isinstance(target, Preprint) and not target.is_quickfiles
+
+
+def update_storage_usage(target):
+    """Queues a full recompute of the storage usage of `target`"""
+    if tracks_storage_usage(target):
         enqueue_postcommit_task(update_storage_usage_cache, (target.id, target._id,), {}, celery=True)
+
+
+def update_storage_usage_by_delta(target, delta):
+    """Adds `delta` bytes to the persisted storage usage of `target` in the current transaction.
+    Falls back to a full recompute if the usage of `target` has never been computed.
+
+    Note that the UPDATE locks the node's NodeStorageUsage row until the transaction commits, so
+    requests adding versions to or deleting files from the same node are serialized from this point
+    until they commit. The WaterButler hooks do this near the end of their requests, which keeps
+    the wait short, but a busy node's row is a point of contention.
+    """
+    if not delta or not tracks_storage_usage(target):
+        return
+    NodeStorageUsage = apps.get_model('osf.NodeStorageUsage')
+
+    if NodeStorageUsage.objects.filter(node_id=target.id).update(total=F('total') + delta, modified=timezone.now()):
+        enqueue_postcommit_task(refresh_storage_usage_cache, (target.id, target._id,), {}, celery=False)
+    else:
+        update_storage_usage(target)
+
+
+@app.task
+def reconcile_storage_usage(batch_size=None):
+    """Recomputes the least recently updated storage usages, correcting any drift in their deltas"""
+    NodeStorageUsage = apps.get_model('osf.NodeStorageUsage')
+    batch_size = batch_size or settings.STORAGE_USAGE_RECONCILE_BATCH_SIZE
+
+    stale = NodeStorageUsage.objects.order_by('modified').values_list('node_id', 'node__guids___id')[:batch_size]
+    for target_id, target_guid in stale:
+        update_storage_usage_cache(target_id, target_guid)
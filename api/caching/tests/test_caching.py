@@ -5,10 +5,12 @@ import random
 import unittest
 import uuid
 
+import mock
 import requests
 from django.conf import settings as django_settings
 from requests.auth import HTTPBasicAuth
 
+from api.caching import tasks
 from osf.models import OSFUser
 from scripts.create_fakes import create_fake_project
 from tests.base import DbTestCase
@@ -262,3 +264,47 @@ class TestVarnish(DbTestCase):
         )
 
         assert individual_response.headers['x-cache'] == 'MISS', 'Request got a cache hit.'
+
+
+class TestBanDispatch(unittest.TestCase):
+
+    def test_ban_expressions_merge_paths(self):
+        paths = ['/v2/nodes/abcde/', '/v2/nodes/fghij/', '/v2/nodes/abcde/']
+        assert tasks.get_ban_expressions(paths) == ['(/v2/nodes/abcde/|/v2/nodes/fghij/).*']
+        assert tasks.get_ban_expressions(paths[:1]) == ['/v2/nodes/abcde/.*']
+
+    def test_ban_expressions_respect_max_length(self):
+        paths = ['/v2/nodes/{}/'.format(i) for i in range(10, 20)]
+        expressions = tasks.get_ban_expressions(paths, max_length=40)
+        assert len(expressions) > 1
+        assert sorted(sum([e.strip('().*').split('|') for e in expressions], [])) == sorted(paths)
+
+    @mock.patch('api.caching.tasks.send_ban', return_value=True)
+    def test_ban_paths_sends_one_ban_per_server_and_expression(self, mock_send_ban):
+        servers = ['http://varnish-1:8080', 'http://varnish-2:8080']
+        with mock.patch.object(tasks.settings, 'ENABLE_VARNISH', True), \
+                mock.patch.object(tasks.settings, 'VARNISH_SERVERS', servers):
+            tasks.ban_paths(['/v2/nodes/abcde/', '/v2/users/fghij/'], 'api.osf.io')
+        calls = sorted(call[0] for call in mock_send_ban.call_args_list)
+        assert calls == [
+            (server, '(/v2/nodes/abcde/|/v2/users/fghij/).*', 'api.osf.io') for server in servers
+        ]
+
+    @mock.patch('api.caching.tasks.enqueue_postcommit_task')
+    @mock.patch('api.caching.tasks.get_bannable_paths')
+    def test_queued_bans_are_kept_on_the_request(self, mock_paths, mock_enqueue):
+        request = mock.Mock(spec=[])
+        with mock.patch.object(tasks.settings, 'ENABLE_VARNISH', True), \
+                mock.patch('api.caching.tasks.get_current_request', return_value=request):
+            mock_paths.return_value = (['/v2/nodes/abcde/'], 'api.osf.io')
+            tasks.queue_ban(mock.Mock())
+            mock_paths.return_value = (['/v2/nodes/fghij/'], 'api.osf.io')
+            tasks.queue_ban(mock.Mock())
+        pending = getattr(request, tasks.PENDING_BANS_ATTR)
+        assert pending == {'api.osf.io': {'/v2/nodes/abcde/', '/v2/nodes/fghij/'}}
+        mock_enqueue.assert_called_once_with(tasks.flush_bans, (pending, ), {}, celery=False, once_per_request=False)
+
+        with mock.patch('api.caching.tasks.ban_paths') as mock_ban_paths:
+            tasks.flush_bans(pending)
+        mock_ban_paths.assert_called_once_with({'/v2/nodes/abcde/', '/v2/nodes/fghij/'}, 'api.osf.io')
+        assert not pending
@@ -1,4 +1,33 @@
+import functools
+
 from django.core.cache import caches
 from django.conf import settings
+from django.db import transaction
+
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from osf.utils.requests import DummyRequest, get_current_request
 
 storage_usage_cache = caches[settings.STORAGE_USAGE_CACHE_NAME]
+pagination_count_cache = caches[settings.PAGINATION_COUNT_CACHE_NAME]
+PAGINATION_COUNT_KEY = 'pagination_count:{query_hash}'
+cas_profile_cache = caches[settings.CAS_PROFILE_CACHE_NAME]
+waterbutler_config_cache = caches[settings.WATERBUTLER_CONFIG_CACHE_NAME]
+WATERBUTLER_CONFIG_KEY = 'waterbutler_config:{node_id}:{provider}:{generation}'
+waterbutler_config_generation_cache = caches[settings.WATERBUTLER_CONFIG_GENERATION_CACHE_NAME]
+WATERBUTLER_CONFIG_GENERATION_KEY = 'waterbutler_config_generation:{node_id}'
+search_update_cache = caches[settings.SEARCH_UPDATE_CACHE_NAME]
+SEARCH_FILE_TARGET_KEY = 'file_target:{index}:{content_type_id}:{target_id}'
+guid_resolution_cache = caches[settings.GUID_RESOLUTION_CACHE_NAME]
+GUID_RESOLUTION_KEY = 'guid:{guid}'
+citation_cache = caches[settings.CITATION_CACHE_NAME]
+CITATION_KEY = 'citation:{node_id}:{modified}:{version}:{style}'
+
+
+def set_many_after_commit(cache, mapping, timeout):
+    """Writes `mapping` to `cache` once the current transaction has committed, so that writes to a database
+    cache don't hold row locks, or cull the cache table, inside the request's transaction.
+    """
+    if isinstance(get_current_request(), DummyRequest):
+        transaction.on_commit(functools.partial(cache.set_many, mapping, timeout))
+    else:
+        enqueue_postcommit_task(cache.set_many, (mapping, timeout), {}, celery=False, once_per_request=False)
@@ -1,18 +1,33 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import os
 import re
+import threading
+from collections import defaultdict
 from rest_framework import status as http_status
 
 from citeproc import CitationStylesStyle, CitationStylesBibliography
 from citeproc import Citation, CitationItem
 from citeproc import formatter
 from citeproc.source.json import CiteProcJSON
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max
 
+from api.caching.utils import citation_cache, set_many_after_commit, CITATION_KEY
 from framework.exceptions import HTTPError
 from framework.auth import utils
+from osf.models import AbstractNode, Identifier, NodeLog
 from osf.models.citation import CitationStyle
-from website.settings import CITATION_STYLES_PATH, BASE_PATH, CUSTOM_CITATIONS
+from osf.models.mixins import ContributorMixin
+from osf.utils.caching import LRUCache
+from website.settings import (
+    CITATION_STYLES_PATH, BASE_PATH, CUSTOM_CITATIONS,
+    CITATION_CACHE_TIMEOUT, CITATION_STYLE_CACHE_SIZE, CITATION_STYLE_CACHE_TIMEOUT,
+)
+
+# Parsed styles and the locks to hold while rendering with them, by style id
+parsed_style_cache = LRUCache(CITATION_STYLE_CACHE_SIZE, CITATION_STYLE_CACHE_TIMEOUT)
 
 
 def clean_up_common_errors(cit):
@@ -44,35 +59,131 @@ def process_name(node, user):
     }
 
 
-def render_citation(node, style='apa'):
-    """Given a node, return a citation"""
-    reformat_styles = ['apa', 'chicago-author-date', 'modern-language-association']
-    csl = node.csl
-    data = [csl, ]
-
-    bib_source = CiteProcJSON(data)
-
+def parse_style(style):
+    """Parse the CSL style with the given id, or its parent style if it is a dependent style"""
     custom = CUSTOM_CITATIONS.get(style, False)
     path = os.path.join(BASE_PATH, 'static', custom) if custom else os.path.join(CITATION_STYLES_PATH, style)
 
     try:
-        bib_style = CitationStylesStyle(path, validate=False)
+        return CitationStylesStyle(path, validate=False)
     except ValueError:
         citation_style = CitationStyle.load(style)
         if citation_style is not None and citation_style.has_parent_style:
             parent_style = citation_style.parent_style
             parent_path = os.path.join(CITATION_STYLES_PATH, parent_style)
-            bib_style = CitationStylesStyle(parent_path, validate=False)
+            return CitationStylesStyle(parent_path, validate=False)
         else:
             raise ValueError('Unable to find a dependent or independent parent style related to {}.csl'.format(style))
 
-    bibliography = CitationStylesBibliography(bib_style, bib_source, formatter.plain)
 
-    citation = Citation([CitationItem(node._id)])
+def get_style(style):
+    """Return the parsed style for a style id, and a lock to hold while rendering with it; citeproc keeps
+    rendering state on the style. Styles are parsed once per process.
+    """
+    cached = parsed_style_cache.get(style)
+    if cached is None:
+        cached = (parse_style(style), threading.Lock())
+        parsed_style_cache.set(style, cached)
+    return cached
+
+
+def get_citation_versions(nodes):
+    """Fingerprint what each node's citation depends on besides the node itself: its visible contributors and
+    the names they are cited by, its identifiers (e.g. DOIs) and, for projects and registrations, the date of
+    its latest log. None of these bump the node's modified time. Takes one query per kind of contributor, one
+    per content type for identifiers and one for logs. Returns a dict of fingerprints by node _id.
+    """
+    fingerprints = defaultdict(hashlib.sha256)
+    nodes_by_contributor_class = defaultdict(dict)
+    nodes_by_content_type = defaultdict(dict)
+    for node in nodes:
+        field = next(iter(node.contributor_kwargs))
+        nodes_by_contributor_class[(node.contributor_class, field)][node.pk] = node
+        nodes_by_content_type[ContentType.objects.get_for_model(node)][node.pk] = node
+
+    for (contributor_class, field), nodes_by_pk in nodes_by_contributor_class.items():
+        contributors = contributor_class.objects.filter(
+            visible=True, **{'{}_id__in'.format(field): list(nodes_by_pk)}
+        ).order_by('{}_id'.format(field), '_order').values_list('{}_id'.format(field), 'user_id', 'user__modified')
+        for node_pk, user_id, user_modified in contributors:
+            fingerprints[nodes_by_pk[node_pk]._id].update('contributor:{}:{};'.format(user_id, user_modified.isoformat()).encode())
+
+    for content_type, nodes_by_pk in nodes_by_content_type.items():
+        identifiers = Identifier.objects.filter(
+            content_type=content_type, object_id__in=list(nodes_by_pk), deleted__isnull=True,
+        ).order_by('object_id', 'category').values_list('object_id', 'category', 'value')
+        for node_pk, category, value in identifiers:
+            fingerprints[nodes_by_pk[node_pk]._id].update('identifier:{}:{};'.format(category, value).encode())
+
+    # `add_log(save=False)` doesn't save the node, so its last_logged can't be relied on
+    logged_nodes = {node.pk: node for node in nodes if isinstance(node, AbstractNode)}
+    if logged_nodes:
+        latest_logs = NodeLog.objects.filter(
+            node_id__in=list(logged_nodes),
+        ).order_by().values('node_id').annotate(latest=Max('date')).values_list('node_id', 'latest')
+        for node_pk, latest in latest_logs:
+            fingerprints[logged_nodes[node_pk]._id].update('log:{};'.format(latest.isoformat()).encode())
+
+    return {node._id: fingerprints[node._id].hexdigest()[:16] for node in nodes}
+
+
+def render_citation(node, style='apa'):
+    """Given a node, return a citation"""
+    return render_citations([node], [style])[node._id][style]
+
+
+def render_citations(nodes, styles):
+    """Return the citations of each of `nodes` in each of `styles`, as a dict of citations by style by node _id.
+
+    Citations are cached by node, style, the node's modified time and the version of what else its citation
+    depends on (see `get_citation_versions`), and those already cached are fetched together.
+    """
+    cacheable = [node for node in nodes if isinstance(node, ContributorMixin) and node.pk]
+    versions = get_citation_versions(cacheable)
+    keys = {
+        (node._id, style): CITATION_KEY.format(
+            node_id=node._id,
+            modified=node.modified.isoformat(),
+            version=versions[node._id],
+            style=style,
+        )
+        for node in cacheable
+        for style in styles
+    }
+    cached = citation_cache.get_many(list(keys.values())) if keys else {}
+
+    citations = defaultdict(dict)
+    rendered = {}
+    for node in nodes:
+        for style in styles:
+            key = keys.get((node._id, style))
+            if key in cached:
+                citations[node._id][style] = cached[key]
+                continue
+            citations[node._id][style] = _render_citation(node, style)
+            if key:
+                rendered[key] = citations[node._id][style]
+    if rendered:
+        set_many_after_commit(citation_cache, rendered, CITATION_CACHE_TIMEOUT)
+    return dict(citations)
+
+
+def _render_citation(node, style):
+    reformat_styles = ['apa', 'chicago-author-date', 'modern-language-association']
+    csl = node.csl
+    data = [csl, ]
+
+    bib_source = CiteProcJSON(data)
+
+    bib_style, lock = get_style(style)
+    with lock:
+        bibliography = CitationStylesBibliography(bib_style, bib_source, formatter.plain)
+
+        citation = Citation([CitationItem(node._id)])
 
-    bibliography.register(citation)
+        bibliography.register(citation)
 
-    bib = bibliography.bibliography()
+        bib = bibliography.bibliography()
     cit = str(bib[0] if len(bib) else '')
 
     title = csl['title'] if csl else node.csl['title']
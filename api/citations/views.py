@@ -24,6 +24,7 @@ class CitationStyleList(JSONAPIBaseView, generics.ListAPIView, ListFilterMixin):
     pagination_class = NoMaxPageSizePagination
     view_category = 'citations'
     view_name = 'citation-list'
+    replica_safe = True
 
     ordering = ('-modified',)
 
@@ -47,6 +48,7 @@ class CitationStyleDetail(JSONAPIBaseView, generics.RetrieveAPIView):
     serializer_class = CitationSerializer
     view_category = 'citations'
     view_name = 'citation-detail'
+    replica_safe = True
 
     def get_object(self):
         cit = get_object_or_error(CitationStyle, self.kwargs['citation_id'], self.request)
@@ -25,6 +25,7 @@ class LicenseDetail(JSONAPIBaseView, generics.RetrieveAPIView):
     serializer_class = LicenseSerializer
     view_category = 'licenses'
     view_name = 'license-detail'
+    replica_safe = True
     lookup_url_kwarg = 'license_id'
 
     # overrides RetrieveAPIView
@@ -54,6 +55,7 @@ class LicenseList(JSONAPIBaseView, generics.ListAPIView, ListFilterMixin):
     serializer_class = LicenseSerializer
     view_category = 'licenses'
     view_name = 'license-list'
+    replica_safe = True
 
     ordering = ('name', )  # default ordering
 
@@ -19,7 +19,7 @@ from api.base.serializers import (
 from api.base.settings import ADDONS_FOLDER_CONFIGURABLE
 from api.base.utils import (
     absolute_reverse, get_object_or_error,
-    get_user_auth, is_truthy,
+    get_user_auth, grouped_counts, is_truthy,
 )
 from api.base.versioning import get_kebab_snake_case_field
 from api.taxonomies.serializers import TaxonomizableSerializerMixin
@@ -33,11 +33,13 @@ from rest_framework import serializers as ser
 from rest_framework import exceptions
 from addons.base.exceptions import InvalidAuthError, InvalidFolderError
 from addons.osfstorage.models import Region
+from addons.wiki.models import WikiPage
 from osf.exceptions import NodeStateError
 from osf.models import (
     Comment, DraftRegistration, ExternalAccount, Institution,
     RegistrationSchema, AbstractNode, PrivateLink, Preprint,
-    RegistrationProvider, OSFGroup, NodeLicense,
+    RegistrationProvider, OSFGroup, NodeLicense, NodeLog,
+    Contributor, NodeRelation,
 )
 from website.project import new_private_link
 from website.project.model import NodeUpdateError
@@ -619,9 +621,43 @@ class NodeSerializer(TaxonomizableSerializerMixin, JSONAPISerializer):
 
     # TODO: See if we can get the count filters into the filter rather than the serializer.
 
+    bulk_related_counts = {
+        'get_logs_count': 'get_logs_counts',
+        'get_contrib_count': 'get_contrib_counts',
+        'get_pointers_count': 'get_pointers_counts',
+        'get_wiki_page_count': 'get_wiki_page_counts',
+        'get_forks_count': 'get_forks_counts',
+        'get_linked_by_nodes_count': 'get_linked_by_nodes_counts',
+        'get_linked_by_registrations_count': 'get_linked_by_registrations_counts',
+    }
+
     def get_logs_count(self, obj):
         return obj.logs.count()
 
+    def get_logs_counts(self, objs):
+        return grouped_counts(NodeLog.objects.all(), 'node', objs)
+
+    def get_contrib_counts(self, objs):
+        return grouped_counts(Contributor.objects.all(), 'node', objs)
+
+    def get_pointers_counts(self, objs):
+        return grouped_counts(NodeRelation.objects.filter(is_node_link=True), 'parent', objs, distinct_field='child')
+
+    def get_wiki_page_counts(self, objs):
+        return grouped_counts(WikiPage.objects.filter(deleted__isnull=True), 'node', objs)
+
+    def get_forks_counts(self, objs):
+        forks = AbstractNode.objects.exclude(type='osf.registration').exclude(is_deleted=True)
+        return grouped_counts(forks, 'forked_from', objs)
+
+    def get_linked_by_nodes_counts(self, objs):
+        node_links = NodeRelation.objects.filter(is_node_link=True, parent__is_deleted=False, parent__type='osf.node')
+        return grouped_counts(node_links, 'child', objs)
+
+    def get_linked_by_registrations_counts(self, objs):
+        node_links = NodeRelation.objects.filter(is_node_link=True, parent__type='osf.registration', parent__retraction__isnull=True)
+        return grouped_counts(node_links, 'child', objs)
+
     def get_node_count(self, obj):
         """
         Returns the count of a node's direct children that the user has permission to view.
@@ -156,12 +156,24 @@ class NodeMixin(object):
     serializer_class = NodeSerializer
     node_lookup_url_kwarg = 'node_id'
 
+    # Used by JSONAPIBaseView to load the nodes embedded in a page of results in bulk
+    embedded_model = Node
+    embedded_lookup_url_kwarg = 'node_id'
+
+    @classmethod
+    def get_embedded_queryset(cls, node_ids):
+        return Node.objects.filter(
+            guids___id__in=node_ids,
+            is_deleted=False,
+        ).annotate(region=F('addons_osfstorage_node_settings__region___id')).exclude(region=None)
+
     def get_node(self, check_object_permissions=True, node_id=None):
         node = None
 
         if self.kwargs.get('is_embedded') is True:
             # If this is an embedded request, the node might be cached somewhere
-            node = self.request.parents[Node].get(self.kwargs[self.node_lookup_url_kwarg])
+            node_key = self.kwargs[self.node_lookup_url_kwarg]
+            node = self.request.parents[Node].get(node_key) or self.request.prefetched.get(Node, {}).get(node_key)
 
         node_id = node_id or self.kwargs[self.node_lookup_url_kwarg]
         if node is None:
@@ -95,6 +95,14 @@ class UserMixin(object):
     serializer_class = UserSerializer
     user_lookup_url_kwarg = 'user_id'
 
+    # Used by JSONAPIBaseView to load the users embedded in a page of results in bulk
+    embedded_model = OSFUser
+    embedded_lookup_url_kwarg = 'user_id'
+
+    @classmethod
+    def get_embedded_queryset(cls, user_ids):
+        return OSFUser.objects.filter(guids___id__in=user_ids, date_disabled__isnull=True)
+
     def get_user(self, check_permissions=True):
         key = self.kwargs[self.user_lookup_url_kwarg]
         # If Contributor is in self.request.parents,
@@ -120,6 +128,11 @@ class UserMixin(object):
         if self.kwargs.get('is_embedded') is True:
             if key in self.request.parents[OSFUser]:
                 return self.request.parents[OSFUser].get(key)
+            prefetched_user = self.request.prefetched.get(OSFUser, {}).get(key)
+            if prefetched_user is not None:
+                if check_permissions:
+                    self.check_object_permissions(self.request, prefetched_user)
+                return prefetched_user
 
         current_user = self.request.user
 
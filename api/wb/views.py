@@ -100,6 +100,4 @@ class CopyFileMetadataView(FileMetadataView):
     view_name = 'metadata-copy'
 
     def perform_file_action(self, source, destination, name):
-        ret = source.copy_under(destination, name)
-        update_storage_usage(destination.target)
-        return ret
+        return source.copy_under(destination, name)
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
+import mock
+from django.test.utils import override_settings
 from nose.tools import *  # noqa:
 
 from osf_tests import factories
 from tests.base import ApiTestCase
 
 from api.base import settings
-from api.base.pagination import MaxSizePagination
+from api.base.pagination import CountingPaginator, MaxSizePagination
+from api.caching.utils import pagination_count_cache
 
 
 class TestMaxPagination(ApiTestCase):
@@ -54,3 +57,91 @@ class TestJSONAPIPagination(ApiTestCase):
         assert_not_in('meta', links)
         assert_in('total', meta)
         assert_in('per_page', meta)
+
+    def test_cursor_pagination_walks_all_results(self):
+        url = '{}&page[cursor]=&page[size]=4'.format(self.url_version_2_1)
+        seen = []
+        res = self.app.get(url, auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+        assert_is_none(res.json['links']['prev'])
+        assert_is_none(res.json['links']['last'])
+        assert_equal(res.json['meta']['total'], 11)
+        while True:
+            seen.extend(node['id'] for node in res.json['data'])
+            next_link = res.json['links']['next']
+            if not next_link:
+                break
+            res = self.app.get(next_link, auth=self.user.auth)
+        res = self.app.get('{}&page[size]=100'.format(self.url_version_2_1), auth=self.user.auth)
+        assert_equal(seen, [node['id'] for node in res.json['data']])
+
+    def test_cursor_pagination_prev_link(self):
+        url = '{}&page[cursor]=&page[size]=4'.format(self.url_version_2_1)
+        first_page = self.app.get(url, auth=self.user.auth)
+        second_page = self.app.get(first_page.json['links']['next'], auth=self.user.auth)
+        assert_in('page%5Bcursor%5D=', second_page.json['links']['first'])
+        previous_page = self.app.get(second_page.json['links']['prev'], auth=self.user.auth)
+        assert_equal(
+            [node['id'] for node in previous_page.json['data']],
+            [node['id'] for node in first_page.json['data']],
+        )
+
+    def test_cursor_pagination_can_skip_total(self):
+        url = '{}&page[cursor]=&page[total]=false'.format(self.url_version_2_1)
+        res = self.app.get(url, auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+        assert_is_none(res.json['meta']['total'])
+
+    def test_invalid_cursor(self):
+        url = '{}&page[cursor]=notacursor'.format(self.url_version_2_1)
+        res = self.app.get(url, auth=self.user.auth, expect_errors=True)
+        assert_equal(res.status_code, 404)
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_estimated_total_is_flagged(self):
+        with mock.patch.object(CountingPaginator, 'get_estimated_count', return_value=11):
+            res = self.app.get(self.url_version_2_1, auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+        assert_equal(res.json['meta']['total'], 11)
+        assert_true(res.json['meta']['total_is_estimate'])
+        assert_equal(len(res.json['data']), 10)
+        assert_true(res.json['links']['next'])
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_low_estimate_does_not_hide_pages(self):
+        with mock.patch.object(CountingPaginator, 'get_estimated_count', return_value=5):
+            res = self.app.get('{}&page=2'.format(self.url_version_2_1), auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+        assert_equal(len(res.json['data']), 1)
+        assert_equal(res.json['meta']['total'], 11)
+        assert_not_in('total_is_estimate', res.json['meta'])
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_high_estimate_does_not_serve_empty_pages(self):
+        with mock.patch.object(CountingPaginator, 'get_estimated_count', return_value=40):
+            res = self.app.get('{}&page=3'.format(self.url_version_2_1), auth=self.user.auth, expect_errors=True)
+        assert_equal(res.status_code, 404)
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_last_page_replaces_high_estimate(self):
+        with mock.patch.object(CountingPaginator, 'get_estimated_count', return_value=40):
+            res = self.app.get('{}&page=2'.format(self.url_version_2_1), auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+        assert_equal(len(res.json['data']), 1)
+        assert_equal(res.json['meta']['total'], 11)
+        assert_not_in('total_is_estimate', res.json['meta'])
+        assert_is_none(res.json['links']['next'])
+
+    def test_exact_total_is_not_flagged(self):
+        res = self.app.get(self.url_version_2_1, auth=self.user.auth)
+        assert_equal(res.json['meta']['total'], 11)
+        assert_not_in('total_is_estimate', res.json['meta'])
+
+    @override_settings(PAGINATION_COUNT_CACHE_TIMEOUT=60)
+    def test_total_is_cached_per_query(self):
+        pagination_count_cache.clear()
+        self.app.get(self.url_version_2_1, auth=self.user.auth)
+        factories.ProjectFactory(creator=self.user)
+        res = self.app.get(self.url_version_2_1, auth=self.user.auth)
+        assert_equal(res.json['meta']['total'], 11)
+        pagination_count_cache.clear()
@@ -3,6 +3,7 @@ from rest_framework import status as http_status
 import importlib
 import pkgutil
 
+import mock
 import pytest
 from pytz import utc
 from datetime import datetime
@@ -421,6 +422,22 @@ class TestApiBaseSerializers(ApiTestCase):
             "Acceptable values for the related_counts query param are 'true', 'false', or any of the relationship fields; got 'title'"
         )
 
+    def test_bulk_related_counts_on_list_match_detail_counts(self):
+        url = '/{}nodes/{}/children/'.format(API_BASE, self.node._id)
+        child = self.node.nodes[0]
+        child.add_pointer(self.linked_node, auth=factories.Auth(child.creator))
+        with mock.patch.object(NodeSerializer, 'get_pointers_count') as mock_count:
+            res = self.app.get(url, params={'related_counts': 'node_links,contributors'})
+        assert_false(mock_count.called)
+        counts = {
+            node['id']: node['relationships']['node_links']['links']['related']['meta']['count']
+            for node in res.json['data']
+        }
+        assert_equal(counts.pop(child._id), 1)
+        assert_true(all(count == 0 for count in counts.values()))
+        for node in res.json['data']:
+            assert_equal(node['relationships']['contributors']['links']['related']['meta']['count'], 1)
+
 
 @pytest.mark.django_db
 class TestRelationshipField:
@@ -574,6 +591,50 @@ class TestRelationshipField:
         assert_in('/v2/nodes/{}/'.format(node._id), field['related']['href'])
 
 
+@pytest.mark.django_db
+class TestSerializationPlan:
+
+    @pytest.fixture(autouse=True)
+    def clear_plans(self):
+        base_serializers._serialization_plans.clear()
+
+    def test_plan_is_compiled_once_per_page(self):
+        req = make_drf_request_with_version(version='2.0')
+        nodes = [factories.NodeFactory(), factories.NodeFactory()]
+        compile_plan = JSONAPISerializer._compile_serialization_plan
+        with mock.patch.object(JSONAPISerializer, '_compile_serialization_plan', autospec=True, side_effect=compile_plan) as mock_compile:
+            data = TestRelationshipField.BasicNodeSerializer(
+                nodes, many=True, context={'request': req}
+            ).data
+        assert mock_compile.call_count == 1
+        assert [node['id'] for node in data] == [node._id for node in nodes]
+
+    def test_plan_is_shared_across_requests(self):
+        node = factories.NodeFactory()
+        compile_plan = JSONAPISerializer._compile_serialization_plan
+        with mock.patch.object(JSONAPISerializer, '_compile_serialization_plan', autospec=True, side_effect=compile_plan) as mock_compile:
+            for _ in range(2):
+                TestRelationshipField.BasicNodeSerializer(
+                    node, context={'request': make_drf_request_with_version(version='2.0')}
+                ).data
+            assert mock_compile.call_count == 1
+
+            TestRelationshipField.BasicNodeSerializer(
+                node, context={'request': make_drf_request_with_version(version='2.9')}
+            ).data
+            assert mock_compile.call_count == 2
+
+    def test_invalid_embeds_are_reported_for_every_object(self):
+        req = make_drf_request_with_version(version='2.0')
+        node = factories.NodeFactory()
+        serializer = TestRelationshipField.BasicNodeSerializer(
+            context={'request': req, 'embed': {'title': lambda obj: None}}
+        )
+        for _ in range(2):
+            with pytest.raises(base_serializers.api_exceptions.InvalidQueryStringError):
+                serializer.to_representation(node)
+
+
 class TestShowIfVersion(ApiTestCase):
 
     def setUp(self):
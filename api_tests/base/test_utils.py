@@ -3,6 +3,7 @@ from nose.tools import *  # noqa:
 import mock  # noqa
 import unittest
 
+from django.urls import NoReverseMatch
 from rest_framework import fields
 from rest_framework.exceptions import ValidationError
 from api.base import utils as api_utils
@@ -115,3 +116,35 @@ class TestFlaskDjangoIntegration:
             assert_true(
                 False, 'Unexpected Exception from push_status_message when called '
                 'from the v2 API with type "error"')
+
+
+class TestCachedReverse:
+
+    def setup_method(self, method):
+        api_utils._reversed_urls.clear()
+
+    def test_matches_reverse(self):
+        for node_id in ('abcde', 'fghij', '12345', 'ab-cd'):
+            kwargs = {'node_id': node_id, 'version': 'v2'}
+            assert api_utils.cached_reverse('nodes:node-detail', kwargs=kwargs) == api_utils.reverse('nodes:node-detail', kwargs=kwargs)
+
+    def test_runs_resolver_once_per_kwargs(self):
+        api_utils.cached_reverse('nodes:node-detail', kwargs={'node_id': 'abcde', 'version': 'v2'})
+        with mock.patch('api.base.utils.reverse', return_value='/v2/nodes/fghij/') as mock_reverse:
+            assert api_utils.cached_reverse('nodes:node-detail', kwargs={'node_id': 'abcde', 'version': 'v2'}) == '/v2/nodes/abcde/'
+            assert api_utils.cached_reverse('nodes:node-detail', kwargs={'node_id': 'fghij', 'version': 'v2'}) == '/v2/nodes/fghij/'
+        assert mock_reverse.call_count == 1
+
+    def test_values_rejected_by_the_pattern_are_reversed(self):
+        api_utils.cached_reverse('scopes:scope-detail', kwargs={'scope_id': 'users_read', 'version': 'v2'})
+        for _ in range(2):
+            with assert_raises(NoReverseMatch):
+                api_utils.cached_reverse('scopes:scope-detail', kwargs={'scope_id': 'USERS_READ', 'version': 'v2'})
+            with assert_raises(NoReverseMatch):
+                api_utils.cached_reverse('scopes:scope-detail', kwargs={'scope_id': 'users_read', 'version': 'v3'})
+
+    def test_repeated_values_are_reversed(self):
+        kwargs = {'node_id': 'abcde', 'node_link_id': 'abcde', 'version': 'v2'}
+        assert api_utils.cached_reverse('nodes:node-pointer-detail', kwargs=kwargs) == api_utils.reverse('nodes:node-pointer-detail', kwargs=kwargs)
+        kwargs = {'node_id': 'abcde', 'node_link_id': 'fghij', 'version': 'v2'}
+        assert api_utils.cached_reverse('nodes:node-pointer-detail', kwargs=kwargs) == api_utils.reverse('nodes:node-pointer-detail', kwargs=kwargs)
@@ -1,7 +1,9 @@
 import functools
+import mock
 import pytest
 
 from api.base.settings.defaults import API_BASE
+from api.nodes.views import NodeMixin
 from framework.auth.core import Auth
 from osf_tests.factories import (
     ProjectFactory,
@@ -156,3 +158,24 @@ class TestNodeEmbeds:
         res = app.get(url, auth=write_contrib_one.auth)
         assert res.status_code == 200
         assert res.json['data']['embeds']['contributors']['meta']['total_bibliographic'] == 3
+
+    def test_embed_parent_on_list_is_batched(
+            self, app, user, root_node, child_one, child_two):
+        url = '/{}nodes/{}/children/?embed=parent'.format(API_BASE, root_node._id)
+
+        with mock.patch('api.nodes.views.NodeMixin.get_embedded_queryset', wraps=NodeMixin.get_embedded_queryset) as mock_queryset:
+            res = app.get(url, auth=user.auth)
+        assert res.status_code == 200
+        assert mock_queryset.call_count == 1
+        assert mock_queryset.call_args[0][0] == {root_node._id}
+        parents = [node['embeds']['parent']['data']['id'] for node in res.json['data']]
+        assert parents == [root_node._id, root_node._id]
+
+    def test_embed_parent_on_list_still_checks_permissions(
+            self, app, write_contrib_one, child_two, subchild):
+        url = '/{}nodes/?filter[id]={}&embed=parent'.format(API_BASE, subchild._id)
+
+        res = app.get(url, auth=write_contrib_one.auth)
+        assert res.status_code == 200
+        parent = res.json['data'][0]['embeds']['parent']
+        assert parent['errors'][0]['detail'] == exceptions.PermissionDenied.default_detail
@@ -53,6 +53,8 @@ def override_settings():
     website_settings.BCRYPT_LOG_ROUNDS = 1
     # Make sure we don't accidentally send any emails
     website_settings.SENDGRID_API_KEY = None
+    # Make bulk-indexed documents searchable as soon as the request returns
+    website_settings.ELASTIC_BULK_REFRESH = True
     # Set this here instead of in SILENT_LOGGERS, in case developers
     # call setLevel in local.py
     logging.getLogger('website.mails.mails').setLevel(logging.CRITICAL)
@@ -79,10 +81,6 @@ _MOCKS = {
         'mark': 'enable_implicit_clean',
         'replacement': lambda *args, **kwargs: None,
     },
-    'osf.models.base._check_blacklist': {
-        'mark': 'enable_blacklist_check',
-        'replacement': lambda *args, **kwargs: False,
-    },
     'website.search.search.search_engine': {
         'mark': 'enable_search',
         'replacement': mock.MagicMock()
@@ -147,6 +145,14 @@ def _es_marker(request, es6_client):
         yield
 
 
+@pytest.fixture(autouse=True)
+def _clear_local_guid_resolutions():
+    """GUIDs resolved in a test would otherwise stay cached in-process after its transaction is rolled back.
+    """
+    from osf.models.base import local_guid_resolution_cache
+    local_guid_resolution_cache.clear()
+
+
 @pytest.fixture
 def mock_share():
     with mock.patch('api.share.utils.settings.SHARE_ENABLED', True):
@@ -4,6 +4,7 @@ import logging
 
 from framework.celery_tasks import app
 from framework.postcommit_tasks.handlers import run_postcommit
+from website import settings
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +33,31 @@ def update_counter(resource, file, version, action, node_info=None):
     return PageCounter.update_counter(resource, file, version=version, action=action, node_info=node_info)
 
 
+def update_counters(resource, file, versions, action, node_info=None):
+    """Update the counters of several versions of a file for resource at once.
+
+    :param obj resource
+    :param obj file
+    :param list versions: versions to count the action for, None counts it for the file
+    :param str action, ex. 'download'
+    """
+    from osf.models import PageCounter
+    return PageCounter.update_counters(resource, file, versions=versions, action=action, node_info=node_info)
+
+
+@app.task(max_retries=5, default_retry_delay=60)
+def flush_page_counter_events(batch_size=None):
+    """Merge the buffered page counter increments into the counters until none are left"""
+    from osf.models import PageCounter
+    while PageCounter.flush_events(batch_size=batch_size):
+        pass
+
+
+def schedule_page_counter_flush():
+    """Schedule a flush of the buffered page counter increments, once more have been buffered"""
+    flush_page_counter_events.apply_async(countdown=settings.PAGE_COUNTER_FLUSH_DELAY)
+
+
 def get_basic_counters(resource, file, version, action):
     from osf.models import PageCounter
     return PageCounter.get_basic_counters(resource, file, version=version, action=action)
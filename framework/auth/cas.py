@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import furl
+import hashlib
+import uuid
 from rest_framework import status as http_status
 import json
 from future.moves.urllib.parse import quote
@@ -8,6 +10,7 @@ from future.moves.urllib.parse import quote
 from lxml import etree
 import requests
 
+from api.caching.utils import cas_profile_cache
 from framework.auth import authenticate, external_first_login_authenticate
 from framework.auth.core import get_user, generate_verification_key
 from framework.flask import redirect
@@ -43,6 +46,17 @@ class CasTokenError(CasError):
         super(CasTokenError, self).__init__(http_status.HTTP_400_BAD_REQUEST, message)
 
 
+# Profile responses from CAS that mean the token itself is bad, and so are safe to remember
+INVALID_TOKEN_STATUSES = frozenset([
+    http_status.HTTP_400_BAD_REQUEST,
+    http_status.HTTP_401_UNAUTHORIZED,
+    http_status.HTTP_403_FORBIDDEN,
+])
+CAS_PROFILE_KEY = 'profile:{token_hash}'
+# Replaced to drop every cached profile at once, e.g. when all of an application's tokens are revoked
+CAS_PROFILE_GENERATION_KEY = 'generation'
+
+
 class CasResponse(object):
     """A wrapper for an HTTP response returned from CAS."""
 
@@ -124,21 +138,60 @@ class CasClient(object):
         """
         Send request to get profile information, given an access token.
 
+        Profiles are cached per token for ``CAS_PROFILE_CACHE_TIMEOUT`` seconds (or until the token
+        expires, if sooner), and tokens that CAS rejects are remembered for
+        ``CAS_PROFILE_NEGATIVE_CACHE_TIMEOUT`` seconds, so that clients making many requests with
+        the same token do not cause a CAS round trip for each.
+
         :param str access_token: CAS access_token.
         :rtype: CasResponse
         :raises: CasError if an unexpected response is returned.
         """
 
+        cache_key = get_profile_cache_key(access_token)
+        cached = cas_profile_cache.get_many([cache_key, CAS_PROFILE_GENERATION_KEY])
+        generation = cached.get(CAS_PROFILE_GENERATION_KEY)
+        if generation is None:
+            # A generation that was never set, or was culled, starts a new one, so no cached profile is valid
+            cas_profile_cache.add(CAS_PROFILE_GENERATION_KEY, uuid.uuid4().hex, None)
+            generation = cas_profile_cache.get(CAS_PROFILE_GENERATION_KEY)
+        entry = cached.get(cache_key)
+        if entry and entry['generation'] == generation:
+            if entry['status_code'] == 200:
+                return self._parse_profile(entry['content'], access_token)
+            raise CasHTTPError(
+                code=entry['status_code'],
+                message='Unexpected response from CAS server',
+                headers={},
+                content=entry['content'],
+            )
+
         url = self.get_profile_url()
         headers = {
             'Authorization': 'Bearer {}'.format(access_token),
         }
         resp = requests.get(url, headers=headers)
         if resp.status_code == 200:
-            return self._parse_profile(resp.content, access_token)
+            profile = self._parse_profile(resp.content, access_token)
+            timeout = settings.CAS_PROFILE_CACHE_TIMEOUT
+            expires_in = profile.attributes.get('expiresIn')
+            if expires_in is not None:
+                timeout = min(timeout, int(expires_in))
+        elif resp.status_code in INVALID_TOKEN_STATUSES:
+            timeout = settings.CAS_PROFILE_NEGATIVE_CACHE_TIMEOUT
         else:
             self._handle_error(resp)
 
+        if timeout > 0:
+            cas_profile_cache.set(cache_key, {
+                'generation': generation,
+                'status_code': resp.status_code,
+                'content': resp.content,
+            }, timeout)
+        if resp.status_code != 200:
+            self._handle_error(resp)
+        return profile
+
     def _handle_error(self, response, message='Unexpected response from CAS server'):
         """Handle an error response from CAS."""
         raise CasHTTPError(
@@ -179,16 +232,27 @@ class CasClient(object):
         return self.revoke_tokens(payload={'client_id': client_id, 'client_secret': client_secret})
 
     def revoke_tokens(self, payload):
-        """Revoke a tokens based on payload"""
+        """Revoke a tokens based on payload, and forget any profiles cached for them"""
         url = self.get_auth_token_revocation_url()
 
         resp = requests.post(url, data=payload)
         if resp.status_code == 204:
+            if 'token' in payload:
+                cas_profile_cache.delete(get_profile_cache_key(payload['token']))
+            else:
+                # The revoked tokens are not known individually, so invalidate every cached profile
+                cas_profile_cache.set(CAS_PROFILE_GENERATION_KEY, uuid.uuid4().hex, None)
             return True
         else:
             self._handle_error(resp)
 
 
+def get_profile_cache_key(access_token):
+    """Key a cached CAS profile by a hash of the access token, so that tokens are never stored"""
+    token_hash = hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+    return CAS_PROFILE_KEY.format(token_hash=token_hash)
+
+
 def parse_auth_header(header):
     """
     Given an Authorization header string, e.g. 'Bearer abc123xyz',
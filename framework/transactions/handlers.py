@@ -6,8 +6,11 @@ from framework.exceptions import HTTPError
 
 from django.db import transaction
 from flask import request, current_app, has_request_context, _request_ctx_stack
+from rest_framework.permissions import SAFE_METHODS
 from werkzeug.local import LocalProxy
 
+from osf.db.router import allow_replica_reads, REPLICA_SAFE_ATTR
+
 
 LOCK_ERROR_CODE = http_status.HTTP_400_BAD_REQUEST
 NO_AUTO_TRANSACTION_ATTR = '_no_auto_transaction'
@@ -36,10 +39,21 @@ def view_has_annotation(attr):
     return getattr(view, attr, False)
 
 
+def no_auto_transaction_for_request():
+    """Whether the request is handled outside a transaction. GET requests to replica-safe views are, since reads
+    inside a transaction stay on the master database.
+    """
+    if view_has_annotation(NO_AUTO_TRANSACTION_ATTR):
+        return True
+    return view_has_annotation(REPLICA_SAFE_ATTR) and request.method in SAFE_METHODS
+
+
 def transaction_before_request():
     """Setup transaction before handling the request.
     """
-    if view_has_annotation(NO_AUTO_TRANSACTION_ATTR):
+    if view_has_annotation(REPLICA_SAFE_ATTR):
+        allow_replica_reads(request)
+    if no_auto_transaction_for_request():
         return None
     ctx = _request_ctx_stack.top
     atomic = transaction.atomic()
@@ -51,7 +65,7 @@ def transaction_after_request(response, base_status_code_error=500):
     uncaught exception occurred, else commit. If the commit fails due to a lock
     error, rollback and return error response.
     """
-    if view_has_annotation(NO_AUTO_TRANSACTION_ATTR):
+    if no_auto_transaction_for_request():
         return response
     if response.status_code >= base_status_code_error:
         # Construct an error in order to trigger rollback in transaction.atomic().__exit__
@@ -68,7 +82,7 @@ def transaction_teardown_request(error=None):
     reached in debug mode, since uncaught errors are raised for use in the
     Werkzeug debugger.
     """
-    if view_has_annotation(NO_AUTO_TRANSACTION_ATTR):
+    if no_auto_transaction_for_request():
         return
     if error is not None and current_atomic:
         current_atomic.__exit__(error.__class__, error, None)
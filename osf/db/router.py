@@ -1,5 +1,38 @@
+import logging
+import random
+import threading
+import time
+
 from django.conf import settings
+from django.db import connections
 import psycopg2
+from rest_framework.permissions import SAFE_METHODS
+
+from osf.utils.requests import DummyRequest, get_current_request
+
+logger = logging.getLogger(__name__)
+
+# Set on views whose GET requests may read from a replica
+REPLICA_SAFE_ATTR = '_replica_safe'
+# Set on requests whose reads may go to a replica, and on requests that have written and must stay on the master
+USE_REPLICA_ATTR = '_db_use_replica'
+PINNED_TO_MASTER_ATTR = '_db_pinned_to_master'
+# The replica a request reads from, once chosen
+REQUEST_REPLICA_ATTR = '_db_replica'
+
+
+def replica_safe(view):
+    """Mark a Flask view as safe to serve GET requests from a read replica: it only reads, and tolerates data up
+    to DATABASE_REPLICA_MAX_LAG seconds stale. API views set `replica_safe = True` instead.
+    """
+    setattr(view, REPLICA_SAFE_ATTR, True)
+    return view
+
+
+def allow_replica_reads(request):
+    """Let the reads of a request to a replica-safe view go to a replica, until it writes"""
+    if request.method in SAFE_METHODS:
+        setattr(request, USE_REPLICA_ATTR, True)
 
 
 class PostgreSQLFailoverRouter(object):
@@ -7,9 +40,25 @@ class PostgreSQLFailoverRouter(object):
     A custom database router that loops through the databases defined in django.conf.settings.DATABASES and returns the
     first one that is not read only. If it finds none that are writable it calls exit() in order to convince docker
     to restart the container.
+
+    The other databases that are in recovery are used as read replicas, by requests to replica-safe views only. A
+    request reads from one healthy replica until it writes or opens a transaction, after which it stays on the master.
+    Replicas are health-checked and their lag measured every DATABASE_REPLICA_CHECK_INTERVAL seconds.
     """
     DSNS = dict()
     CACHED_MASTER = None
+    # Replication lag in seconds of each replica by name, None for those that could not be checked
+    REPLICA_LAGS = dict()
+    REPLICAS_CHECKED = None
+    _replica_check_lock = threading.Lock()
+
+    # The lag is 0 when all received WAL has been replayed, since the last replayed transaction may just be old
+    REPLICA_LAG_SQL = """
+        SELECT pg_is_in_recovery(),
+            CASE WHEN pg_last_xlog_receive_location() = pg_last_xlog_replay_location() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            END;
+    """
 
     def __init__(self):
         """
@@ -50,13 +99,83 @@ class PostgreSQLFailoverRouter(object):
                 raise Exception('PostgreSQLFailoverRouter only works with PostgreSQL... ... ...')
             self.DSNS[name] = template.format(**db)
 
-    def _get_conn(self, dsn):
+    def _get_conn(self, dsn, **kwargs):
         """
         Returns a psycopg2 connection for a DSN
         :param dsn: postgres DSN
         :return: psycopg2 connection
         """
-        return psycopg2.connect(dsn)
+        return psycopg2.connect(dsn, **kwargs)
+
+    def _check_replicas(self):
+        """
+        Measures the replication lag of every database other than the master
+        :return: :dict: lag in seconds by name of database config, None for those unreachable or not in recovery
+        """
+        lags = {}
+        for name, dsn in self.DSNS.items():
+            if name == self.CACHED_MASTER:
+                continue
+            lags[name] = None
+            try:
+                conn = self._get_conn(dsn, connect_timeout=settings.DATABASE_REPLICA_CONNECT_TIMEOUT)
+            except psycopg2.Error:
+                logger.warning('Database replica {} is unreachable'.format(name))
+                continue
+            try:
+                cur = conn.cursor()
+                cur.execute(self.REPLICA_LAG_SQL)
+                in_recovery, lag = cur.fetchone()
+                cur.close()
+            except psycopg2.Error:
+                logger.warning('Could not measure the lag of database replica {}'.format(name))
+                continue
+            finally:
+                conn.close()
+            if not in_recovery:
+                logger.warning('Database {} is writable but is not the master'.format(name))
+                continue
+            lags[name] = float(lag or 0)
+            if lags[name] > settings.DATABASE_REPLICA_MAX_LAG:
+                logger.warning('Database replica {} is {:.1f}s behind'.format(name, lags[name]))
+        return lags
+
+    def _get_replica(self):
+        """
+        Returns a healthy replica whose lag is within DATABASE_REPLICA_MAX_LAG, rechecking the replicas if they are due
+        :return: :str: name of database config or None
+        """
+        cls = type(self)
+        if len(self.DSNS) < 2:
+            return None
+        due = cls.REPLICAS_CHECKED is None or time.monotonic() - cls.REPLICAS_CHECKED >= settings.DATABASE_REPLICA_CHECK_INTERVAL
+        # Threads that find a check already running use the previous results
+        if due and cls._replica_check_lock.acquire(blocking=False):
+            try:
+                cls.REPLICA_LAGS = self._check_replicas()
+                cls.REPLICAS_CHECKED = time.monotonic()
+            finally:
+                cls._replica_check_lock.release()
+        healthy = [
+            name for name, lag in cls.REPLICA_LAGS.items()
+            if lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+        ]
+        return random.choice(healthy) if healthy else None
+
+    def _get_request_replica(self):
+        """
+        Returns the replica the current request reads from, if it may read from one
+        :return: :str: name of database config or None
+        """
+        request = get_current_request()
+        if not getattr(request, USE_REPLICA_ATTR, False) or getattr(request, PINNED_TO_MASTER_ATTR, False):
+            return None
+        # Reads inside a transaction must see its writes
+        if connections[self.CACHED_MASTER].in_atomic_block:
+            return None
+        if not hasattr(request, REQUEST_REPLICA_ATTR):
+            setattr(request, REQUEST_REPLICA_ATTR, self._get_replica())
+        return getattr(request, REQUEST_REPLICA_ATTR)
 
     def db_for_read(self, model, **hints):
         """
@@ -67,22 +186,29 @@ class PostgreSQLFailoverRouter(object):
         """
         if not self.CACHED_MASTER:
             exit()
-        return self.CACHED_MASTER
+        return self._get_request_replica() or self.CACHED_MASTER
 
     def db_for_write(self, model, **hints):
         """
-        Returns a django database connection name for writing or kills itself
+        Returns a django database connection name for writing or kills itself. The current request reads from the
+        master from then on.
         :param model: django model (disused)
         :param hints: hints to help choosing a database (disused)
         :return:
         """
         if not self.CACHED_MASTER:
             exit()
+        request = get_current_request()
+        if not isinstance(request, DummyRequest):
+            setattr(request, PINNED_TO_MASTER_ATTR, True)
         return self.CACHED_MASTER
 
     def allow_relation(self, obj1, obj2, **hints):
-        # None if the router has no opinion
+        # Replicas hold the same data as the master, so objects read from either may be related
         # https://docs.djangoproject.com/en/1.10/topics/db/multi-db/#allow_relation
+        if obj1._state.db in self.DSNS and obj2._state.db in self.DSNS:
+            return True
+        # None if the router has no opinion
         return None
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
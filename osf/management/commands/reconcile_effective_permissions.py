@@ -0,0 +1,30 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from framework.celery_tasks import app as celery_app
+from osf.models import NodeEffectivePermission
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name='management.commands.reconcile_effective_permissions')
+def reconcile_effective_permissions(batch_size=None):
+    """Refresh the effective permissions of every node that has drifted from its permission tables, e.g.
+    because the process making a change died before refreshing them
+    """
+    batch_size = batch_size or settings.EFFECTIVE_PERMISSION_RECONCILE_BATCH_SIZE
+    refreshed = NodeEffectivePermission.reconcile(batch_size)
+    if refreshed:
+        logger.warning('Refreshed the effective permissions of {} nodes that had drifted'.format(refreshed))
+    return refreshed
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=None, help='number of node ids compared at once')
+
+    def handle(self, *args, **options):
+        reconcile_effective_permissions(batch_size=options['batch_size'])
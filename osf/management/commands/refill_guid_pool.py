@@ -0,0 +1,53 @@
+import logging
+
+import waffle
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from elasticsearch.exceptions import ConnectionError
+
+from framework import sentry
+from framework.celery_tasks import app as celery_app
+from osf import features
+from osf.metrics import GuidPoolMetrics
+from osf.models import ReservedGuid
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name='management.commands.refill_guid_pool')
+def refill_guid_pool(size=None, batch_size=None):
+    """Top the pool of reserved GUIDs up to `size`, reserving at most `batch_size` per query"""
+    size = size or settings.GUID_POOL_SIZE
+    batch_size = batch_size or settings.GUID_POOL_REFILL_BATCH_SIZE
+
+    depth_before = ReservedGuid.objects.count()
+    refilled = 0
+    while depth_before + refilled < size:
+        reserved = ReservedGuid.refill(min(batch_size, size - depth_before - refilled))
+        if not reserved:
+            # Every candidate was taken; the pooled GUID length is running out of room
+            logger.warning('Could not reserve any more GUIDs')
+            break
+        refilled += reserved
+
+    logger.info('Reserved {} GUIDs, {} in the pool'.format(refilled, depth_before + refilled))
+    if waffle.switch_is_active(features.ELASTICSEARCH_METRICS):
+        try:
+            GuidPoolMetrics.record(
+                depth_before=depth_before,
+                depth_after=depth_before + refilled,
+                refilled_count=refilled,
+            )
+        except ConnectionError:
+            sentry.log_exception()
+    return refilled
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=None, help='number of reserved GUIDs to top the pool up to')
+        parser.add_argument('--batch_size', type=int, default=None, help='GUIDs reserved per query')
+
+    def handle(self, *args, **options):
+        refill_guid_pool(size=options['size'], batch_size=options['batch_size'])
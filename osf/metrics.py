@@ -325,3 +325,41 @@ class InstitutionProjectCounts(MetricMixin, metrics.Metric):
         response = search.execute()
         if response:
             return response[0]
+
+
+class GuidPoolMetrics(MetricMixin, metrics.Metric):
+    """Recorded every time `osf.management.commands.refill_guid_pool` runs"""
+    # Reserved GUIDs left before and after refilling
+    depth_before = metrics.Integer(index=True, doc_values=True, required=True)
+    depth_after = metrics.Integer(index=True, doc_values=True, required=True)
+    refilled_count = metrics.Integer(index=True, doc_values=True, required=True)
+
+    class Index:
+        settings = {
+            'number_of_shards': 1,
+            'number_of_replicas': 1,
+            'refresh_interval': '1s',
+        }
+
+    class Meta:
+        source = metrics.MetaField(enabled=True)
+
+
+class SearchUpdateQueueMetrics(MetricMixin, metrics.Metric):
+    """Recorded for every batch of queued search updates indexed by `website.search.elastic_search.flush_search_updates`"""
+    flushed_count = metrics.Integer(index=True, doc_values=True, required=True)
+    # Updates still waiting once the batch is indexed
+    queue_depth = metrics.Integer(index=True, doc_values=True, required=True)
+    # Milliseconds between the batch's updates being first queued and being indexed
+    max_lag = metrics.Integer(index=True, doc_values=True, required=True)
+    mean_lag = metrics.Integer(index=True, doc_values=True, required=True)
+
+    class Index:
+        settings = {
+            'number_of_shards': 1,
+            'number_of_replicas': 1,
+            'refresh_interval': '1s',
+        }
+
+    class Meta:
+        source = metrics.MetaField(enabled=True)
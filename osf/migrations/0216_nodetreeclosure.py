@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-08-14 15:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POPULATE_CLOSURE_SQL = """
+    INSERT INTO osf_nodetreeclosure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE closure (ancestor_id, descendant_id, depth, path) AS (
+        SELECT parent_id, child_id, 1, ARRAY[parent_id, child_id]
+        FROM osf_noderelation
+        WHERE is_node_link IS FALSE AND parent_id <> child_id
+      UNION ALL
+        SELECT C.ancestor_id, R.child_id, C.depth + 1, C.path || R.child_id
+        FROM closure AS C
+            JOIN osf_noderelation AS R ON R.parent_id = C.descendant_id
+        WHERE R.is_node_link IS FALSE AND NOT R.child_id = ANY(C.path)
+    ) SELECT ancestor_id, descendant_id, MIN(depth)
+    FROM closure
+    GROUP BY ancestor_id, descendant_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0215_nodestorageusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeTreeClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.AbstractNode')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.AbstractNode')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='nodetreeclosure',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='nodetreeclosure',
+            index_together=set([('descendant', 'depth')]),
+        ),
+        migrations.RunSQL(POPULATE_CLOSURE_SQL, migrations.RunSQL.noop),
+    ]
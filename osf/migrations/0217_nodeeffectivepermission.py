@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-08-18 13:47
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POPULATE_EFFECTIVE_PERMISSIONS_SQL = """
+    INSERT INTO osf_nodeeffectivepermission (user_id, node_id, permission, is_implicit)
+        SELECT UG.osfuser_id, G.content_object_id, P.codename, FALSE
+        FROM osf_nodegroupobjectpermission AS G
+            JOIN auth_permission AS P ON P.id = G.permission_id
+            JOIN osf_osfuser_groups AS UG ON UG.group_id = G.group_id
+        WHERE P.codename IN ('read_node', 'write_node', 'admin_node')
+      UNION
+        SELECT U.user_id, U.content_object_id, P.codename, FALSE
+        FROM osf_nodeuserobjectpermission AS U
+            JOIN auth_permission AS P ON P.id = U.permission_id
+        WHERE P.codename IN ('read_node', 'write_node', 'admin_node')
+      UNION
+        SELECT UG.osfuser_id, C.descendant_id, 'read_node', TRUE
+        FROM osf_nodetreeclosure AS C
+            JOIN osf_abstractnode AS N ON N.id = C.ancestor_id
+            JOIN osf_nodegroupobjectpermission AS G ON G.content_object_id = C.ancestor_id
+            JOIN auth_permission AS P ON P.id = G.permission_id
+            JOIN osf_osfuser_groups AS UG ON UG.group_id = G.group_id
+        WHERE N.type = 'osf.node' AND P.codename = 'admin_node';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0216_nodetreeclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeEffectivePermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('permission', models.CharField(max_length=31)),
+                ('is_implicit', models.BooleanField(default=False)),
+                ('node', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.AbstractNode')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='nodeeffectivepermission',
+            unique_together=set([('node', 'user', 'permission', 'is_implicit')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='nodeeffectivepermission',
+            index_together=set([('user', 'permission', 'node')]),
+        ),
+        migrations.RunSQL(POPULATE_EFFECTIVE_PERMISSIONS_SQL, migrations.RunSQL.noop),
+    ]
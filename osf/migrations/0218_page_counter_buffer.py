@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-08-20 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0217_nodeeffectivepermission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCounterDailyCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('unique', models.PositiveIntegerField(default=0)),
+                ('page_counter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_counts', to='osf.PageCounter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PageCounterEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.CharField(max_length=300)),
+                ('version', models.IntegerField(blank=True, null=True)),
+                ('action', models.CharField(max_length=128)),
+                ('date', models.DateField()),
+                ('total', models.PositiveSmallIntegerField(default=0)),
+                ('unique', models.PositiveSmallIntegerField(default=0)),
+                ('daily_unique', models.PositiveSmallIntegerField(default=0)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.BaseFileNode')),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.Guid')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='pagecounterdailycount',
+            unique_together=set([('page_counter', 'date')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-08-24 14:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import osf.utils.datetime_aware_jsonfield
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0218_page_counter_buffer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivetarget',
+            name='files_listed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivetarget',
+            name='folders_listed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ArchiveFolderListing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.TextField()),
+                ('children', osf.utils.datetime_aware_jsonfield.DateTimeAwareJSONField(blank=True, default=list, encoder=osf.utils.datetime_aware_jsonfield.DateTimeAwareJSONEncoder)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='folder_listings', to='osf.ArchiveTarget')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivefolderlisting',
+            unique_together=set([('target', 'path')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-08-26 09:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import osf.utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0219_archive_folder_listings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedSearchUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=31)),
+                ('object_id', models.PositiveIntegerField()),
+                ('index_name', models.CharField(blank=True, default='', max_length=255)),
+                ('first_queued', osf.utils.fields.NonNaiveDateTimeField()),
+                ('last_queued', osf.utils.fields.NonNaiveDateTimeField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='queuedsearchupdate',
+            unique_together=set([('doc_type', 'object_id', 'index_name')]),
+        ),
+    ]
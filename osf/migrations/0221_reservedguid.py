@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-09-02 14:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import osf.utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0220_queuedsearchupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservedGuid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('_id', osf.utils.fields.LowercaseCharField(max_length=255, unique=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-09-08 10:21
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Effective permissions only come from group permissions, like has_permission; drop the rows
+# that were only granted by direct guardian user permissions
+DELETE_USER_PERMISSION_ROWS_SQL = """
+    DELETE FROM osf_nodeeffectivepermission AS E
+    WHERE NOT E.is_implicit
+    AND EXISTS (
+        SELECT 1 FROM osf_nodeuserobjectpermission AS U
+        WHERE U.content_object_id = E.node_id AND U.user_id = E.user_id
+    ) AND NOT EXISTS (
+        SELECT 1 FROM osf_nodegroupobjectpermission AS G
+            JOIN auth_permission AS P ON P.id = G.permission_id
+            JOIN osf_osfuser_groups AS UG ON UG.group_id = G.group_id
+        WHERE G.content_object_id = E.node_id AND UG.osfuser_id = E.user_id AND P.codename = E.permission
+    );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0221_reservedguid'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DELETE_USER_PERMISSION_ROWS_SQL, migrations.RunSQL.noop),
+    ]
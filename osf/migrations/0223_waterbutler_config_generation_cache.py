@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-09-08 15:02
+from __future__ import unicode_literals
+from django.db import migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('osf', '0222_effective_permissions_without_user_permissions'),
+    ]
+    operations = [
+        migrations.RunSQL([
+            """
+            CREATE TABLE "{}" (
+                "cache_key" varchar(255) NOT NULL PRIMARY KEY,
+                "value" text NOT NULL,
+                "expires" timestamp with time zone NOT NULL
+            );
+            """.format(settings.CACHES[settings.WATERBUTLER_CONFIG_GENERATION_CACHE_NAME]['LOCATION'])
+        ], [
+            """DROP TABLE "{}"; """.format(settings.CACHES[settings.WATERBUTLER_CONFIG_GENERATION_CACHE_NAME]['LOCATION'])
+        ])
+    ]
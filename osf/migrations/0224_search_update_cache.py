@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-09-10 14:21
+from __future__ import unicode_literals
+from django.db import migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('osf', '0223_waterbutler_config_generation_cache'),
+    ]
+    operations = [
+        migrations.RunSQL([
+            """
+            CREATE TABLE "{}" (
+                "cache_key" varchar(255) NOT NULL PRIMARY KEY,
+                "value" text NOT NULL,
+                "expires" timestamp with time zone NOT NULL
+            );
+            """.format(settings.CACHES[settings.SEARCH_UPDATE_CACHE_NAME]['LOCATION']),
+            # Entries for this cache were kept in the shared cache table
+            """DELETE FROM "osf_cache_table" WHERE "cache_key" LIKE 'search_update:%'; """
+        ], [
+            """DROP TABLE "{}"; """.format(settings.CACHES[settings.SEARCH_UPDATE_CACHE_NAME]['LOCATION'])
+        ])
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-09-10 15:40
+from __future__ import unicode_literals
+from django.db import migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('osf', '0225_citation_cache'),
+    ]
+    operations = [
+        migrations.RunSQL([
+            """
+            CREATE TABLE "{}" (
+                "cache_key" varchar(255) NOT NULL PRIMARY KEY,
+                "value" text NOT NULL,
+                "expires" timestamp with time zone NOT NULL
+            );
+            """.format(settings.CACHES[settings.GUID_RESOLUTION_CACHE_NAME]['LOCATION']),
+            # Entries for this cache were kept in the shared cache table
+            """DELETE FROM "osf_cache_table" WHERE "cache_key" LIKE 'guid_resolution:%'; """
+        ], [
+            """DROP TABLE "{}"; """.format(settings.CACHES[settings.GUID_RESOLUTION_CACHE_NAME]['LOCATION'])
+        ])
+    ]
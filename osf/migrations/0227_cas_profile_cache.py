@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-09-11 10:12
+from __future__ import unicode_literals
+from django.db import migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('osf', '0226_guid_resolution_cache'),
+    ]
+    operations = [
+        migrations.RunSQL([
+            """
+            CREATE TABLE "{}" (
+                "cache_key" varchar(255) NOT NULL PRIMARY KEY,
+                "value" text NOT NULL,
+                "expires" timestamp with time zone NOT NULL
+            );
+            """.format(settings.CACHES[settings.CAS_PROFILE_CACHE_NAME]['LOCATION']),
+            # Entries for this cache were kept in the shared cache table
+            """DELETE FROM "osf_cache_table" WHERE "cache_key" LIKE 'cas_profile:%'; """
+        ], [
+            """DROP TABLE "{}"; """.format(settings.CACHES[settings.CAS_PROFILE_CACHE_NAME]['LOCATION'])
+        ])
+    ]
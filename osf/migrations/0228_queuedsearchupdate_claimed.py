@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.28 on 2020-09-11 13:26
+from __future__ import unicode_literals
+
+from django.db import migrations
+import osf.utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0227_cas_profile_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedsearchupdate',
+            name='claimed',
+            field=osf.utils.fields.NonNaiveDateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,12 +1,12 @@
 from osf.models.metaschema import RegistrationSchemaBlock, RegistrationSchema, FileMetadataSchema  # noqa
-from osf.models.base import Guid, BlackListGuid  # noqa
+from osf.models.base import Guid, BlackListGuid, ReservedGuid  # noqa
 from osf.models.user import OSFUser, Email  # noqa
 from osf.models.contributor import Contributor, RecentlyAddedContributor, PreprintContributor, DraftRegistrationContributor  # noqa
 from osf.models.session import Session  # noqa
 from osf.models.institution import Institution  # noqa
 from osf.models.collection import CollectionSubmission, Collection  # noqa
 from osf.models.draft_node import DraftNode  # noqa
-from osf.models.node import AbstractNode, Node  # noqa
+from osf.models.node import AbstractNode, Node, NodeEffectivePermission  # noqa
 from osf.models.sanctions import Sanction, Embargo, Retraction, RegistrationApproval, DraftRegistrationApproval, EmbargoTerminationApproval  # noqa
 from osf.models.registrations import Registration, DraftRegistrationLog, DraftRegistration  # noqa
 from osf.models.nodelog import NodeLog  # noqa
@@ -15,8 +15,9 @@ from osf.models.tag import Tag  # noqa
 from osf.models.comment import Comment  # noqa
 from osf.models.conference import Conference, MailRecord  # noqa
 from osf.models.citation import CitationStyle  # noqa
-from osf.models.archive import ArchiveJob, ArchiveTarget  # noqa
+from osf.models.archive import ArchiveJob, ArchiveTarget, ArchiveFolderListing  # noqa
 from osf.models.queued_mail import QueuedMail  # noqa
+from osf.models.queued_search_update import QueuedSearchUpdate  # noqa
 from osf.models.external import ExternalAccount, ExternalProvider  # noqa
 from osf.models.oauth import ApiOAuth2Application, ApiOAuth2PersonalToken, ApiOAuth2Scope  # noqa
 from osf.models.osf_group import OSFGroup  # noqa
@@ -37,8 +38,8 @@ from osf.models.files import (  # noqa
     FileVersion, TrashedFile, TrashedFileNode, TrashedFolder, FileVersionUserMetadata,  # noqa
 )  # noqa
 from osf.models.metadata import FileMetadataRecord  # noqa
-from osf.models.node_relation import NodeRelation  # noqa
-from osf.models.analytics import UserActivityCounter, PageCounter  # noqa
+from osf.models.node_relation import NodeRelation, NodeTreeClosure  # noqa
+from osf.models.analytics import UserActivityCounter, PageCounter, PageCounterDailyCount, PageCounterEvent  # noqa
 from osf.models.admin_profile import AdminProfile  # noqa
 from osf.models.admin_log_entry import AdminLogEntry  # noqa
 from osf.models.maintenance_state import MaintenanceState  # noqa
@@ -47,7 +48,7 @@ from osf.models.quickfiles import QuickFilesNode  # noqa
 from osf.models.dismissed_alerts import DismissedAlert  # noqa
 from osf.models.action import ReviewAction  # noqa
 from osf.models.action import NodeRequestAction, PreprintRequestAction, ReviewAction  # noqa
-from osf.models.storage import ProviderAssetFile  # noqa
+from osf.models.storage import ProviderAssetFile, NodeStorageUsage  # noqa
 from osf.models.chronos import ChronosJournal, ChronosSubmission  # noqa
 from osf.models.blacklisted_email_domain import BlacklistedEmailDomain  # noqa
 from osf.models.brand import Brand  # noqa
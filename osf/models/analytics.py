@@ -1,14 +1,18 @@
+import json
 import logging
+from collections import defaultdict
 
 from dateutil import parser
-from django.db import models, transaction
-from django.db.models import Sum
+from django.db import models, transaction, connection
+from django.db.models import F, Sum
 from django.db.models.expressions import RawSQL
 from django.utils import timezone
 
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
 from framework.sessions import session
 from osf.models.base import BaseModel, Guid
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
+from website import settings
 
 logger = logging.getLogger(__name__)
 
@@ -29,29 +33,35 @@ class UserActivityCounter(BaseModel):
         except cls.DoesNotExist:
             return 0
 
+    # Upserts the counter in a single statement, so concurrent increments don't have to lock it for a read-modify-write
+    INCREMENT_SQL = """
+        INSERT INTO {table} (_id, total, action, date, created, modified)
+        VALUES (%(user_id)s, 1, %(new_action)s::jsonb, %(new_date)s::jsonb, now(), now())
+        ON CONFLICT (_id) DO UPDATE SET
+            total = {table}.total + 1,
+            action = {table}.action || jsonb_build_object(%(action)s::text, jsonb_build_object(
+                'total', COALESCE(({table}.action #>> ARRAY[%(action)s, 'total'])::int, 0) + 1,
+                'date', COALESCE({table}.action #> ARRAY[%(action)s, 'date'], '{{}}'::jsonb) || jsonb_build_object(
+                    %(date)s::text, COALESCE(({table}.action #>> ARRAY[%(action)s, 'date', %(date)s])::int, 0) + 1
+                )
+            )),
+            date = {table}.date || jsonb_build_object(%(date)s::text, jsonb_build_object(
+                'total', COALESCE(({table}.date #>> ARRAY[%(date)s, 'total'])::int, 0) + 1
+            )),
+            modified = now();
+    """
+
     @classmethod
     def increment(cls, user_id, action, date_string):
         date = parser.parse(date_string).strftime('%Y/%m/%d')
-        with transaction.atomic():
-            # select_for_update locks the row but only inside a transaction
-            uac, created = cls.objects.select_for_update().get_or_create(_id=user_id)
-            if uac.total > 0:
-                uac.total += 1
-            else:
-                uac.total = 1
-            if action in uac.action:
-                uac.action[action]['total'] += 1
-                if date in uac.action[action]['date']:
-                    uac.action[action]['date'][date] += 1
-                else:
-                    uac.action[action]['date'][date] = 1
-            else:
-                uac.action[action] = dict(total=1, date={date: 1})
-            if date in uac.date:
-                uac.date[date]['total'] += 1
-            else:
-                uac.date[date] = dict(total=1)
-            uac.save()
+        with connection.cursor() as cursor:
+            cursor.execute(cls.INCREMENT_SQL.format(table=cls._meta.db_table), {
+                'user_id': user_id,
+                'action': action,
+                'date': date,
+                'new_action': json.dumps({action: dict(total=1, date={date: 1})}),
+                'new_date': json.dumps({date: dict(total=1)}),
+            })
         return True
 
 
@@ -75,7 +85,7 @@ class PageCounter(BaseModel):
     def get_all_downloads_on_date(cls, date):
         """
         Queries the total number of downloads on a date
-        :param str date: must be formatted the same as a page counter key so 'yyyy/mm/dd'
+        :param datetime date: the date to sum the downloads of
         :return: long sum:
         """
         formatted_date = date.strftime('%Y/%m/%d')
@@ -86,7 +96,16 @@ class PageCounter(BaseModel):
         # aggregating the sum.
         daily_total = page_counters.annotate(daily_total=RawSQL("((date->%s->>'total')::int)", (formatted_date,))).aggregate(sum=Sum('daily_total'))['sum']
 
-        return daily_total
+        # Counts are no longer written to the `date` field, newer ones are in PageCounterDailyCount
+        daily_counts_total = PageCounterDailyCount.objects.filter(
+            date=date.strftime('%Y-%m-%d'),
+            page_counter__version__isnull=True,
+            page_counter__action='download',
+        ).aggregate(sum=Sum('total'))['sum']
+
+        if daily_total is None and daily_counts_total is None:
+            return None
+        return (daily_total or 0) + (daily_counts_total or 0)
 
     @staticmethod
     def clean_page(page):
@@ -97,7 +116,10 @@ class PageCounter(BaseModel):
         )
 
     @classmethod
-    def update_counter(cls, resource, file, version, action, node_info):
+    def build_event(cls, resource, file, version, action, node_info):
+        """Records a visit to the page in the session and returns the increments to its counter,
+        as an unsaved PageCounterEvent
+        """
         if version is not None:
             page = '{0}:{1}:{2}:{3}'.format(action, resource._id, file._id, version)
         else:
@@ -107,71 +129,109 @@ class PageCounter(BaseModel):
         date = timezone.now()
         date_string = date.strftime('%Y/%m/%d')
         visited_by_date = session.data.get('visited_by_date', {'date': date_string, 'pages': []})
+        event = PageCounterEvent(
+            page=cleaned_page,
+            resource=resource,
+            file=file,
+            version=version,
+            action=action,
+            date=date.date(),
+        )
+
+        # if they haven't visited something today, set their visited by date to blank
+        if date_string != visited_by_date['date']:
+            visited_by_date['date'] = date_string
+            visited_by_date['pages'] = []
+        # if they haven't visited this page today, they're a unique visitor for today
+        if cleaned_page not in visited_by_date['pages']:
+            event.daily_unique = 1
+
+        # update their sessions
+        visited_by_date['pages'].append(cleaned_page)
+        session.data['visited_by_date'] = visited_by_date
+
+        # if a download counter is being updated, only count it towards the totals
+        # if the user who is downloading isn't a contributor to the project
+        page_type = cleaned_page.split(':')[0]
+        if page_type in ('download', 'view') and node_info:
+            if node_info['contributors'].filter(guids___id__isnull=False, guids___id=session.data.get('auth_user_id')).exists():
+                return event
+
+        visited = session.data.get('visited', [])
+        if page not in visited:
+            event.unique = 1
+            visited.append(page)
+            session.data['visited'] = visited
+
+        session.save()
+        event.total = 1
+        return event
+
+    @classmethod
+    def update_counters(cls, resource, file, versions, action, node_info):
+        """Buffers a visit to the counters of each of `versions` of `file`. Doesn't lock any counter,
+        the visits are merged into the counters by `flush_events` shortly after.
+
+        Only a visit buffered while the buffer was empty schedules a flush, which merges the visits buffered
+        until it runs, so there is one flush per `PAGE_COUNTER_FLUSH_DELAY` seconds rather than per request.
+        The periodic flush picks up any visits a scheduled flush missed.
+        """
+        from framework.analytics import schedule_page_counter_flush
+
+        buffer_was_empty = not PageCounterEvent.objects.exists()
+        PageCounterEvent.objects.bulk_create([
+            cls.build_event(resource, file, version, action, node_info) for version in versions
+        ])
+        if buffer_was_empty:
+            enqueue_postcommit_task(schedule_page_counter_flush, (), {}, celery=False)
+
+    @classmethod
+    def update_counter(cls, resource, file, version, action, node_info):
+        cls.update_counters(resource, file, [version], action, node_info)
+
+    @classmethod
+    def flush_events(cls, batch_size=None):
+        """Merges buffered PageCounterEvents into their counters in bulk. Returns the number of events merged.
+        Events locked by a concurrent flush are skipped.
+        """
+        batch_size = batch_size or settings.PAGE_COUNTER_FLUSH_BATCH_SIZE
         with transaction.atomic():
-            # Temporary backwards compat - when creating new PageCounters, temporarily keep writing to _id field.
-            # After we're sure this is stable, we can stop writing to the _id field, and query on
-            # resource/file/action/version
-            model_instance, created = cls.objects.select_for_update().get_or_create(
-                _id=cleaned_page,
-                resource=resource,
-                file=file,
-                action=action,
-                version=version
-            )
-
-            # if they visited something today
-            if date_string == visited_by_date['date']:
-                # if they haven't visited this page today
-                if cleaned_page not in visited_by_date['pages']:
-                    # if the model_instance has today in it
-                    if date_string in model_instance.date.keys():
-                        # increment the number of unique visitors for today
-                        model_instance.date[date_string]['unique'] += 1
-                    else:
-                        # set the number of unique visitors for today to 1
-                        model_instance.date[date_string] = dict(unique=1)
-            # if they haven't visited something today
-            else:
-                # set their visited by date to blank
-                visited_by_date['date'] = date_string
-                visited_by_date['pages'] = []
-                # if the model_instance has today in it
-                if date_string in model_instance.date.keys():
-                    # increment the number of unique visitors for today
-                    model_instance.date[date_string]['unique'] += 1
-                else:
-                    # set the number of unique visitors to 1
-                    model_instance.date[date_string] = dict(unique=1)
-
-            # update their sessions
-            visited_by_date['pages'].append(cleaned_page)
-            session.data['visited_by_date'] = visited_by_date
-
-            if date_string in model_instance.date.keys():
-                if 'total' not in model_instance.date[date_string].keys():
-                    model_instance.date[date_string].update(total=0)
-                model_instance.date[date_string]['total'] += 1
-            else:
-                model_instance.date[date_string] = dict(total=1)
-
-            # if a download counter is being updated, only perform the update
-            # if the user who is downloading isn't a contributor to the project
-            page_type = cleaned_page.split(':')[0]
-            if page_type in ('download', 'view') and node_info:
-                if node_info['contributors'].filter(guids___id__isnull=False, guids___id=session.data.get('auth_user_id')).exists():
-                    model_instance.save()
-                    return
-
-            visited = session.data.get('visited', [])
-            if page not in visited:
-                model_instance.unique += 1
-                visited.append(page)
-                session.data['visited'] = visited
-
-            session.save()
-            model_instance.total += 1
-
-            model_instance.save()
+            events = list(PageCounterEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+            if not events:
+                return 0
+
+            first_events = {}
+            totals = defaultdict(lambda: [0, 0])
+            daily_counts = defaultdict(lambda: [0, 0])
+            for event in events:
+                first_events.setdefault(event.page, event)
+                totals[event.page][0] += event.total
+                totals[event.page][1] += event.unique
+                daily_counts[(event.page, event.date)][0] += 1
+                daily_counts[(event.page, event.date)][1] += event.daily_unique
+
+            counter_ids = dict(cls.objects.filter(_id__in=list(first_events)).values_list('_id', 'id'))
+            for page, event in first_events.items():
+                if page not in counter_ids:
+                    counter_ids[page] = cls.objects.get_or_create(
+                        _id=page,
+                        resource_id=event.resource_id,
+                        file_id=event.file_id,
+                        action=event.action,
+                        version=event.version,
+                    )[0].id
+
+            for page, (total, unique) in totals.items():
+                if total or unique:
+                    cls.objects.filter(id=counter_ids[page]).update(total=F('total') + total, unique=F('unique') + unique)
+
+            with connection.cursor() as cursor:
+                cursor.executemany(PageCounterDailyCount.INCREMENT_SQL.format(table=PageCounterDailyCount._meta.db_table), [
+                    (counter_ids[page], date, total, unique) for (page, date), (total, unique) in daily_counts.items()
+                ])
+
+            PageCounterEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        return len(events)
 
     @classmethod
     def get_basic_counters(cls, resource, file, version, action):
@@ -180,3 +240,35 @@ class PageCounter(BaseModel):
             return (counter.unique, counter.total)
         except cls.DoesNotExist:
             return (None, None)
+
+
+class PageCounterDailyCount(models.Model):
+    """Views or downloads counted by a PageCounter on a day"""
+    page_counter = models.ForeignKey(PageCounter, related_name='daily_counts', on_delete=models.CASCADE)
+    date = models.DateField()
+    total = models.PositiveIntegerField(default=0)
+    unique = models.PositiveIntegerField(default=0)
+
+    INCREMENT_SQL = """
+        INSERT INTO {table} (page_counter_id, date, total, "unique")
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (page_counter_id, date) DO UPDATE SET
+            total = {table}.total + EXCLUDED.total,
+            "unique" = {table}."unique" + EXCLUDED."unique";
+    """
+
+    class Meta:
+        unique_together = ('page_counter', 'date')
+
+
+class PageCounterEvent(models.Model):
+    """Append-only buffer of PageCounter increments, see `PageCounter.flush_events`"""
+    page = models.CharField(max_length=300)
+    resource = models.ForeignKey(Guid, related_name='+', on_delete=models.CASCADE)
+    file = models.ForeignKey('osf.BaseFileNode', related_name='+', on_delete=models.CASCADE)
+    version = models.IntegerField(null=True, blank=True)
+    action = models.CharField(max_length=128)
+    date = models.DateField()
+    total = models.PositiveSmallIntegerField(default=0)
+    unique = models.PositiveSmallIntegerField(default=0)
+    daily_unique = models.PositiveSmallIntegerField(default=0)
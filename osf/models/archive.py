@@ -1,6 +1,7 @@
 from django.contrib.postgres.fields import ArrayField
 from django.utils import timezone
 from django.db import models
+from django.db.models import F
 
 from osf.utils.fields import NonNaiveDateTimeField
 from website import settings
@@ -34,6 +35,10 @@ class ArchiveTarget(ObjectIDMixin, BaseModel):
     stat_result = DateTimeAwareJSONField(default=dict, blank=True)
     errors = ArrayField(models.TextField(), default=list, blank=True)
 
+    # Progress of collecting the addon's file tree, as of the last checkpoint
+    folders_listed = models.PositiveIntegerField(default=0)
+    files_listed = models.PositiveIntegerField(default=0)
+
     def __repr__(self):
         return '<{0}(_id={1}, name={2}, status={3})>'.format(
             self.__class__.__name__,
@@ -42,6 +47,44 @@ class ArchiveTarget(ObjectIDMixin, BaseModel):
             self.status
         )
 
+    @property
+    def progress(self):
+        return {
+            'folders_listed': self.folders_listed,
+            'files_listed': self.files_listed,
+        }
+
+    def get_folder_listings(self):
+        """Return the children of every folder listed so far, keyed by path"""
+        return dict(self.folder_listings.values_list('path', 'children'))
+
+    def add_folder_listings(self, listings):
+        """Checkpoint the children of newly listed folders, given as a dict keyed by path"""
+        ArchiveFolderListing.objects.bulk_create([
+            ArchiveFolderListing(target=self, path=path, children=children)
+            for path, children in listings.items()
+        ])
+        num_files = sum(1 for children in listings.values() for child in children if child.get('kind') == 'file')
+        ArchiveTarget.objects.filter(id=self.id).update(
+            folders_listed=F('folders_listed') + len(listings),
+            files_listed=F('files_listed') + num_files,
+        )
+
+    def clear_folder_listings(self):
+        self.folder_listings.all().delete()
+
+
+class ArchiveFolderListing(models.Model):
+    """The children of one folder of an ArchiveTarget's file tree, kept so that collecting the
+    file tree can resume where an earlier attempt stopped
+    """
+    target = models.ForeignKey(ArchiveTarget, related_name='folder_listings', on_delete=models.CASCADE)
+    path = models.TextField()
+    children = DateTimeAwareJSONField(default=list, blank=True)
+
+    class Meta:
+        unique_together = ('target', 'path')
+
 
 class ArchiveJob(ObjectIDMixin, BaseModel):
 
@@ -96,11 +139,21 @@ class ArchiveJob(ObjectIDMixin, BaseModel):
                 'name': target.name,
                 'status': target.status,
                 'stat_result': target.stat_result,
-                'errors': target.errors
+                'errors': target.errors,
+                'progress': target.progress,
             }
             for target in self.target_addons.all()
         ]
 
+    @property
+    def progress(self):
+        """Folders and files listed so far, across all of this job's targets"""
+        progress = {'folders_listed': 0, 'files_listed': 0}
+        for target in self.target_addons.all():
+            for key, value in target.progress.items():
+                progress[key] += value
+        return progress
+
     def archive_tree_finished(self):
         if self.pending:
             return False
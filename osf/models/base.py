@@ -1,22 +1,26 @@
+import functools
 import logging
 import random
+from collections import namedtuple
 
 import bson
+from django.conf import settings
 from django.contrib.contenttypes.fields import (GenericForeignKey,
                                                 GenericRelation)
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import MultipleObjectsReturned
 from django.core.exceptions import ValidationError as DjangoValidationError
-from django.db import connections, models
+from django.db import connection, connections, models, transaction
 from django.db.models import ForeignKey
 from django.db.models.query import QuerySet
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django_extensions.db.models import TimeStampedModel
 from include import IncludeQuerySet
 from past.builtins import basestring
 
-from osf.utils.caching import cached_property
+from api.caching.utils import guid_resolution_cache, set_many_after_commit, GUID_RESOLUTION_KEY
+from osf.utils.caching import cached_property, LRUCache
 from osf.exceptions import ValidationError
 from osf.utils.fields import LowercaseCharField, NonNaiveDateTimeField
 
@@ -24,22 +28,46 @@ ALPHABET = '23456789abcdefghjkmnpqrstuvwxyz'
 
 logger = logging.getLogger(__name__)
 
+# What a GUID resolves to; cached per process and in the shared guid resolution cache
+GuidResolution = namedtuple('GuidResolution', ['id', 'content_type_id', 'object_id', 'created'])
+local_guid_resolution_cache = LRUCache(settings.GUID_RESOLUTION_LOCAL_CACHE_SIZE, settings.GUID_RESOLUTION_LOCAL_CACHE_TIMEOUT)
 
-def _check_blacklist(guid):
-    return BlackListGuid.objects.filter(guid=guid).exists()
 
+TAKEN_GUIDS_SQL = """
+    SELECT _id FROM {guid_table} WHERE _id = ANY(%(candidates)s)
+    UNION SELECT guid FROM {blacklist_table} WHERE guid = ANY(%(candidates)s)
+    UNION SELECT _id FROM {reserved_table} WHERE _id = ANY(%(candidates)s);
+"""
 
-def generate_guid(length=5):
-    while True:
-        guid_id = ''.join(random.sample(ALPHABET, length))
 
-        # is the guid in the blacklist
-        if _check_blacklist(guid_id):
-            continue
+def _taken_guids(candidates):
+    """Return those of `candidates` that are in use, blacklisted or reserved, in one query"""
+    with connection.cursor() as cursor:
+        cursor.execute(TAKEN_GUIDS_SQL.format(
+            guid_table=Guid._meta.db_table,
+            blacklist_table=BlackListGuid._meta.db_table,
+            reserved_table=ReservedGuid._meta.db_table,
+        ), {'candidates': list(candidates)})
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _random_guids(count, length):
+    return {''.join(random.sample(ALPHABET, length)) for _ in range(count)}
+
+
+def generate_guids(count, length=5):
+    """Return `count` distinct GUIDs that are neither in use nor blacklisted. GUIDs of the pooled length are
+    claimed from the pool of reserved GUIDs first; the rest are drawn at random and checked a batch at a time.
+    """
+    guids = ReservedGuid.claim(count) if length == settings.GUID_POOL_LENGTH else []
+    while len(guids) < count:
+        candidates = _random_guids(count - len(guids), length).difference(guids)
+        guids.extend(candidates.difference(_taken_guids(candidates)))
+    return guids
 
-        # it's not, check and see if it's already in the database
-        if not Guid.objects.filter(_id=guid_id).exists():
-            return guid_id
+
+def generate_guid(length=5):
+    return generate_guids(1, length)[0]
 
 
 def generate_object_id():
@@ -162,11 +190,67 @@ class Guid(BaseModel):
     # Override load in order to load by GUID
     @classmethod
     def load(cls, data, select_for_update=False):
+        if data and not select_for_update:
+            resolution = cls.resolve([data]).get(data.lower())
+            if resolution is None:
+                return None
+            # from_db takes the values of all concrete fields in their declared order
+            return cls.from_db(
+                cls.objects.db,
+                ('id', '_id', 'content_type_id', 'object_id', 'created'),
+                (resolution.id, data.lower(), resolution.content_type_id, resolution.object_id, resolution.created),
+            )
         try:
             return cls.objects.get(_id=data) if not select_for_update else cls.objects.filter(_id=data).select_for_update().get()
         except cls.DoesNotExist:
             return None
 
+    @classmethod
+    def resolve(cls, guids):
+        """Resolve many GUIDs at once.
+
+        Resolutions are looked up in this process's cache, then in the shared cache, and whatever is left is
+        queried in one go and added to the shared cache once the transaction commits. Both caches are invalidated
+        when a Guid is saved or deleted; queryset updates bypass that.
+
+        :param guids: iterable of GUID strings
+        :return: dict mapping each lowercased GUID that exists to its GuidResolution
+        """
+        resolved = {}
+        missing = set()
+        for guid in {guid.lower() for guid in guids if guid}:
+            resolution = local_guid_resolution_cache.get(guid)
+            if resolution is None:
+                missing.add(guid)
+            else:
+                resolved[guid] = resolution
+
+        if missing:
+            shared = guid_resolution_cache.get_many([GUID_RESOLUTION_KEY.format(guid=guid) for guid in missing])
+            for guid in list(missing):
+                resolution = shared.get(GUID_RESOLUTION_KEY.format(guid=guid))
+                if resolution is not None:
+                    resolution = GuidResolution(*resolution)
+                    local_guid_resolution_cache.set(guid, resolution)
+                    resolved[guid] = resolution
+                    missing.discard(guid)
+
+        if missing:
+            queried = {
+                row[0]: GuidResolution(*row[1:])
+                for row in cls.objects.filter(_id__in=missing).values_list('_id', *GuidResolution._fields)
+            }
+            if queried:
+                set_many_after_commit(
+                    guid_resolution_cache,
+                    {GUID_RESOLUTION_KEY.format(guid=guid): tuple(resolution) for guid, resolution in queried.items()},
+                    settings.GUID_RESOLUTION_CACHE_TIMEOUT,
+                )
+            for guid, resolution in queried.items():
+                local_guid_resolution_cache.set(guid, resolution)
+            resolved.update(queried)
+        return resolved
+
     class Meta:
         ordering = ['-created']
         get_latest_by = 'created'
@@ -183,6 +267,58 @@ class BlackListGuid(BaseModel):
     def _id(self):
         return self.guid
 
+class ReservedGuid(models.Model):
+    """A GUID checked to be neither in use nor blacklisted, held back for `generate_guids` to hand out. The pool is
+    topped up in the background by `osf.management.commands.refill_guid_pool`.
+    """
+    _id = LowercaseCharField(max_length=255, unique=True)
+
+    CLAIM_SQL = """
+        WITH claimed AS (
+            DELETE FROM {table}
+            WHERE id IN (
+                SELECT id FROM {table}
+                LIMIT %(count)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING _id
+        )
+        SELECT _id FROM claimed
+        WHERE NOT EXISTS (SELECT 1 FROM {guid_table} WHERE {guid_table}._id = claimed._id);
+    """
+
+    REFILL_SQL = """
+        INSERT INTO {table} (_id)
+        SELECT candidate FROM unnest(%(candidates)s::varchar[]) AS candidate
+        WHERE NOT EXISTS (SELECT 1 FROM {guid_table} WHERE {guid_table}._id = candidate)
+            AND NOT EXISTS (SELECT 1 FROM {blacklist_table} WHERE {blacklist_table}.guid = candidate)
+        ON CONFLICT DO NOTHING;
+    """
+
+    @classmethod
+    def claim(cls, count):
+        """Removes and returns up to `count` reserved GUIDs. GUIDs being claimed by a concurrent transaction are
+        skipped, and any that have since been taken by a Guid created with an explicit `_id` are dropped.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(cls.CLAIM_SQL.format(table=cls._meta.db_table, guid_table=Guid._meta.db_table), {
+                'count': count,
+            })
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def refill(cls, count, length=None):
+        """Reserves up to `count` new random GUIDs. Returns how many were reserved."""
+        candidates = _random_guids(count, length or settings.GUID_POOL_LENGTH)
+        with connection.cursor() as cursor:
+            cursor.execute(cls.REFILL_SQL.format(
+                table=cls._meta.db_table,
+                guid_table=Guid._meta.db_table,
+                blacklist_table=BlackListGuid._meta.db_table,
+            ), {'candidates': list(candidates)})
+            return cursor.rowcount
+
+
 def generate_guid_instance():
     return Guid.objects.create().id
 
@@ -339,14 +475,35 @@ class GuidMixin(BaseIDMixin):
         # Minor optimization--no need to query if q is None or ''
         if not q:
             return None
-        try:
-            # guids___id__isnull=False forces an INNER JOIN
-            if select_for_update:
+        if select_for_update:
+            try:
+                # guids___id__isnull=False forces an INNER JOIN
                 return cls.objects.filter(guids___id__isnull=False, guids___id=q).select_for_update()[:1].get()
-            return cls.objects.filter(guids___id__isnull=False, guids___id=q)[:1].get()
+            except cls.DoesNotExist:
+                return None
+        resolution = Guid.resolve([q]).get(q.lower())
+        if resolution is None or resolution.content_type_id != ContentType.objects.get_for_model(cls).id:
+            return None
+        try:
+            return cls.objects.filter(pk=resolution.object_id)[:1].get()
         except cls.DoesNotExist:
             return None
 
+    @classmethod
+    def load_many(cls, guids):
+        """Load the objects of many GUIDs in one query.
+
+        :return: dict mapping each lowercased GUID that refers to an object of this class to that object
+        """
+        content_type_id = ContentType.objects.get_for_model(cls).id
+        object_ids = {
+            guid: resolution.object_id
+            for guid, resolution in Guid.resolve(guids).items()
+            if resolution.content_type_id == content_type_id
+        }
+        instances = cls.objects.in_bulk(set(object_ids.values()))
+        return {guid: instances[object_id] for guid, object_id in object_ids.items() if object_id in instances}
+
     @property
     def deep_url(self):
         return None
@@ -355,6 +512,46 @@ class GuidMixin(BaseIDMixin):
         abstract = True
 
 
+@receiver(post_save, sender=Guid)
+@receiver(post_delete, sender=Guid)
+def invalidate_guid_resolution(sender, instance, **kwargs):
+    guid = instance._id.lower()
+    local_guid_resolution_cache.delete(guid)
+    guid_resolution_cache.delete(GUID_RESOLUTION_KEY.format(guid=guid))
+    # Resolutions are written to the shared cache after commit, so one read before this commits may still land
+    transaction.on_commit(functools.partial(guid_resolution_cache.delete, GUID_RESOLUTION_KEY.format(guid=guid)))
+
+
+def ensure_guids(instances):
+    """Give GUIDs to saved GuidMixin instances that have none, with one query for existing GUIDs and one insert
+    per model. `bulk_create` skips the post_save signal that `ensure_guid` hangs off of, so call this after it.
+
+    :return: the created Guids
+    """
+    by_content_type = {}
+    for instance in instances:
+        key = (ContentType.objects.get_for_model(instance), instance.__guid_min_length__)
+        by_content_type.setdefault(key, []).append(instance)
+
+    created = []
+    for (content_type, length), typed_instances in by_content_type.items():
+        guided = set(
+            Guid.objects.filter(content_type=content_type, object_id__in=[instance.pk for instance in typed_instances])
+            .values_list('object_id', flat=True)
+        )
+        unguided = [instance for instance in typed_instances if instance.pk not in guided]
+        if not unguided:
+            continue
+        created.extend(Guid.objects.bulk_create([
+            Guid(_id=_id, content_type=content_type, object_id=instance.pk)
+            for instance, _id in zip(unguided, generate_guids(len(unguided), length))
+        ]))
+        for instance in unguided:
+            # Clear query cache of instance.guids
+            getattr(instance, '_prefetched_objects_cache', {}).pop('guids', None)
+    return created
+
+
 @receiver(post_save)
 def ensure_guid(sender, instance, created, **kwargs):
     if not issubclass(sender, GuidMixin):
@@ -6,8 +6,8 @@ import os
 import requests
 from dateutil.parser import parse as parse_date
 from django.apps import apps
-from django.db import models, IntegrityError
-from django.db.models import Manager
+from django.db import models, connection, IntegrityError
+from django.db.models import Manager, Sum
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
@@ -24,6 +24,7 @@ from osf.models.validators import validate_location
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 from osf.utils.fields import NonNaiveDateTimeField
 from api.base.utils import waterbutler_api_url_for
+from api.caching.tasks import update_storage_usage_by_delta
 from website.files import utils
 from website.files.exceptions import VersionNotFoundError
 from website.util import api_v2_url, web_url_for, api_url_for
@@ -245,8 +246,18 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
         """
         version_name = name or self.name
         BaseFileVersionsThrough.objects.create(fileversion=version, basefilenode=self, version_name=version_name)
+        if not self.is_deleted:
+            self._update_storage_usage(version.size)
         return version
 
+    def _update_storage_usage(self, delta):
+        """Adds `delta` bytes to the storage usage of the target, only osfstorage files count towards it"""
+        if self.provider == 'osfstorage' and delta:
+            update_storage_usage_by_delta(self.target, delta)
+
+    def _get_versions_size(self):
+        return self.versions.aggregate(total=Sum('size'))['total'] or 0
+
     @classmethod
     def files_checked_out(cls, user):
         """
@@ -434,6 +445,8 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
             for child in BaseFileNode.objects.filter(parent=self.id).exclude(type__in=TrashedFileNode._typedmodels_subtypes):
                 child.delete(user=user, save=save, deleted_on=deleted)
         else:
+            if self.provider == 'osfstorage':
+                self._update_storage_usage(-self._get_versions_size())
             self.recast(TrashedFile._typedmodels_type)
 
             guid = self.guids.first()
@@ -660,6 +673,8 @@ class TrashedFileNode(BaseFileNode):
         type_cls = File if self.is_file else Folder
 
         self.recast(self._resolve_class(type_cls)._typedmodels_type)
+        if self.is_file and self.provider == 'osfstorage':
+            self._update_storage_usage(self._get_versions_size())
 
         if save:
             self.save()
@@ -732,9 +747,23 @@ class FileVersionUserMetadata(BaseModel):
     user = models.ForeignKey('OSFUser', on_delete=models.CASCADE)
     file_version = models.ForeignKey('FileVersion', on_delete=models.CASCADE)
 
+    MARK_SEEN_SQL = """
+        INSERT INTO {table} (user_id, file_version_id, created, modified)
+        VALUES (%s, %s, now(), now())
+        ON CONFLICT (user_id, file_version_id) DO NOTHING;
+    """
+
     class Meta:
         unique_together = ('user', 'file_version')
 
+    @classmethod
+    def mark_seen(cls, user_id, file_version_ids):
+        """Record that a user has seen the given file versions, skipping any that are already recorded"""
+        with connection.cursor() as cursor:
+            cursor.executemany(cls.MARK_SEEN_SQL.format(table=cls._meta.db_table), [
+                (user_id, file_version_id) for file_version_id in file_version_ids
+            ])
+
 
 class FileVersion(ObjectIDMixin, BaseModel):
     """A version of an OsfStorageFileNode. contains information
@@ -8,6 +8,7 @@ import warnings
 from rest_framework import status as http_status
 
 import bson
+from collections import defaultdict
 from django.db.models import Q
 from dirtyfields import DirtyFieldsMixin
 from django.apps import apps
@@ -16,20 +17,19 @@ from django.contrib.auth.models import AnonymousUser, Permission
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.paginator import Paginator
 from django.urls import reverse
-from django.db import models, connection
-from django.db.models.signals import post_save
+from django.db import models, connection, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.functional import cached_property
 from keen import scoped_keys
-from psycopg2._psycopg import AsIs
 from typedmodels.models import TypedModel, TypedModelManager
 from include import IncludeManager
 from guardian.models import (
     GroupObjectPermissionBase,
     UserObjectPermissionBase,
 )
-from guardian.shortcuts import get_objects_for_user, get_groups_with_perms
+from guardian.shortcuts import get_groups_with_perms
 
 from framework import status
 from framework.auth import oauth_scopes
@@ -46,10 +46,11 @@ from osf.models.licenses import NodeLicenseRecord
 from osf.models.mixins import (AddonModelMixin, CommentableMixin, Loggable, GuardianMixin,
                                NodeLinkMixin, SpamOverrideMixin, RegistrationResponseMixin,
                                EditableFieldsMixin)
-from osf.models.node_relation import NodeRelation
+from osf.models.node_relation import NodeRelation, NodeTreeClosure
 from osf.models.nodelog import NodeLog
 from osf.models.sanctions import RegistrationApproval
 from osf.models.private_link import PrivateLink
+from osf.models.storage import NodeStorageUsage
 from osf.models.tag import Tag
 from osf.models.user import OSFUser
 from osf.models.validators import validate_title, validate_doi
@@ -101,46 +102,12 @@ class AbstractNodeQuerySet(GuidMixinQuerySet):
                 query = query.filter(is_deleted=False)
             return query
         else:
-            sql = """
-                WITH RECURSIVE descendants AS (
-                SELECT
-                    parent_id,
-                    child_id,
-                    1 AS LEVEL,
-                    ARRAY[parent_id] as pids
-                FROM %s
-                %s
-                WHERE is_node_link IS FALSE AND parent_id = %s %s
-                UNION ALL
-                SELECT
-                    d.parent_id,
-                    s.child_id,
-                    d.level + 1,
-                    d.pids || s.parent_id
-                FROM descendants AS d
-                    JOIN %s AS s
-                    ON d.child_id = s.parent_id
-                WHERE s.is_node_link IS FALSE AND %s = ANY(pids)
-                ) SELECT array_agg(DISTINCT child_id)
-                FROM descendants
-                WHERE parent_id = %s;
-            """
-            with connection.cursor() as cursor:
-                node_relation_table = AsIs(NodeRelation._meta.db_table)
-                cursor.execute(sql, [
-                    node_relation_table,
-                    AsIs('LEFT JOIN osf_abstractnode ON {}.child_id = osf_abstractnode.id'.format(node_relation_table) if active else ''),
-                    root.pk,
-                    AsIs('AND osf_abstractnode.is_deleted IS FALSE' if active else ''),
-                    node_relation_table,
-                    root.pk,
-                    root.pk])
-                row = cursor.fetchone()[0]
-                if not row:
-                    return AbstractNode.objects.filter(id=root.pk) if include_root else AbstractNode.objects.none()
-                if include_root:
-                    row.append(root.pk)
-                return AbstractNode.objects.filter(id__in=row)
+            query = Q(id__in=NodeTreeClosure.objects.filter(ancestor_id=root.pk).values('descendant_id'))
+            if active:
+                query &= Q(is_deleted=False)
+            if include_root:
+                query |= Q(id=root.pk)
+            return AbstractNode.objects.filter(query)
 
     def can_view(self, user=None, private_link=None):
         qs = self.filter(is_public=True)
@@ -154,27 +121,8 @@ class AbstractNodeQuerySet(GuidMixinQuerySet):
             return self.filter(private_links__is_deleted=False, private_links__key=private_link).filter(is_deleted=False)
 
         if user is not None and not isinstance(user, AnonymousUser):
-            read_user_query = get_objects_for_user(user, READ_NODE, self, with_superuser=False)
-            qs |= read_user_query
-            qs |= self.extra(where=["""
-                "osf_abstractnode".id in (
-                    WITH RECURSIVE implicit_read AS (
-                        SELECT N.id as node_id
-                        FROM osf_abstractnode as N, auth_permission as P, osf_nodegroupobjectpermission as G, osf_osfuser_groups as UG
-                        WHERE P.codename = 'admin_node'
-                        AND G.permission_id = P.id
-                        AND UG.osfuser_id = %s
-                        AND G.group_id = UG.group_id
-                        AND G.content_object_id = N.id
-                        AND N.type = 'osf.node'
-                    UNION ALL
-                        SELECT "osf_noderelation"."child_id"
-                        FROM "implicit_read"
-                        LEFT JOIN "osf_noderelation" ON "osf_noderelation"."parent_id" = "implicit_read"."node_id"
-                        WHERE "osf_noderelation"."is_node_link" IS FALSE
-                    ) SELECT * FROM implicit_read
-                )
-            """], params=(user.id, ))
+            NodeEffectivePermission.flush()
+            qs |= self.filter(id__in=NodeEffectivePermission.objects.filter(user_id=user.id, permission=READ_NODE).values('node_id'))
         return qs.filter(is_deleted=False)
 
 
@@ -208,7 +156,6 @@ class AbstractNodeManager(TypedModelManager, IncludeManager):
         :param include_public: If True, will include public nodes in query that user may not have explicit perms to
         :returns node queryset that the user has perms to
         """
-        OSFUserGroup = apps.get_model('osf', 'osfuser_groups')
         if base_queryset is None:
             base_queryset = self
 
@@ -216,10 +163,12 @@ class AbstractNodeManager(TypedModelManager, IncludeManager):
             raise ValueError('Permission must be one of {}, {}, or {}.'.format(PERMISSIONS[0], PERMISSIONS[1], PERMISSIONS[2]))
 
         nodes = base_queryset.filter(is_deleted=False)
-        permission_object_id = Permission.objects.get(codename=permission).id
-        user_groups = OSFUserGroup.objects.filter(osfuser_id=user.id if user else None).values_list('group_id', flat=True)
-        node_groups = NodeGroupObjectPermission.objects.filter(group_id__in=user_groups, permission_id=permission_object_id).values_list('content_object_id', flat=True)
-        query = Q(id__in=node_groups)
+        NodeEffectivePermission.flush()
+        query = Q(id__in=NodeEffectivePermission.objects.filter(
+            user_id=user.id if user else None,
+            permission=permission,
+            is_implicit=False,
+        ).values('node_id'))
         if include_public:
             query |= Q(is_public=True)
         return nodes.filter(query)
@@ -867,9 +816,12 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
 
     @property
     def parents(self):
-        if self.parent_node:
-            return [self.parent_node] + self.parent_node.parents
-        return []
+        if not self.pk:
+            return []
+        return [
+            closure.ancestor for closure in
+            NodeTreeClosure.objects.filter(descendant_id=self.pk).select_related('ancestor').order_by('depth')
+        ]
 
     def get_users_with_perm(self, permission):
         # Returns queryset of all User objects with a specific permission for the given node
@@ -1272,39 +1224,8 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         return self.private_links.filter(is_deleted=True).values_list('key', flat=True)
 
     def get_root(self):
-        sql = """
-            WITH RECURSIVE ascendants AS (
-              SELECT
-                parent_id,
-                child_id,
-                1 AS LEVEL,
-                ARRAY[child_id] as cids
-              FROM %s
-              WHERE is_node_link IS FALSE and child_id = %s
-              UNION ALL
-              SELECT
-                S.parent_id,
-                D.child_id,
-                D.level + 1,
-                D.cids || S.child_id
-              FROM ascendants AS D
-                JOIN %s AS S
-                  ON D.parent_id = S.child_id
-              WHERE S.is_node_link IS FALSE
-                AND %s = ANY(cids)
-            ) SELECT parent_id
-              FROM ascendants
-              WHERE child_id = %s
-              ORDER BY level DESC
-              LIMIT 1;
-        """
-        with connection.cursor() as cursor:
-            node_relation_table = AsIs(NodeRelation._meta.db_table)
-            cursor.execute(sql, [node_relation_table, self.pk, node_relation_table, self.pk, self.pk])
-            res = cursor.fetchone()
-            if res:
-                return AbstractNode.objects.get(pk=res[0])
-            return self
+        closure = NodeTreeClosure.objects.filter(descendant_id=self.pk).select_related('ancestor').order_by('-depth').first()
+        return closure.ancestor if closure else self
 
     def find_readable_antecedent(self, auth):
         """ Returns first antecendant node readable by <user>.
@@ -1525,19 +1446,28 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
     def get_primary(self, node):
         return NodeRelation.objects.filter(parent=self, child=node, is_node_link=False).exists()
 
-    # TODO optimize me
     def get_descendants_recursive(self, primary_only=False):
-        query = self.nodes_primary if primary_only else self._nodes
-        for node in query.all():
-            yield node
-            if not primary_only:
-                primary = self.get_primary(node)
-                if primary:
-                    for descendant in node.get_descendants_recursive(primary_only=primary_only):
+        """Yields the children of this node depth-first, descending into components but not node links"""
+        descendant_ids = NodeTreeClosure.objects.filter(ancestor_id=self.pk).values_list('descendant_id', flat=True)
+        relations = NodeRelation.objects.filter(
+            Q(parent_id=self.pk) | Q(parent_id__in=descendant_ids)
+        ).select_related('child').order_by('_order')
+        if primary_only:
+            relations = relations.filter(is_node_link=False)
+
+        children = defaultdict(list)
+        for relation in relations:
+            children[relation.parent_id].append(relation)
+
+        def walk(parent_id, seen):
+            for relation in children[parent_id]:
+                yield relation.child
+                if not relation.is_node_link and relation.child_id not in seen:
+                    seen.add(relation.child_id)
+                    for descendant in walk(relation.child_id, seen):
                         yield descendant
-            else:
-                for descendant in node.get_descendants_recursive(primary_only=primary_only):
-                    yield descendant
+
+        return walk(self.pk, {self.pk})
 
     @property
     def nodes_primary(self):
@@ -2367,11 +2297,16 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         key = cache_settings.STORAGE_USAGE_KEY.format(target_id=self._id)
 
         storage_usage_total = storage_usage_cache.get(key)
-        if storage_usage_total:
+        if storage_usage_total is not None:
             return storage_usage_total
-        else:
-            update_storage_usage(self)  # sets cache
-            return storage_usage_cache.get(key)
+
+        record = NodeStorageUsage.objects.filter(node_id=self.id).values_list('total', flat=True).first()
+        if record is not None:
+            storage_usage_cache.set(key, record, cache_settings.FIVE_MIN_TIMEOUT)
+            return record
+
+        update_storage_usage(self)  # sets cache
+        return storage_usage_cache.get(key)
 
     # Overrides ContributorMixin
     # TODO: Deprecate this when we emberize contributors management for nodes
@@ -2417,6 +2352,150 @@ class NodeGroupObjectPermission(GroupObjectPermissionBase):
     content_object = models.ForeignKey(AbstractNode, on_delete=models.CASCADE)
 
 
+class NodeEffectivePermission(models.Model):
+    """
+    The node permissions each user effectively has, through the node's Django groups (contributors
+    and OSF groups) or, for read access only, admin on an ancestor project. Like `has_permission`,
+    direct guardian user permissions (NodeUserObjectPermission) are not included.
+
+    Derived from those tables and kept in sync by the receivers below, so that `can_view` and
+    `get_nodes_for_user` are indexed lookups. Changes made in a transaction are collected and
+    refreshed once when it commits, or before the table is read in the transaction; readers must
+    call `flush` first. Refreshes lost to a crash are corrected by `reconcile`, which runs
+    periodically. The foreign keys have no database constraints as rows may be refreshed while the
+    node or user is being deleted.
+    """
+    user = models.ForeignKey(OSFUser, related_name='+', on_delete=models.CASCADE, db_constraint=False)
+    node = models.ForeignKey(AbstractNode, related_name='+', on_delete=models.CASCADE, db_constraint=False)
+    permission = models.CharField(max_length=31)
+    is_implicit = models.BooleanField(default=False)
+
+    # Attribute of the database connection holding the node ids waiting for a refresh
+    PENDING_ATTR = '_pending_effective_permission_node_ids'
+    # Attribute of the database connection holding the id of the transaction a flush is queued for
+    FLUSH_QUEUED_ATTR = '_effective_permission_flush_txid'
+    # First key of the advisory locks held on each node while it is refreshed
+    LOCK_NAMESPACE = 2355
+
+    ROWS_SQL = 'SELECT user_id, node_id, permission, is_implicit FROM {table} WHERE node_id BETWEEN %(min_id)s AND %(max_id)s'
+
+    SELECT_SQL = """
+        SELECT UG.osfuser_id, G.content_object_id, P.codename, FALSE
+        FROM osf_nodegroupobjectpermission AS G
+            JOIN auth_permission AS P ON P.id = G.permission_id
+            JOIN osf_osfuser_groups AS UG ON UG.group_id = G.group_id
+        WHERE P.codename IN ('read_node', 'write_node', 'admin_node') {node_filter}
+      UNION
+        SELECT UG.osfuser_id, C.descendant_id, 'read_node', TRUE
+        FROM osf_nodetreeclosure AS C
+            JOIN osf_abstractnode AS N ON N.id = C.ancestor_id
+            JOIN osf_nodegroupobjectpermission AS G ON G.content_object_id = C.ancestor_id
+            JOIN auth_permission AS P ON P.id = G.permission_id
+            JOIN osf_osfuser_groups AS UG ON UG.group_id = G.group_id
+        WHERE N.type = 'osf.node' AND P.codename = 'admin_node' {closure_filter}
+    """
+
+    class Meta:
+        unique_together = ('node', 'user', 'permission', 'is_implicit')
+        index_together = (
+            ('user', 'permission', 'node'),
+        )
+
+    @classmethod
+    def refresh(cls, node_ids):
+        """Recomputes the permissions on the nodes with pks `node_ids` and on their descendants.
+
+        Each node is locked for the rest of the transaction, in id order, so that concurrent refreshes
+        of the same node run one after the other and the later one sees the rows the earlier one
+        committed. Otherwise a refresh could miss the uncommitted rows of another and leave them behind.
+        """
+        node_ids = set(node_ids)
+        if not node_ids:
+            return
+        node_ids.update(NodeTreeClosure.objects.filter(ancestor_id__in=node_ids).values_list('descendant_id', flat=True))
+        node_ids = sorted(node_ids)
+        sql = (
+            'SELECT pg_advisory_xact_lock(%(namespace)s, node_id) FROM (SELECT unnest(%(node_ids)s) AS node_id ORDER BY 1) AS ids; '
+            'DELETE FROM {table} WHERE node_id = ANY(%(node_ids)s); '
+            'INSERT INTO {table} (user_id, node_id, permission, is_implicit) {select} ON CONFLICT DO NOTHING;'
+        ).format(
+            table=cls._meta.db_table,
+            select=cls.SELECT_SQL.format(
+                node_filter='AND G.content_object_id = ANY(%(node_ids)s)',
+                closure_filter='AND C.descendant_id = ANY(%(node_ids)s)',
+            ),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, {'namespace': cls.LOCK_NAMESPACE, 'node_ids': node_ids})
+
+    @classmethod
+    def stale_node_ids(cls, min_id, max_id):
+        """Returns the pks between `min_id` and `max_id` of the nodes whose rows don't match their permissions"""
+        sql = (
+            'SELECT DISTINCT node_id FROM (({select} EXCEPT {rows}) UNION ALL ({rows} EXCEPT {select})) '
+            'AS diff (user_id, node_id, permission, is_implicit)'
+        ).format(
+            rows=cls.ROWS_SQL.format(table=cls._meta.db_table),
+            select=cls.SELECT_SQL.format(
+                node_filter='AND G.content_object_id BETWEEN %(min_id)s AND %(max_id)s',
+                closure_filter='AND C.descendant_id BETWEEN %(min_id)s AND %(max_id)s',
+            ),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'min_id': min_id, 'max_id': max_id})
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def reconcile(cls, batch_size):
+        """Refreshes every node whose rows don't match its permissions, checking `batch_size` node ids at a time.
+        Returns the number of nodes refreshed.
+        """
+        bounds = AbstractNode.objects.aggregate(min_id=models.Min('id'), max_id=models.Max('id'))
+        if bounds['min_id'] is None:
+            return 0
+        refreshed = 0
+        for min_id in range(bounds['min_id'], bounds['max_id'] + 1, batch_size):
+            stale = cls.stale_node_ids(min_id, min_id + batch_size - 1)
+            if stale:
+                cls.refresh(stale)
+                refreshed += len(stale)
+        return refreshed
+
+    @classmethod
+    def queue_refresh(cls, node_ids):
+        """Refreshes the nodes with pks `node_ids` when the current transaction commits, or right away
+        outside of a transaction.
+        """
+        if not connection.in_atomic_block:
+            return cls.refresh(node_ids)
+        pending = getattr(connection, cls.PENDING_ATTR, None)
+        if pending is None:
+            pending = set()
+            setattr(connection, cls.PENDING_ATTR, pending)
+        pending.update(node_ids)
+        # Ids left over from a rolled back transaction are harmless, but its flush was dropped with it, so
+        # a flush is queued once per database transaction rather than once per connection
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT txid_current()')
+            txid = cursor.fetchone()[0]
+        if getattr(connection, cls.FLUSH_QUEUED_ATTR, None) != txid:
+            setattr(connection, cls.FLUSH_QUEUED_ATTR, txid)
+            transaction.on_commit(cls.flush)
+
+    @classmethod
+    def queue_refresh_for_groups(cls, group_ids):
+        cls.queue_refresh(NodeGroupObjectPermission.objects.filter(group_id__in=group_ids).values_list('content_object_id', flat=True))
+
+    @classmethod
+    def flush(cls):
+        """Runs the refreshes queued on this connection"""
+        pending = getattr(connection, cls.PENDING_ATTR, None)
+        if pending:
+            node_ids = list(pending)
+            pending.clear()
+            cls.refresh(node_ids)
+
+
 class Node(AbstractNode):
     """
     Concrete Node class: Instance of AbstractNode(TypedModel). All things that inherit
@@ -2501,3 +2580,27 @@ def set_parent_and_root(sender, instance, created, *args, **kwargs):
     if not instance.root:
         instance.root = instance.get_root()
         instance.save()
+
+
+@receiver(post_save, sender=NodeGroupObjectPermission)
+@receiver(post_delete, sender=NodeGroupObjectPermission)
+def refresh_effective_permissions(sender, instance, **kwargs):
+    NodeEffectivePermission.queue_refresh([instance.content_object_id])
+
+
+@receiver(post_save, sender=NodeRelation)
+@receiver(post_delete, sender=NodeRelation)
+def refresh_effective_permissions_for_subtree(sender, instance, **kwargs):
+    # Implicit admin access follows the component tree
+    if not instance.is_node_link:
+        NodeEffectivePermission.queue_refresh([instance.child_id])
+
+
+@receiver(m2m_changed, sender=OSFUser.groups.through)
+def refresh_effective_permissions_for_group_members(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_group_ids = [instance.pk] if reverse else list(instance.groups.values_list('id', flat=True))
+    elif action == 'post_clear':
+        NodeEffectivePermission.queue_refresh_for_groups(getattr(instance, '_cleared_group_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        NodeEffectivePermission.queue_refresh_for_groups([instance.pk] if reverse else pk_set)
@@ -1,9 +1,39 @@
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 
 from .base import BaseModel, ObjectIDMixin
 
 
+class NodeRelationQuerySet(models.QuerySet):
+    """Keeps NodeTreeClosure in sync on the bulk paths that skip NodeRelation's signals"""
+
+    TREE_FIELDS = {'parent', 'parent_id', 'child', 'child_id', 'is_node_link'}
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super(NodeRelationQuerySet, self).bulk_create(objs, *args, **kwargs)
+        for obj in objs:
+            if not obj.is_node_link:
+                NodeTreeClosure.add_relation(obj.parent_id, obj.child_id)
+        return objs
+
+    def update(self, **kwargs):
+        if not self.TREE_FIELDS.intersection(kwargs):
+            return super(NodeRelationQuerySet, self).update(**kwargs)
+        with transaction.atomic():
+            pks = list(self.select_for_update().values_list('pk', flat=True))
+            tree_edges = NodeRelation.objects.filter(pk__in=pks, is_node_link=False)
+            for parent_id, child_id in tree_edges.values_list('parent_id', 'child_id'):
+                NodeTreeClosure.remove_relation(parent_id, child_id)
+            updated = super(NodeRelationQuerySet, self).update(**kwargs)
+            for parent_id, child_id in tree_edges.values_list('parent_id', 'child_id'):
+                NodeTreeClosure.add_relation(parent_id, child_id)
+        return updated
+
+
 class NodeRelation(ObjectIDMixin, BaseModel):
+    objects = NodeRelationQuerySet.as_manager()
+
     parent = models.ForeignKey('AbstractNode', related_name='node_relations', on_delete=models.CASCADE)
     child = models.ForeignKey('AbstractNode', related_name='_parents', on_delete=models.CASCADE)
     is_node_link = models.BooleanField(default=False, db_index=True)
@@ -25,3 +55,87 @@ class NodeRelation(ObjectIDMixin, BaseModel):
         index_together = (
             ('is_node_link', 'child', 'parent'),
         )
+
+
+class NodeTreeClosure(models.Model):
+    """Every ancestor/descendant pair of the component tree formed by the NodeRelations that
+    aren't node links, along with the number of relations between them.
+
+    Kept in sync with NodeRelation by the receivers below and by NodeRelationQuerySet's bulk_create
+    and update, so ancestors and descendants of a node can be looked up without recursive queries.
+    Any other path that writes NodeRelations without saving or deleting them, e.g. raw SQL, must call
+    `add_relation` and `remove_relation` itself.
+    """
+    ancestor = models.ForeignKey('AbstractNode', related_name='+', on_delete=models.CASCADE)
+    descendant = models.ForeignKey('AbstractNode', related_name='+', on_delete=models.CASCADE)
+    depth = models.PositiveIntegerField()
+
+    # Links every ancestor of the parent (and the parent) to every descendant of the child (and the child)
+    INSERT_SQL = """
+        INSERT INTO {closure} (ancestor_id, descendant_id, depth)
+        SELECT A.ancestor_id, D.descendant_id, MIN(A.depth + D.depth + 1)
+        FROM (
+            SELECT ancestor_id, depth FROM {closure} WHERE descendant_id = %(parent)s
+            UNION ALL SELECT %(parent)s, 0
+        ) AS A CROSS JOIN (
+            SELECT descendant_id, depth FROM {closure} WHERE ancestor_id = %(child)s
+            UNION ALL SELECT %(child)s, 0
+        ) AS D
+        WHERE A.ancestor_id <> D.descendant_id
+        GROUP BY A.ancestor_id, D.descendant_id
+        ON CONFLICT (ancestor_id, descendant_id) DO NOTHING;
+    """
+
+    DELETE_SQL = """
+        DELETE FROM {closure}
+        WHERE descendant_id IN (
+            SELECT descendant_id FROM {closure} WHERE ancestor_id = %(child)s
+            UNION ALL SELECT %(child)s
+        ) AND ancestor_id IN (
+            SELECT ancestor_id FROM {closure} WHERE descendant_id = %(parent)s
+            UNION ALL SELECT %(parent)s
+        );
+    """
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        index_together = (
+            ('descendant', 'depth'),
+        )
+
+    @classmethod
+    def add_relation(cls, parent_id, child_id):
+        with connection.cursor() as cursor:
+            cursor.execute(cls.INSERT_SQL.format(closure=cls._meta.db_table), {'parent': parent_id, 'child': child_id})
+
+    @classmethod
+    def remove_relation(cls, parent_id, child_id):
+        with connection.cursor() as cursor:
+            cursor.execute(cls.DELETE_SQL.format(closure=cls._meta.db_table), {'parent': parent_id, 'child': child_id})
+
+
+@receiver(pre_save, sender=NodeRelation)
+def load_saved_node_relation(sender, instance, **kwargs):
+    """Remembers the tree edge an existing relation had, in case the save changes it"""
+    instance._saved_tree_edge = None
+    if not instance._state.adding:
+        instance._saved_tree_edge = NodeRelation.objects.filter(pk=instance.pk).values_list(
+            'parent_id', 'child_id', 'is_node_link'
+        ).first()
+
+
+@receiver(post_save, sender=NodeRelation)
+def add_node_relation_to_closure(sender, instance, created, **kwargs):
+    saved_edge = getattr(instance, '_saved_tree_edge', None)
+    if saved_edge == (instance.parent_id, instance.child_id, instance.is_node_link):
+        return
+    if saved_edge and not saved_edge[2]:
+        NodeTreeClosure.remove_relation(saved_edge[0], saved_edge[1])
+    if not instance.is_node_link:
+        NodeTreeClosure.add_relation(instance.parent_id, instance.child_id)
+
+
+@receiver(post_delete, sender=NodeRelation)
+def remove_node_relation_from_closure(sender, instance, **kwargs):
+    if not instance.is_node_link:
+        NodeTreeClosure.remove_relation(instance.parent_id, instance.child_id)
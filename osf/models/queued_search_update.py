@@ -0,0 +1,95 @@
+import datetime
+
+from django.db import connection, models
+from django.utils import timezone
+
+from osf.utils.fields import NonNaiveDateTimeField
+
+
+class QueuedSearchUpdate(models.Model):
+    """A search document waiting to be re-indexed. Queuing a document that is already waiting only pushes back
+    `last_queued`, so a burst of saves is indexed once; see `website.search.elastic_search.flush_search_updates`.
+
+    A flush claims the updates it indexes and only deletes them once they are indexed, so updates claimed by a
+    flush that died are claimed again after `claim_timeout`. Queuing a claimed update again releases it, so
+    that it is indexed again even if the flush that claimed it read the document before the new save.
+    """
+    # One of `website.search.elastic_search.SEARCH_UPDATE_TYPES`
+    doc_type = models.CharField(max_length=31)
+    object_id = models.PositiveIntegerField()
+    # Empty for the default index
+    index_name = models.CharField(max_length=255, blank=True, default='')
+    first_queued = NonNaiveDateTimeField()
+    last_queued = NonNaiveDateTimeField()
+    # When a flush claimed the update, if one is indexing it
+    claimed = NonNaiveDateTimeField(null=True, blank=True)
+
+    QUEUE_SQL = """
+        INSERT INTO {table} (doc_type, object_id, index_name, first_queued, last_queued)
+        VALUES (%(doc_type)s, %(object_id)s, %(index_name)s, now(), now())
+        ON CONFLICT (doc_type, object_id, index_name) DO UPDATE SET
+            last_queued = EXCLUDED.last_queued,
+            claimed = NULL
+        RETURNING first_queued = last_queued;
+    """
+
+    CLAIM_SQL = """
+        UPDATE {table} SET claimed = now()
+        WHERE id IN (
+            SELECT id FROM {table}
+            WHERE (last_queued <= %(settled)s OR first_queued <= %(overdue)s)
+                AND (claimed IS NULL OR claimed <= %(abandoned)s)
+            ORDER BY first_queued
+            LIMIT %(batch_size)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, doc_type, object_id, index_name, first_queued, last_queued, claimed;
+    """
+
+    class Meta:
+        unique_together = ('doc_type', 'object_id', 'index_name')
+
+    @classmethod
+    def queue(cls, doc_type, object_id, index=None):
+        """Queues a document to be re-indexed. Returns whether it was newly queued."""
+        with connection.cursor() as cursor:
+            cursor.execute(cls.QUEUE_SQL.format(table=cls._meta.db_table), {
+                'doc_type': doc_type,
+                'object_id': object_id,
+                'index_name': index or '',
+            })
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def claim_ready(cls, batch_size, debounce, max_delay, claim_timeout):
+        """Claims and returns up to `batch_size` updates, oldest first, that haven't been queued again for
+        `debounce` seconds or have waited longer than `max_delay` seconds. Updates claimed by another flush
+        are skipped, unless they were claimed more than `claim_timeout` seconds ago.
+        """
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(cls.CLAIM_SQL.format(table=cls._meta.db_table), {
+                'settled': now - datetime.timedelta(seconds=debounce),
+                'overdue': now - datetime.timedelta(seconds=max_delay),
+                'abandoned': now - datetime.timedelta(seconds=claim_timeout),
+                'batch_size': batch_size,
+            })
+            columns = [column.name for column in cursor.description]
+            return [cls(**dict(zip(columns, row))) for row in cursor.fetchall()]
+
+    @classmethod
+    def complete(cls, updates):
+        """Deletes the claimed `updates` once indexed, except those queued again since they were claimed"""
+        cls._claimed(updates).delete()
+
+    @classmethod
+    def release(cls, updates):
+        """Releases the claimed `updates` without indexing them, so that a later flush retries them"""
+        cls._claimed(updates).update(claimed=None)
+
+    @classmethod
+    def _claimed(cls, updates):
+        query = models.Q()
+        for update in updates:
+            query |= models.Q(id=update.id, claimed=update.claimed)
+        return cls.objects.filter(query)
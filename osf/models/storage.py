@@ -24,3 +24,13 @@ class ProviderAssetFile(BaseModel):
     name = models.CharField(choices=PROVIDER_ASSET_NAME_CHOICES, max_length=63)
     file = models.FileField(upload_to='assets')
     providers = models.ManyToManyField('AbstractProvider', blank=True, related_name='asset_files')
+
+
+class NodeStorageUsage(BaseModel):
+    """Bytes a node stores in osfstorage.
+
+    `total` is kept current with signed deltas as file versions are added and files are deleted or
+    restored, and is recomputed from scratch by `api.caching.tasks.update_storage_usage_cache`.
+    """
+    node = models.OneToOneField('AbstractNode', related_name='storage_usage_record', on_delete=models.CASCADE)
+    total = models.BigIntegerField(default=0)
@@ -11,6 +11,9 @@ can return `None` and do not need a setter.
 """
 from __future__ import unicode_literals
 
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 
 # from https://github.com/etianen/django-optimizations/blob/master/src/optimizations/propertycache.py
@@ -65,3 +68,44 @@ class _CachedProperty(property):
 
 # Public name for the cached property decorator. Using a class as a decorator just looks plain ugly. :P
 cached_property = _CachedProperty
+
+
+class LRUCache(object):
+    """A thread-safe, size-bounded, in-process cache whose entries expire after `timeout` seconds.
+
+    Used in front of shared caches for hot lookups; since entries can't be invalidated from other
+    processes, `timeout` bounds how long they may be stale.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -21,3 +21,6 @@ PASSWORD_HASHERS = (
 )
 
 TEST_ENV = True
+
+# Don't let list totals leak between tests
+PAGINATION_COUNT_CACHE_TIMEOUT = 0
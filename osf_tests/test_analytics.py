@@ -12,7 +12,7 @@ from datetime import datetime
 
 from addons.osfstorage.models import OsfStorageFile
 from framework import analytics
-from osf.models import PageCounter, OSFGroup
+from osf.models import PageCounter, PageCounterDailyCount, OSFGroup
 
 from tests.base import OsfTestCase
 from osf_tests.factories import UserFactory, ProjectFactory
@@ -97,16 +97,22 @@ class TestPageCounter:
         mock_session.data = {}
         resource = project.guids.first()
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={})
+        PageCounter.flush_events()
 
         page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
         assert page_counter.total == 1
         assert page_counter.unique == 1
 
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={})
+        PageCounter.flush_events()
 
         page_counter.refresh_from_db()
         assert page_counter.total == 2
         assert page_counter.unique == 1
+        daily_count = page_counter.daily_counts.get()
+        assert daily_count.total == 2
+        assert daily_count.unique == 1
+        assert PageCounter.flush_events() == 0
 
     @mock.patch('osf.models.analytics.session')
     def test_download_update_counter_contributor(self, mock_session, user, project, file_node):
@@ -114,12 +120,14 @@ class TestPageCounter:
         resource = project.guids.first()
 
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={'contributors': project.contributors})
+        PageCounter.flush_events()
 
         page_counter = PageCounter.objects.get(resource=resource, file=file_node, version=None, action='download')
         assert page_counter.total == 0
         assert page_counter.unique == 0
 
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={'contributors': project.contributors})
+        PageCounter.flush_events()
 
         page_counter.refresh_from_db()
         assert page_counter.total == 0
@@ -133,6 +141,7 @@ class TestPageCounter:
         PageCounter.update_counter(resource, file_node, version=None, action='download', node_info={
             'contributors': project.contributors_and_group_members}
         )
+        PageCounter.flush_events()
         page_counter.refresh_from_db()
         assert page_counter.total == 1
         assert page_counter.unique == 1
@@ -158,6 +167,13 @@ class TestPageCounter:
 
         assert total_downloads == 45
 
+    def test_get_all_downloads_on_date_daily_counts(self, page_counter, page_counter_for_individual_version):
+        date = datetime(2018, 2, 4)
+        PageCounterDailyCount.objects.create(page_counter=page_counter, date=date, total=5, unique=2)
+        PageCounterDailyCount.objects.create(page_counter=page_counter_for_individual_version, date=date, total=3, unique=1)
+
+        assert PageCounter.get_all_downloads_on_date(date) == 46
+
     def test_get_all_downloads_on_date_exclude_versions(self, page_counter, page_counter2, page_counter_for_individual_version):
         """
         This method tests that individual version counts for file node's aren't "double counted" in the totals
@@ -193,7 +193,7 @@ class MockAddon(object):
     def __init__(self, **kwargs):
         self._id = fake.md5()
 
-    def _get_file_tree(self, user, version):
+    def _get_file_tree(self, user, version, **kwargs):
         return FILE_TREE
 
     def after_register(self, *args):
@@ -454,6 +454,36 @@ class TestStorageAddonBase(ArchiverTestCase):
     def _test_addon(self, addon_short_name):
         self._test__get_file_tree(addon_short_name)
 
+    @responses.activate
+    def test_get_file_tree_resumes_from_listings(self):
+        for path in self.URLS:
+            url = waterbutler_api_url_for(self.src._id, 'osfstorage', path=path, _internal=True)
+            responses.add(
+                responses.Response(
+                    responses.GET,
+                    url,
+                    json=self.get_resp(url),
+                    content_type='applcation/json'
+                )
+            )
+        addon = self.src.get_addon('osfstorage')
+        root = {
+            'path': '/',
+            'name': '',
+            'kind': 'folder',
+            'size': '100',
+        }
+        listed = []
+        file_tree = addon._get_file_tree(
+            root,
+            self.user,
+            listings={'/': [child['attributes'] for child in self.tree_root]},
+            on_listed=lambda path, children: listed.append(path),
+        )
+        assert_equal(FILE_TREE, file_tree)
+        assert_equal(len(responses.calls), 1)
+        assert_equal(listed, ['/qwerty'])
+
     # @pytest.mark.skip('Unskip when figshare addon is implemented')
     def test_addons(self):
         #  Test that each addon in settings.ADDONS_ARCHIVABLE other than wiki/forward implements the StorageAddonBase interface
@@ -488,6 +518,19 @@ class TestArchiverTasks(ArchiverTestCase):
         assert_equal(res.target_name, 'osfstorage')
         assert_equal(res.disk_usage, 128 + 256)
 
+    def test_stat_addon_resumes_from_checkpoint(self):
+        listings = {'/': [{'path': '/abc', 'name': 'abc', 'kind': 'file', 'size': 1}]}
+        target = self.archive_job.get_target('osfstorage')
+        target.add_folder_listings(listings)
+        with mock.patch.object(BaseStorageAddon, '_get_file_tree') as mock_file_tree:
+            mock_file_tree.return_value = FILE_TREE
+            stat_addon('osfstorage', self.archive_job._id)
+        assert_equal(mock_file_tree.call_args[1]['listings'], listings)
+
+        target.reload()
+        assert_equal(target.progress, {'folders_listed': 1, 'files_listed': 1})
+        assert_false(target.folder_listings.exists())
+
     @mock.patch('website.archiver.tasks.archive_addon.delay')
     def test_archive_node_pass(self, mock_archive_addon):
         settings.MAX_ARCHIVE_SIZE = 1024 ** 3
@@ -515,7 +558,7 @@ class TestArchiverTasks(ArchiverTestCase):
         with mock.patch('osf.models.mixins.AddonModelMixin.get_addon') as mock_get_addon:
             mock_addon = MockAddon()
 
-            def empty_file_tree(user, version):
+            def empty_file_tree(user, version, **kwargs):
                 return {
                     'path': '/',
                     'kind': 'folder',
@@ -962,21 +1005,19 @@ class TestArchiverUtils(ArchiverTestCase):
                 else:
                     stack = stack + item['children']
 
-    def test_get_file_map_memoization(self):
+    def test_get_file_map_fetches_file_trees_lazily(self):
         node = factories.NodeFactory()
-        comp1 = factories.NodeFactory(parent=node)
-        factories.NodeFactory(parent=comp1)
         factories.NodeFactory(parent=node)
 
         with mock.patch.object(BaseStorageAddon, '_get_file_tree') as mock_get_file_tree:
             mock_get_file_tree.return_value = file_tree_factory(3, 3, 3)
 
-            # first call
-            archiver_utils.get_file_map(node)
-            call_count = mock_get_file_tree.call_count
-            # second call
-            archiver_utils.get_file_map(node)
-            assert_equal(mock_get_file_tree.call_count, call_count)
+            file_map = archiver_utils.get_file_map(node)
+            assert_equal(mock_get_file_tree.call_count, 0)
+            next(file_map)
+            assert_equal(mock_get_file_tree.call_count, 1)
+            list(file_map)
+            assert_equal(mock_get_file_tree.call_count, 2)
 
 
 class TestArchiverListeners(ArchiverTestCase):
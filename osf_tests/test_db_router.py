@@ -0,0 +1,93 @@
+import mock
+import pytest
+
+from api.base.api_globals import api_globals
+from osf.db import router as db_router
+from osf.db.router import PostgreSQLFailoverRouter, allow_replica_reads
+
+
+class FakeRequest(object):
+    def __init__(self, method='GET'):
+        self.method = method
+
+
+class FakeConnection(object):
+    in_atomic_block = False
+
+
+@pytest.fixture()
+def router():
+    with mock.patch.object(PostgreSQLFailoverRouter, '_get_master', return_value='default'):
+        router = PostgreSQLFailoverRouter()
+    router.DSNS = {'default': 'postgres://primary', 'replica': 'postgres://replica'}
+    with mock.patch.object(PostgreSQLFailoverRouter, 'REPLICA_LAGS', {}), \
+            mock.patch.object(PostgreSQLFailoverRouter, 'REPLICAS_CHECKED', None), \
+            mock.patch.object(router, '_check_replicas', return_value={'replica': 0.5}), \
+            mock.patch.object(db_router, 'connections', {'default': FakeConnection()}):
+        yield router
+
+
+@pytest.fixture()
+def request_context():
+    request = FakeRequest()
+    api_globals.request = request
+    yield request
+    api_globals.request = None
+
+
+class TestPostgreSQLFailoverRouter:
+
+    def test_reads_go_to_master_by_default(self, router, request_context):
+        assert router.db_for_read(None) == 'default'
+
+    def test_reads_go_to_master_outside_requests(self, router):
+        assert router.db_for_read(None) == 'default'
+
+    def test_replica_safe_reads_go_to_replica(self, router, request_context):
+        allow_replica_reads(request_context)
+        assert router.db_for_read(None) == 'replica'
+
+    def test_only_safe_methods_read_from_replica(self, router):
+        request = FakeRequest(method='POST')
+        api_globals.request = request
+        try:
+            allow_replica_reads(request)
+            assert router.db_for_read(None) == 'default'
+        finally:
+            api_globals.request = None
+
+    def test_writes_pin_request_to_master(self, router, request_context):
+        allow_replica_reads(request_context)
+        assert router.db_for_read(None) == 'replica'
+        assert router.db_for_write(None) == 'default'
+        assert router.db_for_read(None) == 'default'
+
+    def test_transactions_read_from_master(self, router, request_context):
+        allow_replica_reads(request_context)
+        db_router.connections['default'].in_atomic_block = True
+        assert router.db_for_read(None) == 'default'
+
+    def test_lagging_replicas_are_not_read_from(self, router, request_context, settings):
+        settings.DATABASE_REPLICA_MAX_LAG = 5
+        allow_replica_reads(request_context)
+        with mock.patch.object(router, '_check_replicas', return_value={'replica': 30}):
+            assert router.db_for_read(None) == 'default'
+
+    def test_unreachable_replicas_are_not_read_from(self, router, request_context):
+        allow_replica_reads(request_context)
+        with mock.patch.object(router, '_check_replicas', return_value={'replica': None}):
+            assert router.db_for_read(None) == 'default'
+
+    def test_replicas_are_rechecked_after_interval(self, router, request_context, settings):
+        settings.DATABASE_REPLICA_CHECK_INTERVAL = 10
+        router._get_replica()
+        router._get_replica()
+        assert router._check_replicas.call_count == 1
+        with mock.patch.object(db_router.time, 'monotonic', return_value=PostgreSQLFailoverRouter.REPLICAS_CHECKED + 11):
+            router._get_replica()
+        assert router._check_replicas.call_count == 2
+
+    def test_objects_from_master_and_replicas_may_be_related(self, router):
+        primary_obj, replica_obj = mock.Mock(), mock.Mock()
+        primary_obj._state.db, replica_obj._state.db = 'default', 'replica'
+        assert router.allow_relation(primary_obj, replica_obj) is True
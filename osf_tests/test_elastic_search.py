@@ -6,10 +6,13 @@ import time
 import unittest
 import logging
 import functools
+import datetime
 
 from nose.tools import *  # noqa: F403
 import pytest
+from django.utils import timezone
 
+from api.caching.utils import search_update_cache
 from framework.auth.core import Auth
 
 from website import settings
@@ -18,6 +21,8 @@ from website.search import elastic_search
 from website.search.util import build_query
 from website.search_migration.migrate import migrate
 from osf.models import (
+    AbstractNode,
+    QueuedSearchUpdate,
     Retraction,
     NodeLicense,
     OSFGroup,
@@ -1295,6 +1300,83 @@ class TestSearchExceptions(OsfTestCase):
         self.project.save()
 
 
+@pytest.mark.enable_search
+@pytest.mark.enable_enqueue_task
+class TestSearchUpdateQueue(OsfTestCase):
+
+    def setUp(self):
+        super(TestSearchUpdateQueue, self).setUp()
+        self.node = factories.ProjectFactory(is_public=True, title='Sittin On The Dock')
+
+    def test_repeated_updates_are_indexed_once(self):
+        mock_update = mock.Mock()
+        with mock.patch.dict(elastic_search.SEARCH_UPDATE_TYPES, {'node': mock_update}):
+            with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 60):
+                for _ in range(3):
+                    elastic_search.queue_update('node', self.node.id)
+            assert_equal(QueuedSearchUpdate.objects.filter(doc_type='node', object_id=self.node.id).count(), 1)
+            assert_false(mock_update.called)
+
+            with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 0):
+                elastic_search.flush_search_updates()
+        mock_update.assert_called_once_with([self.node.id], index=None)
+        assert_false(QueuedSearchUpdate.objects.exists())
+
+    def test_failed_flush_is_requeued(self):
+        with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 60):
+            elastic_search.queue_update('node', self.node.id)
+        first_queued = QueuedSearchUpdate.objects.get().first_queued
+
+        mock_update = mock.Mock(side_effect=elastic_search.exceptions.BulkUpdateError())
+        with mock.patch.dict(elastic_search.SEARCH_UPDATE_TYPES, {'node': mock_update}):
+            with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 0), assert_raises(elastic_search.exceptions.BulkUpdateError):
+                elastic_search.flush_search_updates()
+        update = QueuedSearchUpdate.objects.get()
+        assert_equal(update.first_queued, first_queued)
+        assert_is_none(update.claimed)
+
+    def test_abandoned_claims_are_flushed(self):
+        with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 60):
+            elastic_search.queue_update('node', self.node.id)
+        # Claimed by a flush whose worker died before indexing it
+        QueuedSearchUpdate.objects.update(claimed=timezone.now() - datetime.timedelta(seconds=settings.SEARCH_UPDATE_CLAIM_TIMEOUT + 1))
+
+        mock_update = mock.Mock()
+        with mock.patch.dict(elastic_search.SEARCH_UPDATE_TYPES, {'node': mock_update}):
+            with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 0):
+                elastic_search.flush_search_updates()
+        mock_update.assert_called_once_with([self.node.id], index=None)
+        assert_false(QueuedSearchUpdate.objects.exists())
+
+    def test_updates_queued_while_indexing_are_kept(self):
+        with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 60):
+            elastic_search.queue_update('node', self.node.id)
+
+        def save_again(ids, index=None):
+            QueuedSearchUpdate.queue('node', self.node.id)
+        with mock.patch.dict(elastic_search.SEARCH_UPDATE_TYPES, {'node': save_again}):
+            with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 0):
+                elastic_search._flush_search_update_batch(10)
+        update = QueuedSearchUpdate.objects.get()
+        assert_is_none(update.claimed)
+
+    @mock.patch('website.search.search.enqueue_postcommit_task')
+    @mock.patch('website.search.search.get_current_request')
+    def test_request_updates_are_queued_in_its_transaction(self, mock_request, mock_enqueue):
+        for _ in range(2):
+            search.queue_update('node', self.node.id)
+        assert_equal(QueuedSearchUpdate.objects.filter(doc_type='node', object_id=self.node.id).count(), 1)
+        mock_enqueue.assert_called_once_with(elastic_search.schedule_search_flush, (), {}, celery=False)
+
+    def test_flush_indexes_in_bulk(self):
+        AbstractNode.objects.filter(id=self.node.id).update(title='Dock Of The Bay')
+        with mock.patch.object(settings, 'SEARCH_UPDATE_DEBOUNCE', 0):
+            elastic_search.queue_update('node', self.node.id)
+        elastic_search.client().indices.refresh(index=settings.ELASTIC_INDEX)
+        assert_equal(len(query('category:project AND "Dock Of The Bay"')['results']), 1)
+        assert_false(QueuedSearchUpdate.objects.exists())
+
+
 @pytest.mark.enable_search
 @pytest.mark.enable_enqueue_task
 class TestSearchMigration(OsfTestCase):
@@ -1473,6 +1555,28 @@ class TestSearchFiles(OsfTestCase):
         find = query_file('Try a Little Tenderness.flac')['results']
         assert_equal(len(find), 1)
 
+    def test_make_node_private_removes_files_in_chunks(self):
+        for name in ('Respect.mp3', 'Respect Live.mp3', 'Respect Demo.mp3'):
+            self.root.append_file(name)
+        assert_equal(len(query_file('Respect')['results']), 3)
+        self.node.is_public = False
+        with mock.patch.object(settings, 'ELASTIC_BULK_CHUNK_SIZE', 2), run_celery_tasks():
+            self.node.save()
+        assert_equal(len(query_file('Respect')['results']), 0)
+
+    def test_unchanged_node_files_are_not_reindexed(self):
+        self.root.append_file('Mr. Pitiful.mp3')
+        search_update_cache.clear()
+        with mock.patch.object(elastic_search.helpers, 'bulk', wraps=elastic_search.helpers.bulk) as mock_bulk:
+            elastic_search.update_node(self.node)
+            elastic_search.update_node(self.node)
+            assert_equal(mock_bulk.call_count, 1)
+
+            self.node.title = 'Otis Blue'
+            elastic_search.update_node(self.node)
+            assert_equal(mock_bulk.call_count, 2)
+        assert_equal(query_file('Mr. Pitiful.mp3')['results'][0]['node_title'], 'Otis Blue')
+
     def test_delete_node(self):
         node = factories.ProjectFactory(is_public=True, title='The Soul Album')
         osf_storage = node.get_addon('osfstorage')
@@ -1,3 +1,4 @@
+import gzip
 import os
 
 import pytest
@@ -18,16 +19,22 @@ def get_all_sitemap_urls():
 
     generate_sitemap.main()
 
-    # Parse the generated XML sitemap file
-    with open(os.path.join(settings.STATIC_FOLDER, 'sitemaps/sitemap_0.xml')) as f:
-        tree = xml.etree.ElementTree.parse(f)
-
-    shutil.rmtree(settings.STATIC_FOLDER)
-
-    # Get all the urls in the sitemap
     # Note: namespace was defined in the XML file, therefore necessary to include in tag
     namespace = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
-    urls = [element.text for element in tree.iter(namespace + 'loc')]
+
+    # Parse the generated XML sitemap files listed in the index
+    sitemap_dir = os.path.join(settings.STATIC_FOLDER, 'sitemaps')
+    with open(os.path.join(sitemap_dir, 'sitemap_index.xml')) as f:
+        index = xml.etree.ElementTree.parse(f)
+
+    urls = []
+    for element in index.iter(namespace + 'loc'):
+        with gzip.open(os.path.join(sitemap_dir, os.path.basename(element.text) + '.gz')) as f:
+            tree = xml.etree.ElementTree.parse(f)
+        # Get all the urls in the sitemap
+        urls.extend(element.text for element in tree.iter(namespace + 'loc'))
+
+    shutil.rmtree(settings.STATIC_FOLDER)
 
     return urls
 
@@ -175,3 +182,22 @@ class TestGenerateSitemap:
             urls = get_all_sitemap_urls()
 
         assert urljoin(settings.DOMAIN, project_deleted.url) not in urls
+
+    def test_only_changed_shards_are_regenerated(self, project_registration_public, create_tmp_directory):
+
+        with mock.patch('website.settings.STATIC_FOLDER', create_tmp_directory):
+            generate_sitemap.main()
+
+            with mock.patch.object(generate_sitemap.Sitemap, 'write_shard', autospec=True,
+                                   side_effect=generate_sitemap.Sitemap.write_shard) as write_shard:
+                generate_sitemap.main()
+                assert not write_shard.called
+
+                project_registration_public.title = 'Changed'
+                project_registration_public.save()
+                generate_sitemap.main()
+                assert [call[0][1] for call in write_shard.call_args_list] == ['sitemap_node_0']
+
+            urls = get_all_sitemap_urls()
+
+        assert urljoin(settings.DOMAIN, project_registration_public.url) in urls
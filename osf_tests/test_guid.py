@@ -3,8 +3,13 @@ import pytest
 from future.moves.urllib.parse import quote
 from django.utils import timezone
 from django.core.exceptions import MultipleObjectsReturned
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from osf.models import Guid, NodeLicenseRecord, OSFUser
+from api.caching.utils import guid_resolution_cache, GUID_RESOLUTION_KEY
+from osf.management.commands.refill_guid_pool import refill_guid_pool
+from osf.models import AbstractNode, BlackListGuid, Guid, NodeLicenseRecord, OSFUser, ReservedGuid
+from osf.models.base import ensure_guids, generate_guid, generate_guids, local_guid_resolution_cache
 from osf_tests.factories import AuthUserFactory, UserFactory, NodeFactory, NodeLicenseRecordFactory, \
     RegistrationFactory, PreprintFactory, PreprintProviderFactory
 from osf.utils.permissions import ADMIN
@@ -129,6 +134,141 @@ class TestReferent:
             pytest.fail('Multiple objects returned for {} with multiple guids. {}'.format(Factory._meta.model, ex))
 
 
+@pytest.mark.django_db
+class TestGuidResolution:
+
+    def test_load_is_cached(self, django_assert_num_queries):
+        user = UserFactory()
+        assert Guid.load(user._id).referent == user
+        with django_assert_num_queries(0):
+            guid = Guid.load(user._id)
+        assert guid.pk == user.guids.first().pk
+        assert guid._id == user._id
+        assert guid.object_id == user.pk
+
+    def test_shared_cache_is_used_by_other_processes(self, request_context, django_assert_num_queries):
+        user = UserFactory()
+        Guid.load(user._id)
+        local_guid_resolution_cache.clear()
+        assert guid_resolution_cache.get(GUID_RESOLUTION_KEY.format(guid=user._id))
+        with django_assert_num_queries(1):  # the shared cache table
+            assert Guid.load(user._id).object_id == user.pk
+
+    def test_load_is_case_insensitive(self):
+        user = UserFactory()
+        assert OSFUser.load(user._id.upper()) == user
+
+    def test_load_of_other_model_returns_none(self):
+        user = UserFactory()
+        assert AbstractNode.load(user._id) is None
+        assert OSFUser.load(user._id) == user
+
+    def test_missing_guid(self):
+        assert Guid.load('nope1') is None
+        assert OSFUser.load('nope1') is None
+
+    def test_repoint_invalidates(self):
+        user, other = UserFactory(), UserFactory()
+        assert OSFUser.load(user._id) == user
+        guid = Guid.objects.get(_id=user._id)
+        guid.referent = other
+        guid.save()
+        assert OSFUser.load(guid._id) == other
+
+    def test_repoint_invalidates_shared_cache(self, request_context):
+        user, other = UserFactory(), UserFactory()
+        assert OSFUser.load(user._id) == user
+        guid = Guid.objects.get(_id=user._id)
+        guid.referent = other
+        guid.save()
+        local_guid_resolution_cache.clear()
+        assert guid_resolution_cache.get(GUID_RESOLUTION_KEY.format(guid=user._id)) is None
+        assert OSFUser.load(guid._id) == other
+
+    def test_delete_invalidates(self):
+        user = UserFactory()
+        guid = Guid.load(user._id)
+        Guid.objects.get(pk=guid.pk).delete()
+        assert Guid.load(guid._id) is None
+        assert OSFUser.load(guid._id) is None
+
+    def test_resolve_many(self):
+        users = UserFactory.create_batch(3)
+        node = NodeFactory()
+        Guid.load(users[0]._id)
+        with CaptureQueriesContext(connection) as queries:
+            resolved = Guid.resolve([user._id for user in users] + [node._id, 'nope1'])
+        assert len([query for query in queries if 'FROM "osf_guid"' in query['sql']]) == 1
+        assert set(resolved) == {user._id for user in users} | {node._id}
+        assert resolved[node._id].object_id == node.pk
+
+    def test_load_many(self, django_assert_num_queries):
+        users = UserFactory.create_batch(3)
+        node = NodeFactory()
+        guids = [user._id for user in users] + [node._id, 'nope1']
+        Guid.resolve(guids)
+        with django_assert_num_queries(1):
+            loaded = OSFUser.load_many(guids)
+        assert loaded == {user._id: user for user in users}
+
+
+@pytest.mark.django_db
+class TestGuidPool:
+
+    def test_guids_are_claimed_from_the_pool(self):
+        assert ReservedGuid.refill(10) == 10
+        reserved = set(ReservedGuid.objects.values_list('_id', flat=True))
+        guids = generate_guids(3)
+        assert len(set(guids)) == 3
+        assert set(guids) <= reserved
+        assert ReservedGuid.objects.count() == 7
+
+    def test_guids_are_generated_once_the_pool_is_empty(self):
+        ReservedGuid.refill(2)
+        guids = generate_guids(5)
+        assert len(set(guids)) == 5
+        assert not ReservedGuid.objects.exists()
+        assert not Guid.objects.filter(_id__in=guids).exists()
+
+    def test_claim_drops_guids_taken_since_they_were_reserved(self):
+        ReservedGuid.objects.create(_id='abcde')
+        Guid.objects.create(_id='abcde')
+        assert ReservedGuid.claim(1) == []
+        assert not ReservedGuid.objects.exists()
+
+    def test_refill_skips_taken_guids(self):
+        Guid.objects.create(_id='abcde')
+        BlackListGuid.objects.create(guid='fghjk')
+        with mock.patch('osf.models.base._random_guids', return_value={'abcde', 'fghjk', 'mnpqr'}):
+            assert ReservedGuid.refill(3) == 1
+        assert list(ReservedGuid.objects.values_list('_id', flat=True)) == ['mnpqr']
+
+    def test_generated_guids_are_not_taken(self):
+        Guid.objects.create(_id='abcde')
+        BlackListGuid.objects.create(guid='fghjk')
+        ReservedGuid.objects.create(_id='mnpqr')
+        candidates = [{'abcde'}, {'fghjk'}, {'mnpqr'}, {'stuvw'}]
+        with mock.patch('osf.models.base._random_guids', side_effect=candidates):
+            assert generate_guid(length=6) == 'stuvw'
+
+    def test_refill_guid_pool(self):
+        assert refill_guid_pool(size=25, batch_size=10) == 25
+        assert ReservedGuid.objects.count() == 25
+        assert refill_guid_pool(size=25, batch_size=10) == 0
+
+    def test_ensure_guids(self):
+        users = OSFUser.objects.bulk_create([
+            OSFUser(username='bulk{}@example.com'.format(i), fullname='Bulk {}'.format(i)) for i in range(3)
+        ])
+        assert not Guid.objects.filter(object_id__in=[user.pk for user in users]).exists()
+        ReservedGuid.refill(2)
+        guids = ensure_guids(users)
+        assert len(guids) == 3
+        assert {guid.referent for guid in guids} == set(users)
+        assert all(len(user._id) == 5 for user in users)
+        assert ensure_guids(users) == []
+
+
 @pytest.mark.enable_bookmark_creation
 class TestResolveGuid(OsfTestCase):
 
@@ -5,6 +5,7 @@ import pytest
 import pytz
 import responses
 
+from django.db import transaction
 from django.utils import timezone
 from framework.celery_tasks import handlers
 from framework.exceptions import PermissionsError
@@ -32,7 +33,9 @@ from osf.models import (
     Contributor,
     RegistrationSchema,
     Sanction,
+    NodeEffectivePermission,
     NodeRelation,
+    NodeTreeClosure,
     Registration,
     DraftRegistration,
     DraftRegistrationApproval,
@@ -40,6 +43,7 @@ from osf.models import (
 )
 
 from addons.wiki.models import WikiPage, WikiVersion
+from guardian.shortcuts import assign_perm
 from osf.models.node import AbstractNodeQuerySet
 from osf.exceptions import ValidationError, ValidationValueError, UserStateError
 from osf.utils.workflows import DefaultStates
@@ -532,6 +536,46 @@ class TestRoot:
         new_project_grandchild = NodeFactory(parent=new_project_child)
         assert new_project_grandchild.root._id == new_project._id
 
+    def test_tree_closure_follows_node_relations(self, project, auth):
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+        project.add_pointer(NodeFactory(), auth=auth)
+
+        ancestors = NodeTreeClosure.objects.filter(descendant=grandchild).values_list('ancestor_id', 'depth')
+        assert set(ancestors) == {(child.id, 1), (project.id, 2)}
+        assert grandchild.parents == [child, project]
+        assert set(NodeTreeClosure.objects.filter(ancestor=project).values_list('descendant_id', flat=True)) == {child.id, grandchild.id}
+
+        NodeRelation.objects.get(parent=project, child=child).delete()
+
+        assert list(ancestors) == [(child.id, 1)]
+        assert grandchild.get_root() == child
+        assert grandchild.parents == [child]
+
+    def test_tree_closure_follows_node_relation_updates(self, project, auth):
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+        other_project = ProjectFactory(creator=project.creator)
+
+        relation = NodeRelation.objects.get(parent=project, child=child)
+        relation.parent = other_project
+        relation.save()
+        ancestors = NodeTreeClosure.objects.filter(descendant=grandchild).values_list('ancestor_id', 'depth')
+        assert set(ancestors) == {(child.id, 1), (other_project.id, 2)}
+
+        relation.is_node_link = True
+        relation.save()
+        assert set(ancestors) == {(child.id, 1)}
+
+        NodeRelation.objects.filter(pk=relation.pk).update(is_node_link=False)
+        assert set(ancestors) == {(child.id, 1), (other_project.id, 2)}
+
+        NodeRelation.objects.filter(pk=relation.pk).update(parent=project)
+        assert set(ancestors) == {(child.id, 1), (project.id, 2)}
+
+        NodeRelation.objects.filter(pk=relation.pk).update(is_node_link=True)
+        assert set(ancestors) == {(child.id, 1)}
+
     def test_node_find_returns_correct_nodes(self, project):
         # Build up a family of nodes
         child_node_one = NodeFactory(parent=project)
@@ -4472,6 +4516,48 @@ class TestAdminImplicitRead(object):
         assert lvl2component in qs
         assert lvl3component in qs
 
+    def test_follows_contributor_and_relation_changes(self, admin_user, creator, project, lvl1component, lvl2component):
+        assert lvl2component in Node.objects.can_view(admin_user)
+
+        NodeRelation.objects.get(parent=project, child=lvl1component).delete()
+        assert lvl2component not in Node.objects.can_view(admin_user)
+
+        lvl1component.add_contributor(admin_user, permissions=ADMIN, auth=Auth(lvl1component.creator), save=True)
+        assert lvl2component in Node.objects.can_view(admin_user)
+        assert lvl1component in Node.objects.get_nodes_for_user(admin_user, permissions.ADMIN_NODE)
+        assert lvl2component not in Node.objects.get_nodes_for_user(admin_user, permissions.READ_NODE)
+
+        lvl1component.remove_contributor(admin_user, auth=Auth(lvl1component.creator))
+        assert lvl1component not in Node.objects.can_view(admin_user)
+        assert lvl2component not in Node.objects.can_view(admin_user)
+
+    def test_direct_user_permissions_are_ignored(self, jane_doe, lvl1component):
+        # Like has_permission, only group permissions count
+        assign_perm(permissions.READ_NODE, jane_doe, lvl1component)
+        assert not lvl1component.has_permission(jane_doe, permissions.READ)
+        assert lvl1component not in Node.objects.get_nodes_for_user(jane_doe, permissions.READ_NODE)
+
+    def test_refreshes_once_per_transaction(self, creator, project):
+        with mock.patch.object(NodeEffectivePermission, 'refresh', wraps=NodeEffectivePermission.refresh) as mock_refresh:
+            with transaction.atomic():
+                component = NodeFactory(parent=project, creator=creator)
+                other_component = NodeFactory(parent=project, creator=creator)
+                assert not mock_refresh.called
+                assert component in Node.objects.can_view(creator)
+                assert other_component in Node.objects.can_view(creator)
+        assert mock_refresh.call_count == 1
+
+    def test_reconcile_refreshes_drifted_nodes(self, admin_user, jane_doe, project, lvl1component):
+        NodeEffectivePermission.flush()
+        NodeEffectivePermission.objects.filter(node=lvl1component, user=admin_user).delete()
+        NodeEffectivePermission.objects.create(node=project, user=jane_doe, permission=permissions.READ_NODE)
+        assert set(NodeEffectivePermission.stale_node_ids(project.id, lvl1component.id)) == {project.id, lvl1component.id}
+
+        assert NodeEffectivePermission.reconcile(batch_size=1000) == 2
+        assert lvl1component in Node.objects.can_view(admin_user)
+        assert project not in Node.objects.can_view(jane_doe)
+        assert not NodeEffectivePermission.stale_node_ids(project.id, lvl1component.id)
+
     def test_private_link(self, jane_doe, project, lvl1component):
         pl = PrivateLinkFactory()
         lvl1component.private_links.add(pl)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""Micro-benchmark for the WaterButler `get_auth` callback.
+
+Replays recorded WaterButler payloads against the callback in-process and reports latency
+percentiles and database queries per call. Payloads are read from a file with one JSON object per
+line, holding the `data` WaterButler signs for the callback plus optional request headers, e.g. ::
+
+    {"data": {"action": "download", "nid": "abc12", "provider": "osfstorage", "path": "/5e8f...",
+              "metrics": {"uri": "..."}}, "headers": {"Authorization": "Bearer ..."}}
+
+Run against a development database: the callback records views, downloads and "seen" versions.
+
+    python3 -m scripts.benchmark_get_auth payloads.jsonl --iterations 1000
+"""
+import argparse
+import datetime
+import json
+import logging
+import time
+
+import django
+django.setup()
+
+import jwe
+import jwt
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from website import settings
+from website.app import init_app
+from website.util import api_url_for
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+WATERBUTLER_JWE_KEY = jwe.kdf(settings.WATERBUTLER_JWE_SECRET.encode('utf-8'), settings.WATERBUTLER_JWE_SALT.encode('utf-8'))
+
+
+def load_payloads(path):
+    with open(path) as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def encrypt_payload(data):
+    return jwe.encrypt(jwt.encode({
+        'data': data,
+        'exp': timezone.now() + datetime.timedelta(seconds=settings.WATERBUTLER_JWT_EXPIRATION),
+    }, settings.WATERBUTLER_JWT_SECRET, algorithm=settings.WATERBUTLER_JWT_ALGORITHM), WATERBUTLER_JWE_KEY).decode()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def replay(client, payloads, iterations):
+    timings, query_counts, errors = [], [], 0
+    for i in range(iterations):
+        recorded = payloads[i % len(payloads)]
+        url = api_url_for('get_auth', payload=encrypt_payload(recorded['data']))
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            resp = client.get(url, headers=recorded.get('headers', {}))
+            timings.append(time.perf_counter() - start)
+        query_counts.append(len(queries))
+        if resp.status_code != 200:
+            errors += 1
+    return timings, query_counts, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays recorded WaterButler payloads against get_auth')
+    parser.add_argument('payloads', help='file of recorded payloads, one JSON object per line')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50, help='calls made before measuring')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads)
+    if not payloads:
+        parser.error('no payloads in {}'.format(args.payloads))
+
+    app = init_app(routes=True, set_backends=True)
+    client = app.test_client()
+    with app.test_request_context():
+        replay(client, payloads, args.warmup)
+        timings, query_counts, errors = replay(client, payloads, args.iterations)
+
+    timings.sort()
+    logger.info('{} calls, {} errors'.format(len(timings), errors))
+    logger.info('latency ms: p50={:.2f} p95={:.2f} p99={:.2f} max={:.2f}'.format(
+        *[1000 * value for value in (percentile(timings, .5), percentile(timings, .95), percentile(timings, .99), timings[-1])]
+    ))
+    logger.info('queries per call: mean={:.1f} max={}'.format(sum(query_counts) / len(query_counts), max(query_counts)))
+
+
+if __name__ == '__main__':
+    main()
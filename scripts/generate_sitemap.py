@@ -1,24 +1,33 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""Generate a sitemap for osf.io"""
+"""Generate a sitemap for osf.io
+
+Urls are split into shards by object id range, so a shard keeps the same objects from run to run.
+A manifest stores a fingerprint of every shard written; on the next run only shards whose
+fingerprint changed are regenerated, and each is streamed from a server side cursor straight to
+its xml and gzipped files.
+"""
 import boto3
 import datetime
 import gzip
+import hashlib
+import json
 import os
 import shutil
-from future.moves.urllib.parse import urlparse, urljoin
-import xml
+from collections import OrderedDict
+from future.moves.urllib.parse import urljoin
+from xml.sax.saxutils import escape
 
 import django
 django.setup()
 import logging
 import tempfile
 
+from botocore.exceptions import ClientError
 from framework import sentry
 from framework.celery_tasks import app as celery_app
-from django.db.models import Q
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max, Sum
 from osf.models import OSFUser, AbstractNode, Preprint, PreprintProvider
-from osf.utils.workflows import DefaultStates
 from scripts import utils as script_utils
 from website import settings
 from website.app import init_app
@@ -26,12 +35,53 @@ from website.app import init_app
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+MANIFEST_FILE_NAME = 'sitemap_manifest.json'
+
+
+def fingerprint(value):
+    return hashlib.sha256(json.dumps(value, default=str).encode('utf-8')).hexdigest()
+
+
+class SitemapWriter(object):
+    """Streams a urlset to a sitemap xml file and its gzipped copy"""
+
+    def __init__(self, file_path):
+        self.url_count = 0
+        self.xml_file = open(file_path, 'wb')
+        self.gzip_file = gzip.open(file_path + '.gz', 'wb')
+        self.write('<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{}">\n'.format(SITEMAP_NAMESPACE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.xml_file.write(data)
+        self.gzip_file.write(data)
+
+    def add_url(self, config, **values):
+        """Adds a url with the tags in `config`, taking the text of each tag from `values` if given"""
+        tags = ''.join('<{0}>{1}</{0}>'.format(name, escape(values.get(name, text))) for name, text in config.items())
+        self.write('  <url>{}</url>\n'.format(tags))
+        self.url_count += 1
+
+    def close(self):
+        self.write('</urlset>\n')
+        self.xml_file.close()
+        self.gzip_file.close()
+
 
 class Sitemap(object):
     def __init__(self):
-        self.sitemap_count = 0
         self.errors = 0
-        self.new_doc()
+        self.url_count = 0
+        self.written_count = 0
+        self.shards = OrderedDict()
+        self.progress = script_utils.Progress(precision=0)
         if not settings.SITEMAP_TO_S3:
             self.sitemap_dir = os.path.join(settings.STATIC_FOLDER, 'sitemaps')
             if not os.path.exists(self.sitemap_dir):
@@ -48,58 +98,25 @@ class Sitemap(object):
                 aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
                 region_name='us-east-1'
             )
+        self.providers = {
+            provider['id']: provider
+            for provider in PreprintProvider.objects.values('id', '_id', 'domain', 'domain_redirect_enabled')
+        }
+        self.layout = fingerprint([
+            settings.DOMAIN,
+            settings.SITEMAP_URL_MAX,
+            settings.SITEMAP_USER_CONFIG,
+            settings.SITEMAP_NODE_CONFIG,
+            settings.SITEMAP_PREPRINT_CONFIG,
+            settings.SITEMAP_PREPRINT_FILE_CONFIG,
+            sorted(self.providers.items()),
+        ])
+        self.previous_shards = self.read_manifest()
 
     def cleanup(self):
         if settings.SITEMAP_TO_S3:
             shutil.rmtree(self.sitemap_dir)
 
-    def new_doc(self):
-        """Creates new sitemap document and resets the url_count."""
-        self.doc = xml.dom.minidom.Document()
-        self.urlset = self.doc.createElement('urlset')
-        self.urlset.setAttribute('xmlns', 'http://www.sitemaps.org/schemas/sitemap/0.9')
-        self.doc.appendChild(self.urlset)
-        self.url_count = 0
-
-    def add_tag(self, name, text):
-        """Adds a tag to the current url"""
-        tag = self.doc.createElement(name)
-        self.url.appendChild(tag)
-        tag_text = self.doc.createTextNode(text)
-        tag.appendChild(tag_text)
-
-    def add_url(self, config):
-        """Adds a url to the current urlset"""
-        if self.url_count >= settings.SITEMAP_URL_MAX:
-            self.write_doc()
-            self.new_doc()
-        self.url = self.doc.createElement('url')
-        self.urlset.appendChild(self.url)
-
-        for k, v in config.items():
-            self.add_tag(k, v)
-        self.url_count += 1
-
-    def write_doc(self):
-        """Writes and gzips each sitemap xml file"""
-        file_name = 'sitemap_{}.xml'.format(str(self.sitemap_count))
-        file_path = os.path.join(self.sitemap_dir, file_name)
-        zip_file_name = file_name + '.gz'
-        zip_file_path = file_path + '.gz'
-        print('Writing and gzipping `{}`: url_count = {}'.format(file_path, str(self.url_count)))
-
-        xml_str = self.doc.toprettyxml(indent='  ', encoding='utf-8')
-        with open(file_path, 'wb') as f:
-            f.write(xml_str)
-
-        # Write zipped file
-        with open(file_path, 'rb') as f_in, gzip.open(zip_file_path, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-        if settings.SITEMAP_TO_S3:
-            self.ship_to_s3(file_name, file_path)
-            self.ship_to_s3(zip_file_name, zip_file_path)
-        self.sitemap_count += 1
-
     def ship_to_s3(self, name, path):
         data = open(path, 'rb')
         try:
@@ -110,35 +127,104 @@ class Sitemap(object):
             sentry.log_message('ERROR: Sitemaps could not be uploaded to s3, see `generate_sitemap` logs')
         data.close()
 
-    def write_sitemap_index(self):
-        """Writes the index file for all of the sitemap files"""
-        doc = xml.dom.minidom.Document()
-        sitemap_index = self.doc.createElement('sitemapindex')
-        sitemap_index.setAttribute('xmlns', 'http://www.sitemaps.org/schemas/sitemap/0.9')
-        doc.appendChild(sitemap_index)
-
-        for f in range(self.sitemap_count):
-            sitemap = doc.createElement('sitemap')
-            sitemap_index.appendChild(sitemap)
+    def remove_file(self, name):
+        if settings.SITEMAP_TO_S3:
+            try:
+                self.s3.Object(settings.SITEMAP_AWS_BUCKET, 'sitemaps/{}'.format(name)).delete()
+            except Exception as e:
+                logger.info('Error deleting data from s3 via boto3')
+                logger.exception(e)
+        else:
+            file_path = os.path.join(self.sitemap_dir, name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
-            loc = doc.createElement('loc')
-            sitemap.appendChild(loc)
-            loc_text = self.doc.createTextNode(urljoin(settings.DOMAIN, 'sitemaps/sitemap_{}.xml'.format(str(f))))
-            loc.appendChild(loc_text)
+    def read_manifest(self):
+        """Returns the shards written by the last run, or nothing if the layout of the urls has changed since"""
+        try:
+            if settings.SITEMAP_TO_S3:
+                manifest = self.s3.Object(settings.SITEMAP_AWS_BUCKET, 'sitemaps/{}'.format(MANIFEST_FILE_NAME)).get()['Body'].read()
+            else:
+                with open(os.path.join(self.sitemap_dir, MANIFEST_FILE_NAME), 'rb') as f:
+                    manifest = f.read()
+            manifest = json.loads(manifest.decode('utf-8'))
+        except (ClientError, IOError, ValueError):
+            return {}
+        if manifest.get('layout') != self.layout:
+            return {}
+        return manifest['shards']
+
+    def write_manifest(self):
+        file_path = os.path.join(self.sitemap_dir, MANIFEST_FILE_NAME)
+        with open(file_path, 'w') as f:
+            json.dump({'layout': self.layout, 'shards': self.shards}, f)
+        if settings.SITEMAP_TO_S3:
+            self.ship_to_s3(MANIFEST_FILE_NAME, file_path)
 
-            datemod = doc.createElement('lastmod')
-            sitemap.appendChild(datemod)
-            datemod_text = self.doc.createTextNode(datetime.datetime.now().strftime('%Y-%m-%d'))
-            datemod.appendChild(datemod_text)
+    def is_current(self, name, shard_fingerprint):
+        previous = self.previous_shards.get(name)
+        if not previous or previous['fingerprint'] != shard_fingerprint:
+            return False
+        return settings.SITEMAP_TO_S3 or os.path.exists(os.path.join(self.sitemap_dir, '{}.xml'.format(name)))
 
-        print('Writing `sitemap_index.xml`')
-        file_name = 'sitemap_index.xml'
+    def write_shard(self, name, shard_fingerprint, urls):
+        """Streams the urls of a shard to its xml and gzipped files"""
+        file_name = '{}.xml'.format(name)
         file_path = os.path.join(self.sitemap_dir, file_name)
-        xml_str = doc.toprettyxml(indent='  ', encoding='utf-8')
-        with open(file_path, 'wb') as f:
-            f.write(xml_str)
+        with SitemapWriter(file_path) as writer:
+            for config, values in urls:
+                writer.add_url(config, **values)
+                self.progress.increment()
+        print('Wrote and gzipped `{}`: url_count = {}'.format(file_path, writer.url_count))
         if settings.SITEMAP_TO_S3:
             self.ship_to_s3(file_name, file_path)
+            self.ship_to_s3(file_name + '.gz', file_path + '.gz')
+        self.written_count += 1
+        return {
+            'fingerprint': shard_fingerprint,
+            'lastmod': datetime.datetime.now().strftime('%Y-%m-%d'),
+            'url_count': writer.url_count,
+        }
+
+    def add_shard(self, name, shard_fingerprint, urls):
+        if self.is_current(name, shard_fingerprint):
+            self.shards[name] = self.previous_shards[name]
+        else:
+            self.shards[name] = self.write_shard(name, shard_fingerprint, urls)
+        self.url_count += self.shards[name]['url_count']
+
+    def shard_fingerprints(self, queryset, shard_size, track_modified=True):
+        """Returns a fingerprint of each id range of `queryset` that has any rows, with its row count"""
+        aggregates = {'row_count': Count('id'), 'id_sum': Sum('id')}
+        if track_modified:
+            aggregates['last_modified'] = Max('modified')
+        shards = (queryset
+            .annotate(shard=ExpressionWrapper(F('id') / shard_size, output_field=IntegerField()))
+            .values('shard')
+            .annotate(**aggregates)
+            .order_by('shard'))
+        return OrderedDict(
+            (shard.pop('shard'), (fingerprint(sorted(shard.items())), shard['row_count']))
+            for shard in shards
+        )
+
+    def add_sections(self, section, queryset, fields, get_urls, urls_per_row=1, track_modified=True):
+        shard_size = settings.SITEMAP_URL_MAX // urls_per_row
+        shards = OrderedDict(
+            ('sitemap_{}_{}'.format(section, shard), (shard, shard_fingerprint, row_count))
+            for shard, (shard_fingerprint, row_count) in self.shard_fingerprints(queryset, shard_size, track_modified).items()
+        )
+        stale = [name for name, (shard, shard_fingerprint, row_count) in shards.items() if not self.is_current(name, shard_fingerprint)]
+        self.progress.start(sum(shards[name][2] for name in stale) * urls_per_row, '{}: '.format(section[:4].upper()))
+        for name, (shard, shard_fingerprint, row_count) in shards.items():
+            rows = (queryset
+                .filter(id__gte=shard * shard_size, id__lt=(shard + 1) * shard_size)
+                .order_by('id')
+                .values_list(*fields)
+                .iterator())
+            self.add_shard(name, shard_fingerprint, get_urls(rows))
+        self.progress.stop()
+        print('{}: {} of {} shards changed'.format(section, len(stale), len(shards)))
 
     def log_errors(self, obj, obj_id, error):
         if not self.errors:
@@ -154,101 +240,118 @@ class Sitemap(object):
             sentry.log_message('ERROR: generate_sitemap stopped execution after reaching 1000 errors. See logs for details.')
             raise Exception('Too many errors generating sitemap.')
 
-    def generate(self):
-        print('Generating Sitemap')
-
-        # Progress bar
-        progress = script_utils.Progress(precision=0)
-
-        # Static urls
-        progress.start(len(settings.SITEMAP_STATIC_URLS), 'STAT: ')
+    def static_urls(self):
         for config in settings.SITEMAP_STATIC_URLS:
-            config['loc'] = urljoin(settings.DOMAIN, config['loc'])
-            self.add_url(config)
-            progress.increment()
-        progress.stop()
+            yield config, {'loc': urljoin(settings.DOMAIN, config['loc'])}
 
-        # User urls
-        objs = OSFUser.objects.filter(is_active=True).exclude(date_confirmed__isnull=True).values_list('guids___id', flat=True)
-        progress.start(objs.count(), 'USER: ')
-        for obj in objs:
+    def user_urls(self, rows):
+        for guid, in rows:
+            yield settings.SITEMAP_USER_CONFIG, {'loc': urljoin(settings.DOMAIN, '/{}/'.format(guid))}
+
+    def node_urls(self, rows):
+        for guid, modified in rows:
             try:
-                config = settings.SITEMAP_USER_CONFIG
-                config['loc'] = urljoin(settings.DOMAIN, '/{}/'.format(obj))
-                self.add_url(config)
+                values = {
+                    'loc': urljoin(settings.DOMAIN, '/{}/'.format(guid)),
+                    'lastmod': modified.strftime('%Y-%m-%d'),
+                }
             except Exception as e:
-                self.log_errors('USER', obj, e)
-            progress.increment()
-        progress.stop()
+                self.log_errors('NODE', guid, e)
+                continue
+            yield settings.SITEMAP_NODE_CONFIG, values
 
-        # AbstractNode urls (Nodes and Registrations, no Collections)
-        objs = (AbstractNode.objects
-            .filter(is_public=True, is_deleted=False, retraction_id__isnull=True)
-            .exclude(type__in=['osf.collection', 'osf.quickfilesnode'])
-            .values('guids___id', 'modified'))
-        progress.start(objs.count(), 'NODE: ')
-        for obj in objs:
+    def preprint_urls(self, rows):
+        for guid, modified, provider_id in rows:
             try:
-                config = settings.SITEMAP_NODE_CONFIG
-                config['loc'] = urljoin(settings.DOMAIN, '/{}/'.format(obj['guids___id']))
-                config['lastmod'] = obj['modified'].strftime('%Y-%m-%d')
-                self.add_url(config)
+                provider = self.providers[provider_id]
+                preprint_date = modified.strftime('%Y-%m-%d')
+                if provider['domain_redirect_enabled'] and provider['domain']:
+                    domain, preprint_url = provider['domain'], '/{}/'.format(guid)
+                else:
+                    domain, preprint_url = settings.DOMAIN, '/preprints/{}/{}/'.format(provider['_id'], guid)
+                if provider['_id'] == 'osf':
+                    preprint_url = '/preprints/{}/'.format(guid)
+                values = {'loc': urljoin(domain, preprint_url), 'lastmod': preprint_date}
+                file_values = {
+                    'loc': urljoin(provider['domain'] or settings.DOMAIN, os.path.join(guid, 'download', '?format=pdf')),
+                    'lastmod': preprint_date,
+                }
             except Exception as e:
-                self.log_errors('NODE', obj['guids___id'], e)
-            progress.increment()
-        progress.stop()
+                self.log_errors('PREPRINT', guid, e)
+                continue
+            yield settings.SITEMAP_PREPRINT_CONFIG, values
+            yield settings.SITEMAP_PREPRINT_FILE_CONFIG, file_values
 
-        # Preprint urls
+    def write_sitemap_index(self):
+        """Writes the index file for all of the sitemap files"""
+        print('Writing `sitemap_index.xml`')
+        file_name = 'sitemap_index.xml'
+        file_path = os.path.join(self.sitemap_dir, file_name)
+        with open(file_path, 'wb') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{}">\n'.format(SITEMAP_NAMESPACE).encode('utf-8'))
+            for name, shard in self.shards.items():
+                f.write('  <sitemap><loc>{}</loc><lastmod>{}</lastmod></sitemap>\n'.format(
+                    escape(urljoin(settings.DOMAIN, 'sitemaps/{}.xml'.format(name))),
+                    shard['lastmod'],
+                ).encode('utf-8'))
+            f.write(b'</sitemapindex>\n')
+        if settings.SITEMAP_TO_S3:
+            self.ship_to_s3(file_name, file_path)
 
-        objs = (Preprint.objects.can_view()
-                    .select_related('node', 'provider', 'primary_file'))
-        progress.start(objs.count() * 2, 'PREP: ')
-        osf = PreprintProvider.objects.get(_id='osf')
-        for obj in objs:
-            try:
-                preprint_date = obj.modified.strftime('%Y-%m-%d')
-                config = settings.SITEMAP_PREPRINT_CONFIG
-                preprint_url = obj.url
-                provider = obj.provider
-                domain = provider.domain if (provider.domain_redirect_enabled and provider.domain) else settings.DOMAIN
-                if provider == osf:
-                    preprint_url = '/preprints/{}/'.format(obj._id)
-                config['loc'] = urljoin(domain, preprint_url)
-                config['lastmod'] = preprint_date
-                self.add_url(config)
-
-                # Preprint file urls
-                try:
-                    file_config = settings.SITEMAP_PREPRINT_FILE_CONFIG
-                    file_config['loc'] = urljoin(
-                        obj.provider.domain or settings.DOMAIN,
-                        os.path.join(
-                            obj._id,
-                            'download',
-                            '?format=pdf'
-                        )
-                    )
-                    file_config['lastmod'] = preprint_date
-                    self.add_url(file_config)
-                except Exception as e:
-                    self.log_errors(obj.primary_file, obj.primary_file._id, e)
-            except Exception as e:
-                self.log_errors(obj, obj._id, e)
-            progress.increment(2)
-        progress.stop()
+    def remove_stale_shards(self):
+        for name in self.previous_shards:
+            if name not in self.shards:
+                print('Removing `{}.xml`'.format(name))
+                self.remove_file('{}.xml'.format(name))
+                self.remove_file('{}.xml.gz'.format(name))
+
+    def generate(self):
+        print('Generating Sitemap')
+
+        # Static urls
+        self.progress.start(len(settings.SITEMAP_STATIC_URLS), 'STAT: ')
+        self.add_shard('sitemap_static_0', fingerprint(settings.SITEMAP_STATIC_URLS), self.static_urls())
+        self.progress.stop()
+
+        # User urls
+        self.add_sections(
+            'user',
+            OSFUser.objects.filter(is_active=True).exclude(date_confirmed__isnull=True),
+            ('guids___id', ),
+            self.user_urls,
+            track_modified=False,
+        )
+
+        # AbstractNode urls (Nodes and Registrations, no Collections)
+        self.add_sections(
+            'node',
+            (AbstractNode.objects
+                .filter(is_public=True, is_deleted=False, retraction_id__isnull=True)
+                .exclude(type__in=['osf.collection', 'osf.quickfilesnode'])),
+            ('guids___id', 'modified'),
+            self.node_urls,
+        )
+
+        # Preprint and preprint file urls
+        self.add_sections(
+            'preprint',
+            Preprint.objects.can_view(),
+            ('guids___id', 'modified', 'provider_id'),
+            self.preprint_urls,
+            urls_per_row=2,
+        )
 
-        # Final write
-        self.write_doc()
         # Create index file
         self.write_sitemap_index()
+        self.remove_stale_shards()
+        self.write_manifest()
 
         # TODO: once the sitemap is validated add a ping to google with sitemap index file location
-        # TODO: server side cursor query wrapper might be useful as the index gets larger.
         # Sitemap indexable limit check
-        if self.sitemap_count > settings.SITEMAP_INDEX_MAX * .90:  # 10% of urls remaining
+        if len(self.shards) > settings.SITEMAP_INDEX_MAX * .90:  # 10% of urls remaining
             sentry.log_message('WARNING: Max sitemaps nearly reached.')
-        print('Total url_count = {}'.format((self.sitemap_count - 1) * settings.SITEMAP_URL_MAX + self.url_count))
-        print('Total sitemap_count = {}'.format(str(self.sitemap_count)))
+        print('Total url_count = {}'.format(self.url_count))
+        print('Total sitemap_count = {}, {} written'.format(len(self.shards), self.written_count))
         if self.errors:
             sentry.log_message('WARNING: Generate sitemap encountered errors. See logs for details.')
             print('Total errors = {}'.format(str(self.errors)))
@@ -20,6 +20,7 @@ from framework.exceptions import HTTPError
 from nose.tools import *  # noqa
 from osf_tests import factories
 from tests.base import OsfTestCase, get_default_metaschema
+from api.caching.utils import waterbutler_config_generation_cache, WATERBUTLER_CONFIG_GENERATION_KEY
 from api_tests.utils import create_test_file
 from osf_tests.factories import (AuthUserFactory, ProjectFactory,
                              RegistrationFactory, DraftRegistrationFactory,)
@@ -178,6 +179,56 @@ class TestAddonAuth(OsfTestCase):
         assert versions.first().seen_by.filter(guids___id=noncontrib._id).exists()
         assert not versions.last().seen_by.filter(guids___id=noncontrib._id).exists()
 
+    def test_auth_credentials_are_cached_until_addon_is_saved(self):
+        url = self.build_url()
+        self.app.get(url, auth=self.user.auth)
+        with mock.patch('addons.github.models.NodeSettings.serialize_waterbutler_credentials') as mock_serialize:
+            self.app.get(url, auth=self.user.auth)
+            assert_false(mock_serialize.called)
+
+        self.node_addon.repo = 'youre-my-second-best-friend'
+        self.node_addon.save()
+        res = self.app.get(url, auth=self.user.auth)
+        data = jwt.decode(jwe.decrypt(res.json['payload'].encode('utf-8'), self.JWE_KEY), settings.WATERBUTLER_JWT_SECRET, algorithm=settings.WATERBUTLER_JWT_ALGORITHM)['data']
+        assert_equal(data['settings']['repo'], 'youre-my-second-best-friend')
+
+    def test_auth_credentials_cache_follows_shared_generation(self):
+        url = self.build_url()
+        self.app.get(url, auth=self.user.auth)
+        # Another process bumping the generation drops this process's cached config
+        waterbutler_config_generation_cache.set(
+            WATERBUTLER_CONFIG_GENERATION_KEY.format(node_id=self.node._id), 'from-another-process', None
+        )
+        with mock.patch('addons.github.models.NodeSettings.serialize_waterbutler_credentials', return_value={}) as mock_serialize:
+            self.app.get(url, auth=self.user.auth)
+            assert_true(mock_serialize.called)
+
+        self.app.get(url, auth=self.user.auth)
+        self.node_addon.external_account.save()
+        with mock.patch('addons.github.models.NodeSettings.serialize_waterbutler_credentials', return_value={}) as mock_serialize:
+            self.app.get(url, auth=self.user.auth)
+            assert_true(mock_serialize.called)
+
+    def test_action_download_defaults_to_latest_version(self):
+        noncontrib = AuthUserFactory()
+        node = ProjectFactory(is_public=True)
+        test_file = create_test_file(node, self.user)
+        test_file.add_version(FileVersionFactory(identifier='2'))
+        test_file.save()
+        url = self.build_url(nid=node._id, action='download', provider='osfstorage', path=test_file.path)
+        res = self.app.get(url, auth=noncontrib.auth)
+        assert_equal(res.status_code, 200)
+
+        test_file.reload()
+        assert_equal(test_file.get_download_count(version=1), 1)
+        assert_true(test_file.versions.get(identifier='2').seen_by.filter(guids___id=noncontrib._id).exists())
+
+    def test_action_download_missing_version(self):
+        test_file = create_test_file(self.node, self.user)
+        url = self.build_url(action='download', provider='osfstorage', path=test_file.path, version=3)
+        res = self.app.get(url, auth=self.user.auth, expect_errors=True)
+        assert_equal(res.status_code, 400)
+
     def test_action_download_contrib(self):
         test_file = create_test_file(self.node, self.user)
         url = self.build_url(action='download', provider='osfstorage', path=test_file.path, version=1)
@@ -5,6 +5,7 @@ import mock
 from nose.tools import *  # noqa: F403
 import unittest
 
+from api.caching.utils import cas_profile_cache
 from framework.auth import cas
 
 from tests.base import OsfTestCase, fake
@@ -206,9 +207,85 @@ class TestCASClient(OsfTestCase):
         with assert_raises(cas.CasHTTPError):
             res = self.client.revoke_application_tokens(client_id, client_secret)
 
-    @unittest.skip('finish me')
+    @responses.activate
     def test_profile_valid_access_token_returns_cas_response(self):
-        assert 0
+        user = UserFactory()
+        responses.add(
+            responses.Response(
+                responses.GET,
+                self.client.get_profile_url(),
+                json={'id': user._id, 'scope': ['osf.full_read']},
+                status=200,
+            )
+        )
+        resp = self.client.profile('valid-access-token')
+        assert_true(resp.authenticated)
+        assert_equal(resp.user, user._id)
+        assert_equal(resp.attributes['accessToken'], 'valid-access-token')
+        assert_equal(resp.attributes['accessTokenScope'], {'osf.full_read'})
+
+    @responses.activate
+    def test_profile_is_cached_until_token_is_revoked(self):
+        user = UserFactory()
+        responses.add(
+            responses.Response(
+                responses.GET,
+                self.client.get_profile_url(),
+                json={'id': user._id, 'scope': []},
+                status=200,
+            )
+        )
+        responses.add(
+            responses.Response(
+                responses.POST,
+                self.client.get_auth_token_revocation_url(),
+                status=204,
+            )
+        )
+        self.client.profile('cached-access-token')
+        resp = self.client.profile('cached-access-token')
+        assert_equal(resp.user, user._id)
+        assert_equal(len(responses.calls), 1)
+
+        self.client.revoke_tokens({'token': 'cached-access-token'})
+        self.client.profile('cached-access-token')
+        assert_equal(len(responses.calls), 3)
+
+        self.client.revoke_application_tokens('fake_id', 'fake_secret')
+        self.client.profile('cached-access-token')
+        assert_equal(len(responses.calls), 5)
+
+    @responses.activate
+    def test_profiles_are_invalid_without_a_generation(self):
+        user = UserFactory()
+        responses.add(
+            responses.Response(
+                responses.GET,
+                self.client.get_profile_url(),
+                json={'id': user._id, 'scope': []},
+                status=200,
+            )
+        )
+        self.client.profile('cached-access-token')
+        # e.g. the generation was culled from the cache
+        cas_profile_cache.delete(cas.CAS_PROFILE_GENERATION_KEY)
+        self.client.profile('cached-access-token')
+        assert_equal(len(responses.calls), 2)
+
+    @responses.activate
+    def test_profile_rejected_token_is_cached(self):
+        responses.add(
+            responses.Response(
+                responses.GET,
+                self.client.get_profile_url(),
+                status=401,
+            )
+        )
+        for _ in range(2):
+            with assert_raises(cas.CasHTTPError) as e:
+                self.client.profile('rejected-access-token')
+            assert_equal(e.exception.code, 401)
+        assert_equal(len(responses.calls), 1)
 
     @unittest.skip('finish me')
     def test_get_login_url(self):
@@ -200,3 +200,9 @@ class CitationsViewsTestCase(OsfTestCase):
         node.save()
         response = self.app.get('/api/v1' + '/project/' + node._id + '/citation/', auto_follow=True, auth=user.auth)
         assert_true(response.json)
+
+    def test_node_rendered_citations_view(self):
+        node = ProjectFactory(title='My Project')
+        response = self.app.get(api_url_for('node_rendered_citations', pid=node._id), auth=node.creator.auth)
+        assert_equal(set(response.json), {'apa', 'modern-language-association', 'chicago-author-date'})
+        assert_in('My Project', response.json['apa'])
@@ -2,11 +2,14 @@
 import os
 import json
 
+import mock
 from django.utils import timezone
 from nose.tools import *  # noqa: F403
 
-from api.citations.utils import render_citation
-from osf_tests.factories import UserFactory, PreprintFactory
+from api.citations import utils as citation_utils
+from api.citations.utils import render_citation, render_citations
+from framework.auth import Auth
+from osf_tests.factories import UserFactory, PreprintFactory, ProjectFactory
 from tests.base import OsfTestCase
 from osf.models import OSFUser
 
@@ -170,3 +173,58 @@ class TestCiteprocpyMLA(OsfTestCase):
                 self.preprint.provider.name,
                 self.formated_date)
         )
+
+
+class TestCitationCaching(OsfTestCase):
+
+    def setUp(self):
+        super(TestCitationCaching, self).setUp()
+        self.user = UserFactory(fullname='John Tordoff')
+        self.preprint = PreprintFactory(creator=self.user, title='My Preprint')
+        self.other_preprint = PreprintFactory(creator=self.user, title='My Other Preprint')
+        citation_utils.parsed_style_cache.clear()
+
+    def test_rendered_citations_are_cached(self):
+        citation = render_citation(self.preprint, 'apa')
+        with mock.patch.object(citation_utils, '_render_citation') as mock_render:
+            assert_equal(render_citation(self.preprint, 'apa'), citation)
+        assert_false(mock_render.called)
+
+    def test_node_changes_are_rendered(self):
+        render_citation(self.preprint, 'modern-language-association')
+        self.preprint.title = 'A Study of Coffee'
+        self.preprint.save()
+        assert_in('A Study of Coffee', render_citation(self.preprint, 'modern-language-association'))
+
+    def test_contributor_changes_are_rendered(self):
+        render_citation(self.preprint, 'modern-language-association')
+        self.user.suffix = 'Junior'
+        self.user.save()
+        assert_true(render_citation(self.preprint, 'modern-language-association').startswith('Tordoff, John, Junior.'))
+
+    def test_new_identifiers_are_rendered(self):
+        project = ProjectFactory(creator=self.user)
+        render_citation(project, 'apa')
+        project.set_identifier_value('doi', '10.70102/FK2osf.io/ab1cd')
+        assert_in('10.70102/FK2osf.io/ab1cd', render_citation(project, 'apa'))
+
+    def test_logs_change_the_citation_version(self):
+        project = ProjectFactory(creator=self.user)
+        version = citation_utils.get_citation_versions([project])[project._id]
+        project.add_log('project_created', {}, Auth(self.user), log_date=timezone.now(), save=False)
+        assert_not_equal(citation_utils.get_citation_versions([project])[project._id], version)
+
+    def test_styles_are_parsed_once_per_process(self):
+        with mock.patch.object(citation_utils, 'CitationStylesStyle', wraps=citation_utils.CitationStylesStyle) as mock_style:
+            render_citation(self.preprint, 'apa')
+            render_citation(self.other_preprint, 'apa')
+        assert_equal(mock_style.call_count, 1)
+
+    def test_render_citations(self):
+        styles = ['apa', 'modern-language-association']
+        citations = render_citations([self.preprint, self.other_preprint], styles)
+        assert_equal(set(citations), {self.preprint._id, self.other_preprint._id})
+        for preprint in (self.preprint, self.other_preprint):
+            assert_equal(set(citations[preprint._id]), set(styles))
+            for style in styles:
+                assert_equal(citations[preprint._id][style], render_citation(preprint, style))
@@ -1,7 +1,13 @@
 import collections
 import mock
+import os
+import shutil
+import tempfile
 from babel import dates, Locale
+from mako.lookup import TemplateLookup
 from schema import Schema, And, Use, Or
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from nose.tools import *  # noqa PEP8 asserts
@@ -1254,6 +1260,21 @@ class TestCompileSubscriptions(NotificationTestCase):
         result = emails.compile_subscriptions(self.private_node, 'file_updated')
         assert_equal({'email_transactional': [], 'none': [], 'email_digest': []}, result)
 
+    def test_admin_on_parent_registration_listed_for_component(self):
+        registration = factories.RegistrationFactory(project=self.base_project, creator=self.user_1)
+        component = registration.nodes[0]
+        registration.get_group(permissions.ADMIN).user_set.add(self.user_4)
+        assert_true(component.has_permission(self.user_4, permissions.READ))
+        registration_sub = factories.NotificationSubscriptionFactory(
+            _id=registration._id + '_file_updated',
+            node=registration,
+            event_name='file_updated'
+        )
+        registration_sub.save()
+        registration_sub.email_transactional.add(self.user_4)
+        result = emails.compile_subscriptions(component, 'file_updated')
+        assert_equal({'email_transactional': [self.user_4._id], 'none': [], 'email_digest': []}, result)
+
     def test_several_nodes_deep(self):
         self.base_sub.email_transactional.add(self.user_1)
         self.base_sub.save()
@@ -1283,6 +1304,32 @@ class TestCompileSubscriptions(NotificationTestCase):
         assert_equal(subs, {'email_transactional': [], 'email_digest': [self.user_1._id], 'none': []})
 
 
+    def test_query_count_does_not_grow_with_depth(self):
+        self.base_sub.email_transactional.add(self.user_1)
+        self.shared_sub.email_digest.add(self.user_2)
+        node = self.shared_node
+        query_counts = []
+        for _ in range(4):
+            node = factories.NodeFactory(parent=node, creator=self.user_1)
+            with CaptureQueriesContext(connection) as ctx:
+                subs = emails.compile_subscriptions(node, 'file_updated', 'file_updated')
+            query_counts.append(len(ctx.captured_queries))
+            assert_equal(subs, {'email_transactional': [self.user_1._id], 'email_digest': [self.user_2._id], 'none': []})
+        assert_equal(len(set(query_counts)), 1)
+
+    def test_memoized_until_subscriptions_change(self):
+        self.base_sub.email_transactional.add(self.user_1)
+        subs = emails.compile_subscriptions(self.shared_node, 'file_updated')
+        subs['email_transactional'].remove(self.user_1._id)
+        with CaptureQueriesContext(connection) as ctx:
+            subs = emails.compile_subscriptions(self.shared_node, 'file_updated')
+        assert_equal(len(ctx.captured_queries), 0)
+        assert_equal(subs['email_transactional'], [self.user_1._id])
+
+        self.shared_sub.none.add(self.user_1)
+        subs = emails.compile_subscriptions(self.shared_node, 'file_updated')
+        assert_equal(subs, {'email_transactional': [], 'email_digest': [], 'none': [self.user_1._id]})
+
 class TestMoveSubscription(NotificationTestCase):
     def setUp(self):
         super(TestMoveSubscription, self).setUp()
@@ -1570,6 +1617,50 @@ class TestSendEmails(NotificationTestCase):
         mock_store.assert_called_with([self.project.creator._id], 'email_transactional', 'comments', user,
                                       self.node, time_now, target_user=user)
 
+    @mock.patch('website.mails.render_message')
+    def test_store_emails_renders_once_per_timezone_and_locale(self, mock_render):
+        mock_render.return_value = 'A comment was made'
+        recipients = [factories.UserFactory(timezone='Etc/UTC', locale='en') for _ in range(3)]
+        other_timezone = factories.UserFactory(timezone='America/New_York', locale='en')
+        disabled = factories.UserFactory()
+        disabled.is_disabled = True
+        disabled.save()
+        recipient_ids = [u._id for u in recipients + [other_timezone, disabled, self.user]]
+
+        emails.store_emails(recipient_ids, 'email_digest', 'comments', self.user, self.node, timezone.now())
+        assert_equal(mock_render.call_count, 2)
+        digests = NotificationDigest.objects.filter(event='comments')
+        assert_equal(
+            set(digests.values_list('user_id', flat=True)),
+            {u.id for u in recipients + [other_timezone]}
+        )
+        assert_true(all(d.message == 'A comment was made' for d in digests))
+
+    def test_message_uses_follows_inherited_templates(self):
+        assert_true(mails.message_uses('reviews_submission_status.html.mako', 'recipient'))
+        assert_false(mails.message_uses('comments.html.mako', 'recipient'))
+        # Only notify_base.mako, which confirm.html.mako inherits from, links to the notification settings
+        assert_true(mails.message_uses('confirm.html.mako', 'notification_settings_url'))
+
+    def test_message_uses_follows_included_templates(self):
+        template_dir = tempfile.mkdtemp()
+        templates = {
+            'greeting.mako': 'Hello ${recipient.fullname}',
+            'greeting_digest.html.mako': '<%include file="greeting.mako"/>${message}',
+            'computed_digest.html.mako': '<%include file="${partial}"/>${message}',
+            'plain_digest.html.mako': '${message}',
+        }
+        for name, source in templates.items():
+            with open(os.path.join(template_dir, name), 'w') as f:
+                f.write(source)
+        try:
+            with mock.patch.object(mails, '_tpl_lookup', TemplateLookup(directories=[template_dir])):
+                assert_true(mails.message_uses('greeting_digest.html.mako', 'recipient'))
+                assert_true(mails.message_uses('computed_digest.html.mako', 'recipient'))
+                assert_false(mails.message_uses('plain_digest.html.mako', 'recipient'))
+        finally:
+            shutil.rmtree(template_dir)
+
     def test_check_node_node_none(self):
         subs = emails.check_node(None, 'comments')
         assert_equal(subs, {'email_transactional': [], 'email_digest': [], 'none': []})
@@ -1868,6 +1959,48 @@ class TestSendDigest(OsfTestCase):
         send_users_email(send_type)
         assert_false(mock_send_mail.called)
 
+    @mock.patch('website.mails.send_mail')
+    def test_send_users_email_sends_in_chunks(self, mock_send_mail):
+        send_type = 'email_transactional'
+        digests = [
+            factories.NotificationDigestFactory(
+                user=user,
+                send_type=send_type,
+                event='comment_replies',
+                timestamp=self.timestamp,
+                message='Hello',
+                node_lineage=[self.project._id]
+            ) for user in (self.user_1, self.user_2, self.user_2)
+        ]
+
+        with mock.patch.object(settings, 'NOTIFICATION_DIGEST_CHUNK_SIZE', 1):
+            send_users_email(send_type)
+
+        assert_equal(mock_send_mail.call_count, 2)
+        assert_equal(
+            sorted(call[1]['to_addr'] for call in mock_send_mail.call_args_list),
+            sorted([self.user_1.username, self.user_2.username])
+        )
+        assert_false(NotificationDigest.objects.filter(_id__in=[d._id for d in digests]).exists())
+
+    @mock.patch('website.mails.send_mail')
+    def test_send_users_email_keeps_digests_that_failed_to_send(self, mock_send_mail):
+        mock_send_mail.side_effect = Exception('SMTP unavailable')
+        send_type = 'email_transactional'
+        d = factories.NotificationDigestFactory(
+            user=self.user_1,
+            send_type=send_type,
+            event='comment_replies',
+            timestamp=self.timestamp,
+            message='Hello',
+            node_lineage=[self.project._id]
+        )
+
+        send_users_email(send_type)
+
+        assert_true(mock_send_mail.called)
+        assert_true(NotificationDigest.objects.filter(_id=d._id).exists())
+
     def test_remove_sent_digest_notifications(self):
         d = factories.NotificationDigestFactory(
             event='comment_replies',
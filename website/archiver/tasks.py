@@ -107,11 +107,15 @@ class ArchiverTask(celery.Task):
         archiver_signals.archive_fail.send(dst, errors=errors)
 
 
-@celery_app.task(base=ArchiverTask, ignore_result=False)
+@celery_app.task(base=ArchiverTask, bind=True, ignore_result=False, max_retries=settings.ARCHIVE_STAT_MAX_RETRIES)
 @logged('stat_addon')
-def stat_addon(addon_short_name, job_pk):
+def stat_addon(self, addon_short_name, job_pk):
     """Collect metadata about the file tree of a given addon
 
+    Folder listings are checkpointed on the job's ArchiveTarget every
+    ARCHIVE_CRAWL_CHECKPOINT_INTERVAL folders, along with progress counters, so that
+    a retry after a server error resumes from the last checkpoint.
+
     :param addon_short_name: AddonConfig.short_name of the addon to be examined
     :param job_pk: primary key of archive_job
     :return: AggregateStatResult containing file tree metadata
@@ -130,15 +134,34 @@ def stat_addon(addon_short_name, job_pk):
     if hasattr(src_addon, 'configured') and not src_addon.configured:
         # Addon enabled but not configured - no file trees, nothing to archive.
         return AggregateStatResult(src_addon._id, addon_short_name)
+
+    target = job.get_target(addon_short_name)
+    listings = target.get_folder_listings() if target else {}
+    new_listings = {}
+
+    def checkpoint(path, children):
+        new_listings[path] = children
+        if target and len(new_listings) >= settings.ARCHIVE_CRAWL_CHECKPOINT_INTERVAL:
+            target.add_folder_listings(new_listings)
+            new_listings.clear()
+
     try:
-        file_tree = src_addon._get_file_tree(user=user, version=version)
+        file_tree = src_addon._get_file_tree(user=user, version=version, listings=listings, on_listed=checkpoint)
     except HTTPError as e:
+        if target and new_listings:
+            target.add_folder_listings(new_listings)
+        if (e.code >= 500 or e.code == http_status.HTTP_429_TOO_MANY_REQUESTS) and self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=settings.ARCHIVE_STAT_RETRY_DELAY)
         dst.archive_job.update_target(
             addon_short_name,
             ARCHIVER_NETWORK_ERROR,
             errors=[e.data['error']],
         )
         raise
+    if target:
+        if new_listings:
+            target.add_folder_listings(new_listings)
+        target.clear_folder_listings()
     result = AggregateStatResult(
         src_addon._id,
         addon_short_name,
@@ -290,13 +313,11 @@ def archive_success(dst_pk, job_pk):
 
     :param str dst_pk: primary key of registration Node
 
-    note:: At first glance this task makes redundant calls to utils.get_file_map (which
-    returns a generator yielding  (<sha256>, <file_metadata>) pairs) on the dst Node. Two
-    notes about utils.get_file_map: 1) this function memoizes previous results to reduce
-    overhead and 2) this function returns a generator that lazily fetches the file metadata
-    of child Nodes (it is possible for a selected file to belong to a child Node) using a
-    non-recursive DFS. Combined this allows for a relatively effient implementation with
-    seemingly redundant calls.
+    note:: The files selected across all of the registration's schemas are resolved together
+    by utils.index_registration_files, which makes a single pass over utils.get_file_map
+    (a generator that lazily fetches the file metadata of the dst Node and then of its child
+    Nodes, since a selected file may belong to a child Node) and stops once every selected
+    file has been found. The resulting index only lives for the duration of this task.
     """
     create_app_context()
     dst = AbstractNode.load(dst_pk)
@@ -309,9 +330,11 @@ def archive_success(dst_pk, job_pk):
     # questions. These files are references to files on the unregistered Node, and
     # consequently we must migrate those file paths after archiver has run. Using
     # sha256 hashes is a convenient way to identify files post-archival.
-    for schema in dst.registered_schema.all():
-        if schema.has_files:
-            utils.migrate_file_metadata(dst, schema)
+    schemas = [schema for schema in dst.registered_schema.all() if schema.has_files]
+    if schemas:
+        file_index = utils.index_registration_files(dst, utils.get_selected_file_keys(dst, schemas))
+        for schema in schemas:
+            utils.migrate_file_metadata(dst, schema, file_index=file_index)
     job = ArchiveJob.load(job_pk)
     if not job.sent:
         job.sent = True
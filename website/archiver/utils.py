@@ -1,4 +1,4 @@
-import functools
+import collections
 
 from framework.auth import Auth
 
@@ -181,55 +181,36 @@ def before_archive(node, user):
     job.set_targets()
 
 def _do_get_file_map(file_tree):
-    """Reduces a tree of folders and files into a list of (<sha256>, <file_metadata>) pairs
+    """Reduces a tree of folders and files into a stream of (<sha256>, <file_metadata>) pairs,
+    visiting the tree breadth-first
     """
-    file_map = []
-    stack = [file_tree]
-    while len(stack):
-        tree_node = stack.pop(0)
+    queue = collections.deque([file_tree])
+    while queue:
+        tree_node = queue.popleft()
         if tree_node['kind'] == 'file':
-            file_map.append((tree_node['extra']['hashes']['sha256'], tree_node))
+            yield tree_node['extra']['hashes']['sha256'], tree_node
         else:
-            stack = stack + tree_node['children']
-    return file_map
-
-def _memoize_get_file_map(func):
-    cache = {}
-
-    @functools.wraps(func)
-    def wrapper(node):
-        if node._id not in cache:
-            osf_storage = node.get_addon('osfstorage')
-            file_tree = osf_storage._get_file_tree(user=node.creator)
-            cache[node._id] = _do_get_file_map(file_tree)
-        return func(node, cache[node._id])
-    return wrapper
-
-@_memoize_get_file_map
-def get_file_map(node, file_map):
-    """
-    note:: file_map is injected implictly by the decorator; this method is called like:
+            queue.extend(tree_node['children'])
 
-    get_file_map(node)
+def get_file_map(node):
+    """Yields a (<sha256>, <file_metadata>, <node_id>) triple for every file in the OSF Storage of
+    `node` and its components. Each node's file tree is only fetched once the files of the nodes
+    before it have been consumed.
     """
-    for (key, value) in file_map:
+    osf_storage = node.get_addon('osfstorage')
+    file_tree = osf_storage._get_file_tree(user=node.creator)
+    for key, value in _do_get_file_map(file_tree):
         yield (key, value, node._id)
     for child in node.nodes_primary:
         for key, value, node_id in get_file_map(child):
             yield (key, value, node_id)
 
-def find_registration_file(value, node):
+def get_registration_file_key(value):
     """
-    some annotations:
-
-    - `value` is  the `extra` from a file upload in `registered_meta`
-        (see `Uploader.addFile` in website/static/js/registrationEditorExtensions.js)
-    - `node` is a Registration instance
-    - returns a `(file_info, node_id)` or `(None, None)` tuple, where `file_info` is from waterbutler's api
-        (see `addons.base.models.BaseStorageAddon._get_fileobj_child_metadata` and `waterbutler.core.metadata.BaseMetadata`)
+    Returns the `(sha256, name, node_id)` that identifies a selected file, where `value` is the `extra`
+    from a file upload in `registered_meta` (see `Uploader.addFile` in
+    website/static/js/registrationEditorExtensions.js) and `node_id` is the node it was selected from
     """
-    from osf.models import AbstractNode
-    orig_sha256 = value['sha256']
     orig_name = unescape_entities(
         value['selectedFileName'],
         safe={
@@ -237,15 +218,54 @@ def find_registration_file(value, node):
             '&gt;': '>'
         }
     )
-    orig_node = value['nodeId']
-    file_map = get_file_map(node)
-    for sha256, file_info, node_id in file_map:
-        registered_from_id = AbstractNode.load(node_id).registered_from._id
-        if sha256 == orig_sha256 and registered_from_id == orig_node and orig_name == file_info['name']:
-            return file_info, node_id
-    return None, None
-
-def find_registration_files(values, node):
+    return value['sha256'], orig_name, value['nodeId']
+
+def index_registration_files(node, keys):
+    """
+    Finds the archived copies of a set of selected files in a single pass over the file map of `node`.
+
+    - `node` is a Registration instance
+    - `keys` are `(sha256, name, node_id)` tuples from `get_registration_file_key`
+    - returns a dict mapping each key that was found to a `(file_info, node_id)` tuple, where `file_info`
+        is from waterbutler's api (see `addons.base.models.BaseStorageAddon._get_fileobj_child_metadata`
+        and `waterbutler.core.metadata.BaseMetadata`)
+
+    The walk stops as soon as every key has been found, and only matching files are kept.
+    """
+    from osf.models import AbstractNode
+    remaining = set(keys)
+    index = {}
+    registered_from_ids = {}
+    if not remaining:
+        return index
+    for sha256, file_info, node_id in get_file_map(node):
+        if node_id not in registered_from_ids:
+            registered_from_ids[node_id] = AbstractNode.load(node_id).registered_from._id
+        key = (sha256, file_info['name'], registered_from_ids[node_id])
+        if key in remaining:
+            remaining.remove(key)
+            index[key] = (file_info, node_id)
+            if not remaining:
+                break
+    return index
+
+def find_registration_file(value, node, file_index=None):
+    """
+    some annotations:
+
+    - `value` is  the `extra` from a file upload in `registered_meta`
+        (see `Uploader.addFile` in website/static/js/registrationEditorExtensions.js)
+    - `node` is a Registration instance
+    - `file_index` is an optional result of `index_registration_files` that includes this file
+    - returns a `(file_info, node_id)` or `(None, None)` tuple, where `file_info` is from waterbutler's api
+        (see `addons.base.models.BaseStorageAddon._get_fileobj_child_metadata` and `waterbutler.core.metadata.BaseMetadata`)
+    """
+    key = get_registration_file_key(value)
+    if file_index is None:
+        file_index = index_registration_files(node, [key])
+    return file_index.get(key, (None, None))
+
+def find_registration_files(values, node, file_index=None):
     """
     some annotations:
 
@@ -254,9 +274,12 @@ def find_registration_files(values, node):
     - returns a list of `(file_info, node_id, index)` or `(None, None, index)` tuples,
         where `file_info` is from `find_registration_file` above
     """
+    extra = values.get('extra', [])
+    if file_index is None:
+        file_index = index_registration_files(node, [get_registration_file_key(value) for value in extra])
     ret = []
-    for i in range(len(values.get('extra', []))):
-        ret.append(find_registration_file(values['extra'][i], node) + (i,))
+    for i in range(len(extra)):
+        ret.append(find_registration_file(extra[i], node, file_index=file_index) + (i,))
     return ret
 
 def get_title_for_question(schema, path):
@@ -319,15 +342,31 @@ def deep_get(obj, path):
         item = item[key]
     return item
 
-def migrate_file_metadata(dst, schema):
+def get_selected_file_keys(dst, schemas):
+    """Returns the `get_registration_file_key` of every file selected in `dst`'s responses to `schemas`"""
+    keys = set()
+    for schema in schemas:
+        selected_files = find_selected_files(schema, dst.registered_meta[schema._id])
+        for selected in selected_files.values():
+            keys.update(get_registration_file_key(value) for value in selected.get('extra', []))
+    return keys
+
+def migrate_file_metadata(dst, schema, file_index=None):
+    """Points the files selected in `dst`'s responses to `schema` at their archived copies.
+
+    `file_index` is an optional result of `index_registration_files` for the selected files, so that
+    callers migrating several schemas only walk the registration's files once.
+    """
     metadata = dst.registered_meta[schema._id]
     missing_files = []
     selected_files = find_selected_files(schema, metadata)
+    if file_index is None:
+        file_index = index_registration_files(dst, get_selected_file_keys(dst, [schema]))
 
     for path, selected in selected_files.items():
         target = deep_get(metadata, path)
 
-        for archived_file_info, node_id, index in find_registration_files(selected, dst):
+        for archived_file_info, node_id, index in find_registration_files(selected, dst, file_index=file_index):
             if not archived_file_info:
                 missing_files.append({
                     'file_name': selected['extra'][index]['selectedFileName'],
@@ -2,6 +2,7 @@
 from flask import request
 from django.db.models import Q
 
+from api.citations.utils import render_citations
 from framework.auth.decorators import must_be_logged_in
 
 from osf.models.citation import CitationStyle
@@ -26,11 +27,21 @@ def list_citation_styles():
     }
 
 
+# Styles shown in the citation widget on the project page
+WIDGET_CITATION_STYLES = ['apa', 'modern-language-association', 'chicago-author-date']
+
+
 @must_be_contributor_or_public
 def node_citation(**kwargs):
     node = kwargs['node'] or kwargs['project']
     return {node.csl['id']: node.csl}
 
+@must_be_contributor_or_public
+def node_rendered_citations(**kwargs):
+    """The node's citations in each of the widget's styles, by style id"""
+    node = kwargs['node'] or kwargs['project']
+    return render_citations([node], WIDGET_CITATION_STYLES)[node._id]
+
 ## Generics ##
 
 class GenericCitationViews(object):
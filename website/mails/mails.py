@@ -20,6 +20,7 @@ Usage: ::
 """
 import os
 import logging
+import re
 import waffle
 
 from mako.lookup import TemplateLookup, Template
@@ -76,6 +77,31 @@ def render_message(tpl_name, **context):
     return tpl.render(**context)
 
 
+# Tags that pull other templates into a template's output
+TEMPLATE_REFERENCE_REGEX = re.compile(r'<%(?:inherit|include|namespace)\b[^>]*?\bfile\s*=\s*(["\'])(.*?)\1')
+
+
+def message_uses(tpl_name, name, _seen=None):
+    """Whether the email template `tpl_name`, or any template it inherits from, includes or imports
+    as a namespace, reads the context variable `name`. Templates referenced by a computed file name
+    can't be followed, so they are assumed to read it.
+    """
+    _seen = _seen if _seen is not None else set()
+    if tpl_name in _seen:
+        return False
+    _seen.add(tpl_name)
+
+    tpl = _tpl_lookup.get_template(tpl_name)
+    if "context.get('{0}', UNDEFINED)".format(name) in tpl.code or "context['{0}']".format(name) in tpl.code:
+        return True
+    for quote, referenced in TEMPLATE_REFERENCE_REGEX.findall(tpl.source):
+        if '${' in referenced:
+            return True
+        if message_uses(_tpl_lookup.adjust_uri(referenced, tpl.uri), name, _seen):
+            return True
+    return False
+
+
 def send_mail(
         to_addr, mail, mimetype='html', from_addr=None, mailer=None, celery=True,
         username=None, password=None, callback=None, attachment_name=None,
@@ -1,7 +1,21 @@
-from babel import dates, core, Locale
+import collections
 
-from osf.models import AbstractNode, OSFUser, NotificationDigest, NotificationSubscription
-from osf.utils.permissions import ADMIN, READ
+from babel import dates, core, Locale
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from osf.models import (
+    AbstractNode,
+    NodeEffectivePermission,
+    NodeRelation,
+    NodeTreeClosure,
+    NotificationDigest,
+    NotificationSubscription,
+    OSFUser,
+)
+from osf.models.node import NodeGroupObjectPermission, NodeUserObjectPermission
+from osf.utils.permissions import ADMIN, ADMIN_NODE, READ, READ_NODE
+from osf.utils.requests import dummy_request, get_current_request
 from website import mails
 from website.notifications import constants
 from website.notifications import utils
@@ -99,55 +113,162 @@ def store_emails(recipient_ids, notification_type, event, user, node, timestamp,
     context['user'] = user
     node_lineage_ids = get_node_lineage(node) if node else []
 
-    for recipient_id in recipient_ids:
-        if recipient_id == user._id:
-            continue
-        recipient = OSFUser.load(recipient_id)
-        if recipient.is_disabled:
-            continue
-        context['localized_timestamp'] = localize_timestamp(timestamp, recipient)
-        context['recipient'] = recipient
-        message = mails.render_message(template, **context)
-        digest = NotificationDigest(
+    recipients = OSFUser.objects.filter(
+        guids___id__in=recipient_ids,
+        date_disabled__isnull=True,
+    ).exclude(id=user.id)
+    # Messages only vary by how the timestamp is localized, unless the template greets the recipient
+    per_recipient = mails.message_uses(template, 'recipient')
+    messages = {}
+    digests = []
+    for recipient in recipients:
+        key = recipient.id if per_recipient else (recipient.timezone, recipient.locale)
+        if key not in messages:
+            context['localized_timestamp'] = localize_timestamp(timestamp, recipient)
+            context['recipient'] = recipient
+            messages[key] = mails.render_message(template, **context)
+        digests.append(NotificationDigest(
             timestamp=timestamp,
             send_type=notification_type,
             event=event,
             user=recipient,
-            message=message,
+            message=messages[key],
             node_lineage=node_lineage_ids,
             provider=abstract_provider
-        )
-        digest.save()
+        ))
+    NotificationDigest.objects.bulk_create(digests)
 
 
-def compile_subscriptions(node, event_type, event=None, level=0):
-    """Recurse through node and parents for subscriptions.
+def compile_subscriptions(node, event_type, event=None):
+    """Resolve the subscriptions to an event on a node. Subscriptions to the particular event override
+    those to `event_type` on the node, which override those on each parent in turn.
+
+    The lineage's subscriptions and their subscribers' read access are fetched in a few set-based queries,
+    and the result is memoized for the rest of the request.
 
     :param node: current node
     :param event_type: Generally node_subscriptions_available
     :param event: Particular event such a file_updated that has specific file subs
-    :param level: How deep the recursion is
     :return: a dict of notification types with lists of users.
     """
-    subscriptions = check_node(node, event_type)
-    if event:
-        subscriptions = check_node(node, event)  # Gets particular event subscriptions
-        parent_subscriptions = compile_subscriptions(node, event_type, level=level + 1)  # get node and parent subs
-    elif getattr(node, 'parent_id', False):
-        parent_subscriptions = \
-            compile_subscriptions(AbstractNode.load(node.parent_id), event_type, level=level + 1)
+    memo = _subscriptions_memo()
+    key = (type(node), node.pk, event_type, event)
+    if key not in memo:
+        memo[key] = _resolve_subscriptions(node, event_type, event)
+    # Callers edit the lists they are given
+    return {notification_type: list(users) for notification_type, users in memo[key].items()}
+
+
+def _resolve_subscriptions(node, event_type, event=None):
+    if isinstance(node, AbstractNode):
+        lineage = [(node.pk, node._id)] + list(
+            NodeTreeClosure.objects.filter(descendant_id=node.pk).order_by('depth').values_list('ancestor_id', 'ancestor__guids___id')
+        )
     else:
-        parent_subscriptions = check_node(None, event_type)
-    for notification_type in parent_subscriptions:
-        p_sub_n = parent_subscriptions[notification_type]
-        p_sub_n.extend(subscriptions[notification_type])
-        for nt in subscriptions:
-            if notification_type != nt:
-                p_sub_n = list(set(p_sub_n).difference(set(subscriptions[nt])))
-        if level == 0:
-            p_sub_n, removed = utils.separate_users(node, p_sub_n)
-        parent_subscriptions[notification_type] = p_sub_n
-    return parent_subscriptions
+        lineage = [(node.pk, node._id)]
+    # Most specific first
+    levels = [(pk, utils.to_subscription_key(guid, event_type)) for pk, guid in lineage]
+    if event:
+        levels.insert(0, (node.pk, utils.to_subscription_key(node._id, event)))
+
+    subscription_ids = dict(
+        NotificationSubscription.objects.filter(_id__in=[key for _, key in levels]).values_list('_id', 'id')
+    )
+    subscribers = collections.defaultdict(lambda: {key: [] for key in constants.NOTIFICATION_TYPES})
+    user_ids = {}
+    for notification_type in constants.NOTIFICATION_TYPES:
+        through = getattr(NotificationSubscription, notification_type).through
+        rows = through.objects.filter(
+            notificationsubscription_id__in=subscription_ids.values(),
+            osfuser__date_disabled__isnull=True,
+        ).values_list('notificationsubscription_id', 'osfuser_id', 'osfuser__guids___id')
+        for subscription_id, user_id, user_guid in rows:
+            subscribers[subscription_id][notification_type].append((user_id, user_guid))
+            user_ids[user_guid] = user_id
+    readers = _get_readers(node, [pk for pk, _ in lineage], set(user_ids.values()))
+
+    compiled = {key: [] for key in constants.NOTIFICATION_TYPES}
+    for node_pk, key in reversed(levels):
+        level = {
+            notification_type: [guid for user_id, guid in users if (node_pk, user_id) in readers]
+            for notification_type, users in subscribers[subscription_ids.get(key)].items()
+        }
+        for notification_type in compiled:
+            overridden = {guid for nt, guids in level.items() if nt != notification_type for guid in guids}
+            compiled[notification_type] = [
+                guid for guid in collections.OrderedDict.fromkeys(compiled[notification_type] + level[notification_type])
+                if guid not in overridden
+            ]
+    # Inherited subscribers must be able to read the node itself
+    return {
+        notification_type: [guid for guid in guids if (node.pk, user_ids[guid]) in readers]
+        for notification_type, guids in compiled.items()
+    }
+
+
+def _get_readers(node, node_ids, user_ids):
+    """Return the (node id, user id) pairs, among the given nodes and users, where the user can read the node."""
+    if isinstance(node, AbstractNode):
+        NodeEffectivePermission.flush()
+        readers = set(NodeEffectivePermission.objects.filter(
+            node_id__in=node_ids,
+            user_id__in=user_ids,
+            permission=READ_NODE,
+        ).values_list('node_id', 'user_id'))
+        # Like `is_admin_parent`, admins of any ancestor can read a node, but the table only covers project ancestors
+        descendants_by_ancestor = collections.defaultdict(set)
+        for ancestor_id, descendant_id in NodeTreeClosure.objects.filter(
+            descendant_id__in=node_ids,
+        ).exclude(ancestor__type='osf.node').values_list('ancestor_id', 'descendant_id'):
+            descendants_by_ancestor[ancestor_id].add(descendant_id)
+        if descendants_by_ancestor:
+            ancestors_by_group = collections.defaultdict(set)
+            for group_id, ancestor_id in NodeGroupObjectPermission.objects.filter(
+                content_object_id__in=list(descendants_by_ancestor),
+                permission__codename=ADMIN_NODE,
+            ).values_list('group_id', 'content_object_id'):
+                ancestors_by_group[group_id].add(ancestor_id)
+            for group_id, user_id in OSFUser.groups.through.objects.filter(
+                group_id__in=list(ancestors_by_group),
+                osfuser_id__in=user_ids,
+            ).values_list('group_id', 'osfuser_id'):
+                readers.update(
+                    (descendant_id, user_id)
+                    for ancestor_id in ancestors_by_group[group_id]
+                    for descendant_id in descendants_by_ancestor[ancestor_id]
+                )
+        return readers
+    return {(node.pk, user.id) for user in OSFUser.objects.filter(id__in=user_ids) if node.has_permission(user, READ)}
+
+
+def _subscriptions_memo():
+    """Compiled subscriptions for the current request. Nothing is memoized outside of a request."""
+    request = get_current_request()
+    if request is dummy_request:
+        return {}
+    if not hasattr(request, '_compiled_subscriptions'):
+        request._compiled_subscriptions = {}
+    return request._compiled_subscriptions
+
+
+@receiver(post_save, sender=NotificationSubscription)
+@receiver(post_delete, sender=NotificationSubscription)
+@receiver(m2m_changed, sender=NotificationSubscription.none.through)
+@receiver(m2m_changed, sender=NotificationSubscription.email_digest.through)
+@receiver(m2m_changed, sender=NotificationSubscription.email_transactional.through)
+@receiver(post_save, sender=OSFUser)
+@receiver(m2m_changed, sender=OSFUser.groups.through)
+@receiver(post_save, sender=NodeGroupObjectPermission)
+@receiver(post_delete, sender=NodeGroupObjectPermission)
+@receiver(post_save, sender=NodeUserObjectPermission)
+@receiver(post_delete, sender=NodeUserObjectPermission)
+@receiver(post_save, sender=NodeRelation)
+@receiver(post_delete, sender=NodeRelation)
+def clear_subscriptions_memo(sender, **kwargs):
+    # Subscriptions, disabled users and permissions may all change what an event resolves to
+    request = get_current_request()
+    if hasattr(request, '_compiled_subscriptions'):
+        del request._compiled_subscriptions
 
 
 def check_node(node, event):
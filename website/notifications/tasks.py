@@ -2,8 +2,11 @@
 Tasks for making even transactional emails consolidated.
 """
 import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from django.db import connection
+from django.db.models import F, Max
 
 from framework.celery_tasks import app as celery_app
 from framework.sentry import log_exception
@@ -28,32 +31,94 @@ def send_users_email(send_type):
 def _send_global_and_node_emails(send_type):
     """
     Called by `send_users_email`. Send all global and node-related notification emails.
+
+    Digests are streamed and handled `NOTIFICATION_DIGEST_CHUNK_SIZE` users at a time: each chunk is sent
+    through a pool of `NOTIFICATION_DIGEST_SEND_CONCURRENCY` workers and its sent digests are deleted before
+    the next chunk is read. Deleted digests act as the checkpoint, so a run that dies part way through
+    resumes where it stopped, re-sending at most one chunk. Digests stored after the run started are left
+    for the next run.
     """
-    grouped_emails = get_users_emails(send_type)
-    for group in grouped_emails:
-        user = OSFUser.load(group['user_id'])
+    max_id = NotificationDigest.objects.filter(send_type=send_type).aggregate(max_id=Max('id'))['max_id']
+    if max_id is None:
+        return
+    grouped_emails = get_users_emails(send_type, max_id=max_id)
+    with ThreadPoolExecutor(max_workers=settings.NOTIFICATION_DIGEST_SEND_CONCURRENCY) as executor:
+        try:
+            while True:
+                chunk = list(itertools.islice(grouped_emails, settings.NOTIFICATION_DIGEST_CHUNK_SIZE))
+                if not chunk:
+                    break
+                _send_digest_chunk(chunk, executor)
+        finally:
+            _close_worker_connections(executor, settings.NOTIFICATION_DIGEST_SEND_CONCURRENCY)
+
+
+def _send_digest_chunk(chunk, executor):
+    users = {
+        user.guid: user
+        for user in OSFUser.objects.filter(guids___id__in=[group['user_id'] for group in chunk]).annotate(guid=F('guids___id'))
+    }
+    sorted_messages = {group['user_id']: group_by_node(group['info']) for group in chunk}
+    # If there's only one node in digest we can show it's preferences link in the template.
+    single_node_ids = {
+        user_id: list(messages['children'].keys())[0]
+        for user_id, messages in sorted_messages.items()
+        if len(messages['children']) == 1
+    }
+    nodes = {
+        node.guid: node
+        for node in AbstractNode.objects.filter(guids___id__in=set(single_node_ids.values())).annotate(guid=F('guids___id'))
+    }
+
+    sends, notification_ids = [], []
+    for group in chunk:
+        user = users.get(group['user_id'])
         if not user:
             log_exception()
             continue
-        info = group['info']
-        notification_ids = [message['_id'] for message in info]
-        sorted_messages = group_by_node(info)
-        if sorted_messages:
-            if not user.is_disabled:
-                # If there's only one node in digest we can show it's preferences link in the template.
-                notification_nodes = list(sorted_messages['children'].keys())
-                node = AbstractNode.load(notification_nodes[0]) if len(
-                    notification_nodes) == 1 else None
-                mails.send_mail(
-                    to_addr=user.username,
-                    mimetype='html',
-                    can_change_node_preferences=bool(node),
-                    node=node,
-                    mail=mails.DIGEST,
-                    name=user.fullname,
-                    message=sorted_messages,
-                )
-            remove_notifications(email_notification_ids=notification_ids)
+        ids = [message['_id'] for message in group['info']]
+        if sorted_messages[group['user_id']] and not user.is_disabled:
+            node = nodes.get(single_node_ids.get(group['user_id']))
+            sends.append((executor.submit(
+                mails.send_mail,
+                to_addr=user.username,
+                mimetype='html',
+                can_change_node_preferences=bool(node),
+                node=node,
+                mail=mails.DIGEST,
+                name=user.fullname,
+                message=sorted_messages[group['user_id']],
+            ), ids))
+        else:
+            notification_ids.extend(ids)
+
+    for future, ids in sends:
+        try:
+            future.result()
+        except Exception:
+            # Leave the digests in place so the next run retries them
+            log_exception()
+        else:
+            notification_ids.extend(ids)
+    remove_notifications(email_notification_ids=notification_ids)
+
+
+def _close_worker_connections(executor, max_workers):
+    """Close the database connection each of the executor's worker threads opened, once it is done sending.
+    Connections can only be closed by their own thread, so one task is run on every worker, each waiting for
+    the others so that no worker runs two of them.
+    """
+    barrier = threading.Barrier(max_workers)
+
+    def close_connection():
+        connection.close()
+        barrier.wait(timeout=60)
+
+    for future in [executor.submit(close_connection) for _ in range(max_workers)]:
+        try:
+            future.result()
+        except threading.BrokenBarrierError:
+            log_exception()
 
 
 def _send_reviews_moderator_emails(send_type):
@@ -121,11 +186,15 @@ def get_moderators_emails(send_type):
         return itertools.chain.from_iterable(cursor.fetchall())
 
 
-def get_users_emails(send_type):
+def get_users_emails(send_type, max_id=None):
     """Get all emails that need to be sent.
     NOTE: These do not include reviews triggered emails for moderators.
 
+    Digests are read through a server-side cursor and grouped one user at a time, so the whole table
+    is never held in memory.
+
     :param send_type: from NOTIFICATION_TYPES
+    :param max_id: if given, ignore digests with a greater primary key
     :return: Iterable of dicts of the form:
         {
             'user_id': 'se8ea',
@@ -143,29 +212,24 @@ def get_users_emails(send_type):
             }
         }
     """
-
-    sql = """
-    SELECT json_build_object(
-            'user_id', osf_guid._id,
-            'info', json_agg(
-                json_build_object(
-                    'message', nd.message,
-                    'node_lineage', nd.node_lineage,
-                    '_id', nd._id
-                )
-            )
-        )
-    FROM osf_notificationdigest AS nd
-      LEFT JOIN osf_guid ON nd.user_id = osf_guid.object_id
-    WHERE send_type = %s AND event != 'new_pending_submissions'
-    AND osf_guid.content_type_id = (SELECT id FROM django_content_type WHERE model = 'osfuser')
-    GROUP BY osf_guid.id
-    ORDER BY osf_guid.id ASC
-    """
-
-    with connection.cursor() as cursor:
-        cursor.execute(sql, [send_type, ])
-        return itertools.chain.from_iterable(cursor.fetchall())
+    digests = NotificationDigest.objects.filter(
+        send_type=send_type,
+        user__isnull=False,
+    ).exclude(event='new_pending_submissions')
+    if max_id is not None:
+        digests = digests.filter(id__lte=max_id)
+    rows = digests.order_by('user_id', 'id').values_list(
+        'user__guids___id', '_id', 'message', 'node_lineage'
+    ).iterator()
+
+    for user_id, user_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        yield {
+            'user_id': user_id,
+            'info': [
+                {'message': message, 'node_lineage': node_lineage, '_id': _id}
+                for _, _id, message, node_lineage in user_rows
+            ],
+        }
 
 
 def group_by_node(notifications, limit=15):
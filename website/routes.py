@@ -649,6 +649,16 @@ def make_url_map(app):
             json_renderer,
         ),
 
+        Rule(
+            [
+                '/project/<pid>/citation/rendered/',
+                '/project/<pid>/node/<nid>/citation/rendered/',
+            ],
+            'get',
+            citation_views.node_rendered_citations,
+            json_renderer,
+        ),
+
     ], prefix='/api/v1')
 
     ### Forms ###
@@ -3,8 +3,11 @@
 
 from __future__ import division
 
+import collections
 import copy
 import functools
+import hashlib
+import json
 import logging
 import math
 import re
@@ -12,23 +15,30 @@ import unicodedata
 from framework import sentry
 
 import six
+import waffle
 
 from django.apps import apps
 from django.core.paginator import Paginator
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from elasticsearch import exceptions as es_exceptions
 from elasticsearch2 import (ConnectionError, Elasticsearch, NotFoundError,
                            RequestError, TransportError, helpers)
+from api.caching.utils import search_update_cache, set_many_after_commit, SEARCH_FILE_TARGET_KEY
 from framework.celery_tasks import app as celery_app
-from framework.database import paginated
 from osf.models import AbstractNode
 from osf.models import OSFUser
 from osf.models import BaseFileNode
+from osf.models import Guid
 from osf.models import Institution
 from osf.models import OSFGroup
 from osf.models import QuickFilesNode
 from osf.models import Preprint
 from osf.models import SpamStatus
+from osf.models import QueuedSearchUpdate
+from osf import features
+from osf.metrics import SearchUpdateQueueMetrics
 from addons.wiki.models import WikiPage
 from osf.models import CollectionSubmission
 from osf.utils.sanitize import unescape_entities
@@ -390,6 +400,86 @@ def update_user_async(self, user_id, index=None):
     except Exception as exc:
         self.retry(exc)
 
+def queue_update(doc_type, object_id, index=None):
+    """Queues a document to be re-indexed by `flush_search_updates` once saves to it have settled.
+
+    :param str doc_type: One of SEARCH_UPDATE_TYPES
+    :param int object_id: Primary key of the object the document is built from
+    """
+    if QueuedSearchUpdate.queue(doc_type, object_id, index=index):
+        schedule_search_flush()
+
+def schedule_search_flush():
+    """Schedules a flush of queued search updates once the debounce window has passed."""
+    # Later saves to queued documents are picked up by this flush, or by the periodic one if they keep coming
+    flush_search_updates.apply_async(countdown=settings.SEARCH_UPDATE_DEBOUNCE)
+
+@celery_app.task(max_retries=5, default_retry_delay=60)
+def flush_search_updates(batch_size=None):
+    """Index the queued search updates that are ready, batch by batch, until none are left"""
+    batch_size = batch_size or settings.SEARCH_UPDATE_FLUSH_BATCH_SIZE
+    while _flush_search_update_batch(batch_size):
+        pass
+
+def _flush_search_update_batch(batch_size):
+    updates = QueuedSearchUpdate.claim_ready(
+        batch_size, settings.SEARCH_UPDATE_DEBOUNCE, settings.SEARCH_UPDATE_MAX_DELAY, settings.SEARCH_UPDATE_CLAIM_TIMEOUT,
+    )
+    if not updates:
+        return 0
+
+    object_ids = collections.defaultdict(list)
+    for update in updates:
+        object_ids[(update.doc_type, update.index_name or None)].append(update.object_id)
+    try:
+        for (doc_type, index), ids in object_ids.items():
+            SEARCH_UPDATE_TYPES[doc_type](ids, index=index)
+    except Exception:
+        # Release the batch so that a later flush retries it
+        QueuedSearchUpdate.release(updates)
+        raise
+    QueuedSearchUpdate.complete(updates)
+
+    now = timezone.now()
+    lags = [int((now - update.first_queued).total_seconds() * 1000) for update in updates]
+    queue_depth = QueuedSearchUpdate.objects.count()
+    logger.info('Indexed {} queued search updates (max lag {}ms), {} still queued'.format(len(updates), max(lags), queue_depth))
+    if waffle.switch_is_active(features.ELASTICSEARCH_METRICS):
+        try:
+            SearchUpdateQueueMetrics.record(
+                flushed_count=len(updates),
+                queue_depth=queue_depth,
+                max_lag=max(lags),
+                mean_lag=sum(lags) // len(lags),
+            )
+        except es_exceptions.ConnectionError:
+            sentry.log_exception()
+    return len(updates)
+
+def _bulk_update_queued_nodes(node_ids, index=None):
+    nodes = AbstractNode.objects.filter(id__in=node_ids)
+    bulk_update_nodes(functools.partial(update_node, index=index, bulk=True), nodes, index=index)
+
+def _bulk_update_queued_preprints(preprint_ids, index=None):
+    preprints = Preprint.objects.filter(id__in=preprint_ids)
+    bulk_update_nodes(functools.partial(update_preprint, index=index, bulk=True), preprints, index=index, category='preprint')
+
+def _bulk_update_queued_users(user_ids, index=None):
+    users = OSFUser.objects.filter(id__in=user_ids)
+    bulk_update_nodes(functools.partial(update_user, index=index, bulk=True), users, index=index, category='user')
+
+def _bulk_update_queued_contributors(user_ids, index=None):
+    for user_id in user_ids:
+        update_contributors_async(user_id)
+
+# How each type of queued search update is indexed, given the objects' primary keys
+SEARCH_UPDATE_TYPES = {
+    'node': _bulk_update_queued_nodes,
+    'preprint': _bulk_update_queued_preprints,
+    'user': _bulk_update_queued_users,
+    'contributors': _bulk_update_queued_contributors,
+}
+
 def serialize_node(node, category):
     elastic_document = {}
     parent_id = node.parent_id
@@ -517,10 +607,8 @@ def serialize_group(group, category):
 
 @requires_search
 def update_node(node, index=None, bulk=False, async_update=False):
-    from addons.osfstorage.models import OsfStorageFile
     index = index or INDEX
-    for file_ in paginated(OsfStorageFile, Q(target_content_type=ContentType.objects.get_for_model(type(node)), target_object_id=node.id)):
-        update_file(file_, index=index)
+    bulk_update_files(node, index=index)
 
     is_qa_node = bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(node.tags.all().values_list('name', flat=True))) or any(substring in node.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
     if node.is_deleted or not node.is_public or node.archiving or node.is_spam or (node.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or node.is_quickfiles or is_qa_node:
@@ -535,10 +623,8 @@ def update_node(node, index=None, bulk=False, async_update=False):
 
 @requires_search
 def update_preprint(preprint, index=None, bulk=False, async_update=False):
-    from addons.osfstorage.models import OsfStorageFile
     index = index or INDEX
-    for file_ in paginated(OsfStorageFile, Q(target_content_type=ContentType.objects.get_for_model(type(preprint)), target_object_id=preprint.id)):
-        update_file(file_, index=index)
+    bulk_update_files(preprint, index=index)
 
     is_qa_preprint = bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(preprint.tags.all().values_list('name', flat=True))) or any(substring in preprint.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
     if not preprint.verified_publishable or preprint.is_spam or (preprint.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or is_qa_preprint:
@@ -663,7 +749,7 @@ def update_contributors_async(self, user_id):
         bulk_update_contributors(p.page(page_num).object_list)
 
 @requires_search
-def update_user(user, index=None):
+def update_user(user, index=None, bulk=False):
 
     index = index or INDEX
     if not user.is_active:
@@ -718,74 +804,88 @@ def update_user(user, index=None):
         'boost': 2,  # TODO(fabianvf): Probably should make this a constant or something
     }
 
+    if bulk:
+        return user_doc
     client().index(index=index, doc_type='user', body=user_doc, id=user._id, refresh=True)
 
-@requires_search
-def update_file(file_, index=None, delete=False):
-    index = index or INDEX
-    target = file_.target
-
-    # TODO: Can remove 'not file_.name' if we remove all base file nodes with name=None
-    file_node_is_qa = bool(
-        set(settings.DO_NOT_INDEX_LIST['tags']).intersection(file_.tags.all().values_list('name', flat=True))
-    ) or bool(
+def serialize_file_target(target):
+    """Return the fields of a file's search document that come from the node or preprint it belongs to,
+    or None if no file on `target` should be in the index.
+    """
+    target_is_qa = bool(
         set(settings.DO_NOT_INDEX_LIST['tags']).intersection(target.tags.all().values_list('name', flat=True))
     ) or any(substring in target.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
-    if not file_.name or not target.is_public or delete or file_node_is_qa or getattr(target, 'is_deleted', False) or getattr(target, 'archiving', False) or target.is_spam or (
+    if not target.is_public or target_is_qa or getattr(target, 'is_deleted', False) or getattr(target, 'archiving', False) or target.is_spam or (
             target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-        client().delete(
-            index=index,
-            doc_type='file',
-            id=file_._id,
-            refresh=True,
-            ignore=[404]
-        )
-        return
-
-    if isinstance(target, Preprint):
-        if not getattr(target, 'verified_publishable', False) or target.primary_file != file_ or target.is_spam or (
-                target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-            client().delete(
-                index=index,
-                doc_type='file',
-                id=file_._id,
-                refresh=True,
-                ignore=[404]
-            )
-            return
+        return None
+    if isinstance(target, Preprint) and not getattr(target, 'verified_publishable', False):
+        return None
 
     # We build URLs manually here so that this function can be
     # run outside of a Flask request context (e.g. in a celery task)
-    file_deep_url = '/{target_id}/files/{provider}{path}/'.format(
-        target_id=target._id,
-        provider=file_.provider,
-        path=file_.path,
-    )
     if getattr(target, 'is_quickfiles', None):
         node_url = '/{user_id}/quickfiles/'.format(user_id=target.creator._id)
     else:
         node_url = '/{target_id}/'.format(target_id=target._id)
+    return {
+        'node_url': node_url,
+        'node_title': getattr(target, 'title', None),
+        'parent_id': target.parent_node._id if getattr(target, 'parent_node', None) else None,
+        'is_registration': getattr(target, 'is_registration', False),
+        'is_retracted': getattr(target, 'is_retracted', False),
+    }
+
+def serialize_file(file_, target, target_fields, file_guid_id, tags):
+    """Return the search document for a file, or None if it should not be in the index.
+
+    :param target_fields: `serialize_file_target(target)`
+    :param file_guid_id: The file's guid, if it has one
+    :param tags: All of the file's tags
+    """
+    # TODO: Can remove 'not file_.name' if we remove all base file nodes with name=None
+    if target_fields is None or not file_.name or set(settings.DO_NOT_INDEX_LIST['tags']).intersection(tag.name for tag in tags):
+        return None
+    if isinstance(target, Preprint) and target.primary_file_id != file_.id:
+        return None
 
-    guid_url = None
-    file_guid = file_.get_guid(create=False)
-    if file_guid:
-        guid_url = '/{file_guid}/'.format(file_guid=file_guid._id)
+    file_deep_url = '/{target_id}/files/{provider}{path}/'.format(
+        target_id=target._id,
+        provider=file_.provider,
+        path=file_.path,
+    )
+    guid_url = '/{file_guid}/'.format(file_guid=file_guid_id) if file_guid_id else None
     # File URL's not provided for preprint files, because the File Detail Page will
     # just reroute to preprints detail
     file_doc = {
         'id': file_._id,
         'deep_url': None if isinstance(target, Preprint) else file_deep_url,
         'guid_url': None if isinstance(target, Preprint) else guid_url,
-        'tags': list(file_.tags.filter(system=False).values_list('name', flat=True)),
+        'tags': [tag.name for tag in tags if not tag.system],
         'name': file_.name,
         'category': 'file',
-        'node_url': node_url,
-        'node_title': getattr(target, 'title', None),
-        'parent_id': target.parent_node._id if getattr(target, 'parent_node', None) else None,
-        'is_registration': getattr(target, 'is_registration', False),
-        'is_retracted': getattr(target, 'is_retracted', False),
         'extra_search_terms': clean_splitters(file_.name),
     }
+    file_doc.update(target_fields)
+    return file_doc
+
+@requires_search
+def update_file(file_, index=None, delete=False):
+    index = index or INDEX
+    target = file_.target
+    file_doc = None
+    if not delete:
+        file_guid = file_.get_guid(create=False)
+        file_doc = serialize_file(file_, target, serialize_file_target(target), file_guid._id if file_guid else None, list(file_.tags.all()))
+
+    if file_doc is None:
+        client().delete(
+            index=index,
+            doc_type='file',
+            id=file_._id,
+            refresh=True,
+            ignore=[404]
+        )
+        return
 
     client().index(
         index=index,
@@ -795,6 +895,58 @@ def update_file(file_, index=None, delete=False):
         refresh=True
     )
 
+@requires_search
+def bulk_update_files(target, index=None):
+    """Index, or remove from the index, every OsfStorageFile on a node or preprint.
+
+    Files are serialized `ELASTIC_BULK_CHUNK_SIZE` at a time, with their tags and guids fetched per chunk,
+    and sent through the bulk API without waiting for a refresh. Files change with their target's
+    privacy, title, etc.; if the same target fields were sent within `SEARCH_FILE_REINDEX_WINDOW` the
+    pass is skipped, as changes to the files themselves are indexed by `update_file`.
+    """
+    from addons.osfstorage.models import OsfStorageFile
+    index = index or INDEX
+    target_fields = serialize_file_target(target)
+    target_content_type = ContentType.objects.get_for_model(type(target))
+    cache_key = SEARCH_FILE_TARGET_KEY.format(index=index, content_type_id=target_content_type.id, target_id=target.id)
+    signature = hashlib.sha256(json.dumps(target_fields, sort_keys=True).encode()).hexdigest()
+    if search_update_cache.get(cache_key) == signature:
+        return
+
+    files = OsfStorageFile.objects.filter(
+        target_content_type=target_content_type,
+        target_object_id=target.id,
+    ).annotate(
+        guid_id=Subquery(
+            Guid.objects.filter(
+                content_type=ContentType.objects.get_for_model(OsfStorageFile),
+                object_id=OuterRef('pk'),
+            ).order_by('id').values('_id')[:1]
+        )
+    ).prefetch_related('tags').order_by('id')
+    paginator = Paginator(files, settings.ELASTIC_BULK_CHUNK_SIZE)
+    for page_num in paginator.page_range:
+        actions = []
+        for file_ in paginator.page(page_num).object_list:
+            file_doc = serialize_file(file_, target, target_fields, file_.guid_id, list(file_.tags.all()))
+            action = {
+                '_index': index,
+                '_type': 'file',
+                '_id': file_._id,
+            }
+            if file_doc is None:
+                action['_op_type'] = 'delete'
+            else:
+                action.update({'_op_type': 'index', '_source': file_doc})
+            actions.append(action)
+        _, errors = helpers.bulk(client(), actions, refresh=settings.ELASTIC_BULK_REFRESH, raise_on_error=False)
+        # Deleting a file that was never indexed is fine
+        errors = [error for error in errors if list(error.values())[0].get('status') != 404]
+        if errors:
+            raise exceptions.BulkUpdateError(errors)
+
+    set_many_after_commit(search_update_cache, {cache_key: signature}, settings.SEARCH_FILE_REINDEX_WINDOW)
+
 @requires_search
 def update_institution(institution, index=None):
     index = index or INDEX
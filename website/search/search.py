@@ -1,6 +1,8 @@
 import logging
 
 from framework.celery_tasks.handlers import enqueue_task
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from osf.utils.requests import DummyRequest, get_current_request
 
 from website import settings
 
@@ -19,6 +21,17 @@ def requires_search(func):
     return wrapped
 
 
+@requires_search
+def queue_update(doc_type, object_id, index=None):
+    """Queue a document to be re-indexed in bulk, with other updates to it in the next few seconds coalesced
+    into one. Within a request the update is queued in the request's transaction, so it commits with the save,
+    and the flush is only scheduled once that transaction is committed.
+    """
+    if isinstance(get_current_request(), DummyRequest):
+        search_engine.queue_update(doc_type, object_id, index=index)
+    elif search_engine.QueuedSearchUpdate.queue(doc_type, object_id, index=index):
+        enqueue_postcommit_task(search_engine.schedule_search_flush, (), {}, celery=False)
+
 @requires_search
 def search(query, index=None, doc_type=None, raw=None):
     index = index or settings.ELASTIC_INDEX
@@ -37,7 +50,7 @@ def update_node(node, index=None, bulk=False, async_update=True, saved_fields=No
         # database in order for method that updates the Node's elastic search document
         # to run correctly.
         if settings.USE_CELERY:
-            enqueue_task(search_engine.update_node_async.s(node_id=node_id, **kwargs))
+            queue_update('node', node.id, index=index)
         else:
             search_engine.update_node_async(node_id=node_id, **kwargs)
     else:
@@ -54,7 +67,7 @@ def update_preprint(preprint, index=None, bulk=False, async_update=True, saved_f
         preprint_id = preprint._id
         # We need the transaction to be committed before trying to run celery tasks.
         if settings.USE_CELERY:
-            enqueue_task(search_engine.update_preprint_async.s(preprint_id=preprint_id, **kwargs))
+            queue_update('preprint', preprint.id, index=index)
         else:
             search_engine.update_preprint_async(preprint_id=preprint_id, **kwargs)
     else:
@@ -95,7 +108,7 @@ def delete_node(node, index=None):
 def update_contributors_async(user_id):
     """Async version of update_contributors above"""
     if settings.USE_CELERY:
-        enqueue_task(search_engine.update_contributors_async.s(user_id))
+        queue_update('contributors', user_id)
     else:
         search_engine.update_contributors_async(user_id)
 
@@ -105,7 +118,7 @@ def update_user(user, index=None, async_update=True):
     if async_update:
         user_id = user.id
         if settings.USE_CELERY:
-            enqueue_task(search_engine.update_user_async.s(user_id, index=index))
+            queue_update('user', user_id, index=index)
         else:
             search_engine.update_user_async(user_id, index=index)
     else:
@@ -42,6 +42,12 @@ EXPIRATION_TIME_DICT = {
 }
 
 CITATION_STYLES_PATH = os.path.join(BASE_PATH, 'static', 'vendor', 'bower_components', 'styles')
+# Number of parsed citation styles each process keeps, and seconds they are kept for
+CITATION_STYLE_CACHE_SIZE = 200
+CITATION_STYLE_CACHE_TIMEOUT = 60 * 60 * 24
+# Seconds that a rendered citation is cached for. Citations are cached per version of the node and its visible
+# contributors, so this only bounds staleness from changes that don't touch either, like renaming a provider.
+CITATION_CACHE_TIMEOUT = 60 * 60
 
 # Minimum seconds between forgot password email attempts
 SEND_EMAIL_THROTTLE = 30
@@ -113,6 +119,21 @@ ELASTIC_KWARGS = {
     # 'client_cert': None,
     # 'client_key': None
 }
+# Number of documents sent per bulk request when indexing a node's files
+ELASTIC_BULK_CHUNK_SIZE = 500
+# Whether bulk requests wait for the index to refresh. Documents become searchable within the index's refresh
+# interval regardless, and forcing a refresh per request is expensive for the cluster.
+ELASTIC_BULK_REFRESH = False
+# Seconds during which re-indexing a node's files is skipped if the node's fields they include are unchanged
+SEARCH_FILE_REINDEX_WINDOW = 60
+# Queued search updates are indexed once their document hasn't been updated again for SEARCH_UPDATE_DEBOUNCE
+# seconds, or after SEARCH_UPDATE_MAX_DELAY seconds if it keeps being updated
+SEARCH_UPDATE_DEBOUNCE = 5
+SEARCH_UPDATE_MAX_DELAY = 60
+SEARCH_UPDATE_FLUSH_BATCH_SIZE = 500
+# Seconds after which updates claimed by a flush that never finished, e.g. because its worker was killed, are
+# claimed again
+SEARCH_UPDATE_CLAIM_TIMEOUT = 10 * 60
 
 # Sessions
 COOKIE_NAME = 'osf'
@@ -136,6 +157,11 @@ USE_CDN_FOR_CLIENT_LIBS = True
 USE_EMAIL = True
 FROM_EMAIL = 'openscienceframework-noreply@osf.io'
 
+# Number of users whose notification digests are sent, then deleted, per batch
+NOTIFICATION_DIGEST_CHUNK_SIZE = 500
+# Number of digest emails rendered and sent concurrently
+NOTIFICATION_DIGEST_SEND_CONCURRENCY = 8
+
 # support email
 OSF_SUPPORT_EMAIL = 'support@osf.io'
 # contact email
@@ -354,6 +380,10 @@ SHARE_URL = 'https://share.osf.io/'
 SHARE_API_TOKEN = None  # Required to send project updates to SHARE
 
 CAS_SERVER_URL = 'http://localhost:8080'
+# Seconds that a bearer token's CAS profile is cached for (capped by the token's own expiry)
+CAS_PROFILE_CACHE_TIMEOUT = 60
+# Seconds that a token CAS rejected is remembered as invalid
+CAS_PROFILE_NEGATIVE_CACHE_TIMEOUT = 10
 MFR_SERVER_URL = 'http://localhost:7778'
 
 ###### ARCHIVER ###########
@@ -365,6 +395,14 @@ ARCHIVE_TIMEOUT_TIMEDELTA = timedelta(1)  # 24 hours
 
 ENABLE_ARCHIVER = True
 
+# Number of folders listed from WaterButler at once when collecting an addon's file tree
+ARCHIVE_CRAWL_CONCURRENCY = 8
+# Number of listed folders between each checkpoint saved to the archive target
+ARCHIVE_CRAWL_CHECKPOINT_INTERVAL = 50
+# Times that collecting an addon's file tree is retried, resuming from the last checkpoint
+ARCHIVE_STAT_MAX_RETRIES = 3
+ARCHIVE_STAT_RETRY_DELAY = 60  # seconds
+
 JWT_SECRET = 'changeme'
 JWT_ALGORITHM = 'HS256'
 
@@ -412,6 +450,7 @@ class CeleryConfig:
         'osf.management.commands.addon_deleted_date',
         'osf.management.commands.migrate_registration_responses',
         'osf.management.commands.update_institution_project_counts',
+        'osf.management.commands.reconcile_effective_permissions',
         'osf.management.commands.email_all_users'
     }
 
@@ -498,6 +537,10 @@ class CeleryConfig:
         'osf.management.commands.deactivate_requested_accounts',
         'osf.management.commands.check_crossref_dois',
         'osf.management.commands.update_institution_project_counts',
+        'osf.management.commands.refill_guid_pool',
+        'osf.management.commands.reconcile_effective_permissions',
+        'api.caching.tasks',
+        'framework.analytics',
     )
 
     # Modules that need metrics and release requirements
@@ -644,6 +687,26 @@ class CeleryConfig:
                 'task': 'management.commands.update_institution_project_counts',
                 'schedule': crontab(minute=0, hour=9), # Daily 05:00 a.m. EDT
             },
+            'flush_page_counter_events': {
+                'task': 'framework.analytics.flush_page_counter_events',
+                'schedule': crontab(minute='*'),  # Every minute
+            },
+            'flush_search_updates': {
+                'task': 'website.search.elastic_search.flush_search_updates',
+                'schedule': crontab(minute='*'),  # Every minute
+            },
+            'refill_guid_pool': {
+                'task': 'management.commands.refill_guid_pool',
+                'schedule': crontab(minute='*/5'),  # Every 5 minutes
+            },
+            'reconcile_effective_permissions': {
+                'task': 'management.commands.reconcile_effective_permissions',
+                'schedule': crontab(minute=0, hour=8),  # Daily 3:00 a.m.
+            },
+            'reconcile_storage_usage': {
+                'task': 'api.caching.tasks.reconcile_storage_usage',
+                'schedule': crontab(minute=30),  # Hourly
+            },
         }
 
         # Tasks that need metrics and release requirements
@@ -667,6 +730,9 @@ WATERBUTLER_JWE_SECRET = 'CirclesAre4Squares'
 WATERBUTLER_JWT_SECRET = 'ILiekTrianglesALot'
 WATERBUTLER_JWT_ALGORITHM = 'HS256'
 WATERBUTLER_JWT_EXPIRATION = 15
+# Seconds that a node's serialized WaterButler credentials and settings are cached per provider.
+# Keep this well under the refresh window of the OAuth addons, so a cached token is never stale.
+WATERBUTLER_CONFIG_CACHE_TIMEOUT = 30
 
 SENSITIVE_DATA_SALT = 'yusaltydough'
 SENSITIVE_DATA_SECRET = 'TrainglesAre5Squares'
@@ -677,11 +743,23 @@ assert (DRAFT_REGISTRATION_APPROVAL_PERIOD > EMBARGO_END_DATE_MIN), 'The draft r
 # TODO: Remove references to this flag
 ENABLE_INSTITUTIONS = True
 
+# Number of buffered page counter increments merged into the counters per transaction
+PAGE_COUNTER_FLUSH_BATCH_SIZE = 5000
+# Seconds that buffered page counter increments wait for more to be merged with
+PAGE_COUNTER_FLUSH_DELAY = 10
+
 ENABLE_STORAGE_USAGE_CACHE = True
+# Number of node storage usages recomputed from scratch by each run of the reconciliation task
+STORAGE_USAGE_RECONCILE_BATCH_SIZE = 1000
 
 ENABLE_VARNISH = False
 ENABLE_ESI = False
 VARNISH_SERVERS = []  # This should be set in local.py or cache invalidation won't work
+VARNISH_BAN_TIMEOUT = 0.3  # seconds
+# Bans queued during a request are merged into regexes of at most this many characters
+VARNISH_BAN_MAX_EXPRESSION_LENGTH = 2000
+# Number of BAN requests sent at once
+VARNISH_BAN_CONCURRENCY = 8
 ESI_MEDIA_TYPES = {'application/vnd.api+json', 'application/json'}
 
 # Used for gathering meta information about the current build
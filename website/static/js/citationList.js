@@ -4,25 +4,12 @@ var $ = require('jquery');
 var ko = require('knockout');
 require('knockout.validation');
 var $osf = require('./osfHelpers');
-var citations = require('./citations');
 var bootbox = require('bootbox');
 var oop = require('js/oop');
 var makeClient = require('js/clipboard');
 
-var BASE_URL = '/static/vendor/bower_components/styles/';
-var STYLES = {
-    apa: 'apa.csl',
-    mla: 'modern-language-association.csl',
-    chicago: 'chicago-author-date.csl'
-};
-
 var ctx = window.contextVars;
 
-var formatCitation = function(style, data, format) {
-    var citeproc = citations.makeCiteproc(style, data, format);
-    return citeproc.makeBibliography()[1];
-};
-
 var ViewModel = oop.defclass({
      constructor: function() {
         var self = this;
@@ -122,17 +109,10 @@ var ViewModel = oop.defclass({
         ).done(function(data) {
             self.customCitation($osf.htmlDecode(data.data.attributes.custom_citation));
             if(!self.customCitation()) {
-                var citationRequest = $.ajax(ctx.node.urls.api + 'citation/');
-                var styleRequests = [
-                    $.ajax(BASE_URL + STYLES.apa),
-                    $.ajax(BASE_URL + STYLES.mla),
-                    $.ajax(BASE_URL + STYLES.chicago)
-                ];
-                var requests = [citationRequest].concat(styleRequests);
-                $.when.apply(self, requests).done(function(data, apa, mla, chicago) {
-                    self.apa(formatCitation(apa[0], data[0], 'text'));
-                    self.mla(formatCitation(mla[0], data[0], 'text'));
-                    self.chicago(formatCitation(chicago[0], data[0], 'text'));
+                $.ajax(ctx.node.urls.api + 'citation/rendered/').done(function(data) {
+                    self.apa(data['apa']);
+                    self.mla(data['modern-language-association']);
+                    self.chicago(data['chicago-author-date']);
                 });
             }
         }).fail(function() {